@@ -0,0 +1,87 @@
+"""
+Microbenchmark of the co-optation choice of a house per applicant pool size,
+the matrix-based choice against the former loop over applicants x housemates
+
+usage (from the repository root):
+    python -m benchmarks.bench_cooptation --pools 2 5 10 25 50 100 --housemates 4
+"""
+import argparse
+import random
+import timeit
+
+import src.utils.constants as const
+from src.agents.house_agent import HouseAgent
+from src.utils.payloads import Application, Questionnaire
+
+
+def random_questionnaire():
+    return Questionnaire(personality_vector=tuple(random.random() for _ in range(5)), international=False,
+                         is_female=False)
+
+
+def loop_choice(house, applicants):
+    """
+    former co-optation choice, average calculate_dist of every applicant with every housemate
+    :return: chosen applicant
+    """
+    chosen_applicant = applicants[0]
+    highest_match_score = 0
+    for applicant in applicants:
+        match_score_sum = 0
+        housemates = 0
+        for housemate_room in house.rooms.values():
+            if housemate_room['resident_jid'] is None:
+                continue
+            match_score = const.calculate_dist(housemate_room['questionnaire']['personality_vector'],
+                                               applicant['application']['questionnaire']['personality_vector'])
+            match_score_sum += match_score
+            housemates += 1
+        average_match_score = match_score_sum / housemates
+        if average_match_score > highest_match_score:
+            highest_match_score = average_match_score
+            chosen_applicant = applicant
+    return chosen_applicant
+
+
+def setup_house(num_housemates, num_rooms=7):
+    """
+    function to create a co-optation house with the given number of residents
+    :return: house agent
+    """
+    house = HouseAgent("house@localhost", "mas2021", num_rooms, const.COOP)
+    for room_id in list(house.rooms)[:num_housemates]:
+        room = house.rooms[room_id]
+        room['resident_jid'] = "student" + str(room_id) + "@localhost"
+        room['questionnaire'] = random_questionnaire()
+        house.move_in(room_id, room['questionnaire'])
+    house.update_house_score()
+    return house
+
+
+def setup_applicants(pool_size):
+    return [{'student_jid': "applicant" + str(i) + "@localhost",
+             'application': Application(id=0, housing_method=const.COOP, questionnaire=random_questionnaire(),
+                                        waiting_time=0)}
+            for i in range(pool_size)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pools', type=int, nargs='+', default=[2, 5, 10, 25, 50, 100])
+    parser.add_argument('--housemates', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    house = setup_house(args.housemates)
+    for pool_size in args.pools:
+        applicants = setup_applicants(pool_size)
+        # both choices have to pick the same applicant
+        assert house.choose_cooptation_applicant(applicants) is loop_choice(house, applicants)
+
+        number, loop_seconds = timeit.Timer(lambda: loop_choice(house, applicants)).autorange()
+        loop_us = loop_seconds / number * 1e6
+        number, matrix_seconds = timeit.Timer(lambda: house.choose_cooptation_applicant(applicants)).autorange()
+        matrix_us = matrix_seconds / number * 1e6
+        print("{:4d} applicants, {} housemates: loop {:8.1f}us, matrix {:8.1f}us ({:4.1f}x)".format(
+            pool_size, args.housemates, loop_us, matrix_us, loop_us / matrix_us))
@@ -0,0 +1,66 @@
+"""
+Benchmark of the cold-start import time of src/main.py, checked against a budget
+
+usage (from the repository root):
+    python -m benchmarks.bench_import --repeat 10
+exits with status 1 if the median import time exceeds the budget
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+# median wall time of "import src.main" on top of a bare interpreter start, in seconds
+IMPORT_BUDGET = 0.25
+
+
+def measure(statement, repeat):
+    """
+    function to measure the wall time of running a statement in fresh interpreters
+    :param statement: python statement to run
+    :param repeat: number of interpreter starts
+    :return: list of wall times in seconds
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", statement], check=True)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def slowest_imports(statement, count):
+    """
+    function to list the modules with the highest cumulative import time (python -X importtime)
+    :return: list of (microseconds, module) tuples
+    """
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                            check=True, capture_output=True, text=True).stderr
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line.split("|")
+        imports.append((int(cumulative), module.rstrip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--budget', type=float, default=IMPORT_BUDGET)
+    args = parser.parse_args()
+
+    bare = statistics.median(measure("pass", args.repeat))
+    main = statistics.median(measure("import src.main", args.repeat))
+    import_time = main - bare
+
+    print("interpreter start: {:.3f}s".format(bare))
+    print("import src.main:   {:.3f}s (budget {:.3f}s)".format(import_time, args.budget))
+    for cumulative, module in slowest_imports("import src.main", 8):
+        print("  {:8.1f}ms {}".format(cumulative / 1000, module))
+
+    if import_time > args.budget:
+        print("import time budget exceeded")
+        sys.exit(1)
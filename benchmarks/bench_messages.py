@@ -0,0 +1,75 @@
+"""
+Benchmark of the message throughput of a simulation run per message transport
+
+usage (from the repository root):
+    python -m benchmarks.bench_messages --students 600 --houses 80 --ticks 20
+"""
+import argparse
+import contextlib
+import io
+import json
+import subprocess
+import sys
+import time
+
+
+def run(transport, num_students, num_houses, ticks, seed):
+    """
+    function to run one simulation with the given transport and count the sent messages
+    :return: dict with number of messages, duration and messages per second
+    """
+    import src.utils.constants as const
+    const.MESSAGE_TRANSPORT = transport
+
+    from src.agents.agent import MASAgent
+    from src.agents.listing_agent import ListingAgent
+    from src.main import setup_simulation
+    from src.utils.config import SimulationConfig
+
+    sent = [0]
+    send = MASAgent.send
+
+    def counting_send(agent, message):
+        sent[0] += 1
+        send(agent, message)
+
+    MASAgent.send = counting_send
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        sim = setup_simulation(SimulationConfig(num_houses=num_houses, num_students=num_students, duration=ticks), seed)
+        sim.add_agent(ListingAgent("listing_agent@localhost"))
+        start = time.perf_counter()
+        sim.simulate()
+        duration = time.perf_counter() - start
+
+    return {'transport': transport, 'messages': sent[0], 'seconds': duration,
+            'messages_per_second': sent[0] / duration}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=600)
+    parser.add_argument('--houses', type=int, default=80)
+    parser.add_argument('--ticks', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--transport', help="run a single transport in this process and print the result as JSON")
+    args = parser.parse_args()
+
+    if args.transport is not None:
+        print(json.dumps(run(args.transport, args.students, args.houses, args.ticks, args.seed)))
+        sys.exit(0)
+
+    # every transport runs in a fresh interpreter, so no agent state leaks between runs
+    results = []
+    for transport in ("xmpp", "internal"):
+        out = subprocess.run([sys.executable, "-m", "benchmarks.bench_messages", "--transport", transport,
+                              "--students", str(args.students), "--houses", str(args.houses),
+                              "--ticks", str(args.ticks), "--seed", str(args.seed)],
+                             check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+
+    for result in results:
+        print("{transport:>9}: {messages:>8} messages in {seconds:7.2f}s -> {messages_per_second:10.0f} msg/s"
+              .format(**result))
+    print("speedup internal vs. xmpp: {:.1f}x".format(
+        results[1]['messages_per_second'] / results[0]['messages_per_second']))
@@ -0,0 +1,164 @@
+"""
+Microbenchmarks of the hot functions of a tick: the compatibility formulas, the dispatch of a message by
+MASAgent.send and the answer of the listing agent to a listing request, in microseconds per call (best of 5)
+the results are written as JSON (with the commit), so the results of two commits can be diffed with --compare
+
+usage (from the repository root):
+    python -m benchmarks.bench_micro --listings 1000 --housemates 5
+    python -m benchmarks.bench_micro --compare bench_micro-<commit>.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import random
+import timeit
+
+import src.utils.constants as const
+from benchmarks.bench_cooptation import random_questionnaire, setup_house
+from benchmarks.results import environment, write_results
+from src.agents.agent import MASAgent, MASReceivingBehaviour, MASSimulation
+from src.agents.listing_agent import ListingAgent
+from src.utils.config import SimulationConfig
+from src.utils.messages import create_message, create_template
+from src.utils.payloads import Listing
+
+
+class Sink(MASReceivingBehaviour):
+    """
+    receiving behaviour that drops every message
+    """
+    def run(self, msg):
+        pass
+
+
+def per_call(function, repeat=5):
+    """
+    function to time a function
+    :return: best time per call in microseconds
+    """
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number * 1e6
+
+
+def setup_agents(delivery, *identifiers):
+    """
+    function to create a simulation with agents that drop every inform-message
+    :return: simulation and the agents
+    """
+    sim = MASSimulation(SimulationConfig(delivery=delivery), 0)
+    agents = []
+    for identifier in identifiers:
+        agent = MASAgent(identifier)
+        agent.add_behaviour(Sink(), create_template("inform", {"inform-type": "listing"}))
+        sim.add_agent(agent)
+        agents.append(agent)
+    return sim, agents
+
+
+def bench_send():
+    """
+    function to time the dispatch of a message to a receiving behaviour, synchronous and queued
+    :return: dict of name -> microseconds per message
+    """
+    sim, (sender, receiver) = setup_agents(const.SYNCHRONOUS, "sender@localhost", "receiver@localhost")
+    msg = create_message("receiver@localhost", "inform", "", {'inform-type': 'listing'})
+    results = {'MASAgent.send (synchronous)': per_call(lambda: sender.send(msg))}
+
+    sim, (sender, receiver) = setup_agents(const.QUEUED, "sender@localhost", "receiver@localhost")
+    batch = 1000
+
+    def send_round():
+        for _ in range(batch):
+            sender.send(msg)
+        sim.deliver_messages()
+
+    results['MASAgent.send + delivery round (queued)'] = per_call(send_round) / batch
+    return results
+
+
+def bench_listing_request(num_listings):
+    """
+    function to time the answer of the listing agent to a listing request, with the cached snapshot of the
+    listings and with a snapshot that is rebuilt because the listings changed
+    :param num_listings: number of open listings
+    :return: dict of name -> microseconds per request
+    """
+    sim, (student,) = setup_agents(const.SYNCHRONOUS, "student@localhost")
+    listing_agent = ListingAgent("listing_agent@localhost")
+    sim.add_agent(listing_agent)
+    with contextlib.redirect_stdout(io.StringIO()):
+        listing_agent.setup()
+    for i in range(num_listings):
+        listing = Listing(id=i, housing_method=const.RAND, accept_internationals=True,
+                          attractiveness=random.random(), house_score=None, house_jid="house@localhost")
+        listing_agent.listings[i] = listing
+        listing_agent.index.add(listing)
+        listing_agent.version += 1
+    behaviour = next(behaviour for behaviour in listing_agent.behaviours
+                     if isinstance(behaviour, ListingAgent.ReceiveListingRequest))
+    request = create_message("listing_agent@localhost", "request", "", {'request-type': 'listings'})
+    request.sender = "student@localhost"
+
+    def changed_request():
+        listing_agent.version += 1
+        behaviour.run(request)
+
+    name = "ListingAgent.ReceiveListingRequest ({} listings, ".format(num_listings)
+    return {name + "cached snapshot)": per_call(lambda: behaviour.run(request)),
+            name + "new snapshot)": per_call(changed_request)}
+
+
+def bench_formulas(num_housemates):
+    """
+    function to time the compatibility formulas
+    :param num_housemates: residents of the house (of 7 rooms)
+    :return: dict of name -> microseconds per call
+    """
+    vector1 = random_questionnaire()['personality_vector']
+    vector2 = random_questionnaire()['personality_vector']
+    house = setup_house(num_housemates)
+
+    def recalculated_matching_score():
+        house.matching_score_dirty = True
+        return house.matching_score()
+
+    suffix = " ({} housemates)".format(num_housemates)
+    return {'const.calculate_dist': per_call(lambda: const.calculate_dist(vector1, vector2)),
+            'const.calc_avg_personality' + suffix: per_call(lambda: const.calc_avg_personality(house)),
+            'const.calculate_house_matching_score' + suffix:
+                per_call(lambda: const.calculate_house_matching_score(house)),
+            'HouseAgent.matching_score (recalculated)' + suffix: per_call(recalculated_matching_score)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--listings', type=int, default=1000)
+    parser.add_argument('--housemates', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default=None, help="results file (default bench_micro-<commit>.json)")
+    parser.add_argument('--compare', default=None, help="results file of another commit")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    results = {}
+    results.update(bench_formulas(args.housemates))
+    results.update(bench_send())
+    results.update(bench_listing_request(args.listings))
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {result['name']: result['us_per_call'] for result in json.load(f)['results']}
+    for name, us in results.items():
+        line = "{:70} {:10.2f}us".format(name, us)
+        if name in baseline:
+            line += "  (was {:10.2f}us, {:+.0%})".format(baseline[name], us / baseline[name] - 1)
+        print(line)
+
+    env = environment()
+    output = args.output or "bench_micro-" + (env['commit'] or "unknown")[:10] + ".json"
+    write_results(output, env, {'listings': args.listings, 'housemates': args.housemates, 'seed': args.seed},
+                  [{'name': name, 'us_per_call': us} for name, us in results.items()])
+    print("Results written to", output)
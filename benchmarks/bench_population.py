@@ -0,0 +1,94 @@
+"""
+Benchmark of the peak memory (RSS) of set-up student agents, with and without the population store,
+and of the time per tick and the peak memory of a run (with houses) with and without the store
+
+usage (from the repository root):
+    python -m benchmarks.bench_population --students 100000 --houses 15000 --ticks 20
+"""
+import argparse
+import contextlib
+import io
+import json
+import resource
+import subprocess
+import sys
+import time
+
+
+def run(num_students, store):
+    """
+    function to create and set up the student agents of a simulation
+    :return: dict with the peak RSS before and after and the setup duration
+    """
+    from src.agents.agent import MASSimulation
+    from src.agents.student_agent import StudentAgent
+    from src.utils.population import Population
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    sim = MASSimulation()
+    population = Population(num_students) if store else None
+    for i in range(num_students):
+        sim.add_agent(StudentAgent("student" + str(i) + "@localhost", "mas2021", 0, False, False, sim, population))
+    with contextlib.redirect_stdout(io.StringIO()):
+        for agent in sim.all_agents.values():
+            agent.setup()
+    duration = time.perf_counter() - start
+
+    # ru_maxrss is reported in kilobytes on Linux
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {'store': store, 'students': num_students, 'seconds': duration,
+            'peak_rss_mb': rss_after / 1024, 'agents_rss_mb': (rss_after - rss_before) / 1024}
+
+
+def run_ticks(num_students, num_houses, ticks, store):
+    """
+    function to time the ticks of a run
+    :return: dict with the seconds per tick and the peak RSS of the run
+    """
+    import src.main as main
+    from src.utils.config import SimulationConfig
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        sim = main.setup_simulation(SimulationConfig(num_students=num_students, num_houses=num_houses, duration=ticks,
+                                                     population_store=store), 1)
+        sim.add_agent(main.ListingAgent("listing_agent@localhost"))
+        for agent in sim.all_agents.values():
+            agent.setup()
+        sim.set_up = True
+        start = time.perf_counter()
+        sim.simulate()
+    return {'seconds_per_tick': (time.perf_counter() - start) / ticks,
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=100000)
+    parser.add_argument('--houses', type=int, default=15000)
+    parser.add_argument('--ticks', type=int, default=20, help="ticks of the timed run, 0 to skip it")
+    parser.add_argument('--store', choices=('yes', 'no'), help="run a single configuration and print it as JSON")
+    parser.add_argument('--timed', action='store_true', help="time the ticks of the single configuration")
+    args = parser.parse_args()
+
+    if args.store is not None:
+        if args.timed:
+            print(json.dumps(run_ticks(args.students, args.houses, args.ticks, args.store == 'yes')))
+        else:
+            print(json.dumps(run(args.students, args.store == 'yes')))
+        sys.exit(0)
+
+    for store in ('no', 'yes'):
+        out = subprocess.run([sys.executable, "-m", "benchmarks.bench_population", "--store", store,
+                              "--students", str(args.students)], check=True, capture_output=True, text=True).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        line = "population store {:>3}: peak RSS {:7.1f} MB ({:7.1f} MB for the agents), setup {:5.2f}s".format(
+            store, result['peak_rss_mb'], result['agents_rss_mb'], result['seconds'])
+        if args.ticks:
+            out = subprocess.run([sys.executable, "-m", "benchmarks.bench_population", "--store", store, "--timed",
+                                  "--students", str(args.students), "--houses", str(args.houses),
+                                  "--ticks", str(args.ticks)], check=True, capture_output=True, text=True).stdout
+            result = json.loads(out.strip().splitlines()[-1])
+            line += ", {:6.3f}s per tick (peak RSS {:7.1f} MB)".format(result['seconds_per_tick'],
+                                                                      result['peak_rss_mb'])
+        print(line)
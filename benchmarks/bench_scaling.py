@@ -0,0 +1,198 @@
+"""
+Scaling benchmark of the simulation engine, from the README setup (3000 students, 400 and 600 houses)
+up to 100k students and 15k houses, for every distribution method:
+ticks per second, messages per second, the time per phase of a tick and the peak memory of every run
+
+every run is done in a fresh interpreter, so the peak memory of a run does not include the runs before it;
+the results are written as JSON (with the commit), so the results of two commits can be diffed with --compare
+
+usage (from the repository root):
+    python -m benchmarks.bench_scaling --points 3000:400 3000:600 100000:15000 --ticks 20
+    python -m benchmarks.bench_scaling --points 3000:400 --compare bench_scaling-<commit>.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from benchmarks.results import environment, write_results
+
+POINTS = ["3000:400", "3000:600", "10000:1500", "30000:4500", "100000:15000"]
+# [COOP, WAIT_LIST, RAND]
+DISTRIBUTIONS = {'cooptation': [1, 0, 0], 'waiting_list': [0, 1, 0], 'random_assignment': [0, 0, 1]}
+PHASES = ('setup', 'agent_setup', 'clocks', 'schedule', 'behaviours', 'delivery')
+
+
+class TimedClock:
+    """
+    wraps a clock of the simulation (see MASSimulation.add_clock) to time its advance and settle
+    """
+
+    def __init__(self, clock, timer):
+        self.clock = clock
+        self.timer = timer
+
+    def advance(self, tick):
+        self.timer.tick_started()
+        start = time.perf_counter()
+        self.clock.advance(tick)
+        self.timer.phases['clocks'] += time.perf_counter() - start
+
+    def settle(self):
+        start = time.perf_counter()
+        self.clock.settle()
+        self.timer.phases['clocks'] += time.perf_counter() - start
+
+
+class PhaseTimer:
+    """
+    times the phases of the ticks of a simulation, by wrapping the functions simulate calls in every tick:
+    the clocks, the scheduling of the acting agents and the delivery of the queued messages,
+    the rest of a tick is spent in the periodic behaviours (with synchronous delivery including the receivers)
+    """
+
+    def __init__(self, sim):
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.first_tick = None
+        self.clocks = {}
+        add_clock, acting_agents, deliver_messages = sim.add_clock, sim.acting_agents, sim.deliver_messages
+
+        def timed_add_clock(clock):
+            if clock not in self.clocks:
+                self.clocks[clock] = TimedClock(clock, self)
+            add_clock(self.clocks[clock])
+
+        def timed_acting_agents():
+            self.tick_started()
+            start = time.perf_counter()
+            agents = acting_agents()
+            self.phases['schedule'] += time.perf_counter() - start
+            return agents
+
+        def timed_deliver_messages():
+            start = time.perf_counter()
+            deliver_messages()
+            self.phases['delivery'] += time.perf_counter() - start
+
+        sim.add_clock = timed_add_clock
+        sim.acting_agents = timed_acting_agents
+        sim.deliver_messages = timed_deliver_messages
+
+    def tick_started(self):
+        # the agents are set up before the clocks of the first tick advance
+        if self.first_tick is None:
+            self.first_tick = time.perf_counter()
+
+
+def run(num_students, num_houses, dist, ticks, seed, delivery):
+    """
+    function to run one simulation and measure it
+    :return: dict with the throughput, the time per phase and the peak memory of the run
+    """
+    from src.agents.agent import MASAgent
+    from src.agents.listing_agent import ListingAgent
+    from src.main import setup_simulation
+    from src.utils.config import SimulationConfig
+
+    sent = [0]
+    send = MASAgent.send
+
+    def counting_send(agent, message):
+        sent[0] += 1
+        send(agent, message)
+
+    MASAgent.send = counting_send
+
+    config = SimulationConfig(num_houses=num_houses, num_students=num_students, dist=dist, duration=ticks,
+                              delivery=delivery)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        sim = setup_simulation(config, seed)
+        sim.add_agent(ListingAgent("listing_agent@localhost"))
+        setup = time.perf_counter() - start
+        setup_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        timer = PhaseTimer(sim)
+        start = time.perf_counter()
+        sim.simulate()
+        end = time.perf_counter()
+
+    phases = timer.phases
+    phases['setup'] = setup
+    first_tick = timer.first_tick if timer.first_tick is not None else end
+    phases['agent_setup'] = first_tick - start
+    loop = end - first_tick
+    phases['behaviours'] = loop - phases['clocks'] - phases['schedule'] - phases['delivery']
+    return {'students': num_students, 'houses': num_houses, 'dist': dist, 'ticks': ticks, 'delivery': delivery,
+            'messages': sent[0], 'seconds': loop,
+            'ticks_per_second': ticks / loop if loop > 0 else None,
+            'messages_per_second': sent[0] / loop if loop > 0 else None,
+            'phases': phases,
+            # ru_maxrss is in kilobytes on Linux
+            'setup_rss_mb': setup_rss / 1024,
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+
+def compare(results, baseline):
+    """
+    function to print the change of the throughput against the results of another commit, per matching run
+    :param results: results of this commit
+    :param baseline: results file of another commit
+    """
+    key = lambda result: (result['students'], result['houses'], tuple(result['dist']), result['ticks'],
+                          result['delivery'])
+    before = {key(result): result for result in baseline['results']}
+    print("compared to", baseline['environment'].get('commit'))
+    for result in results:
+        old = before.get(key(result))
+        if old is None:
+            continue
+        print("{:>7} students {:>6} houses {}: ticks/s {:8.2f} -> {:8.2f} ({:+.0%}), peak RSS {:7.0f} -> {:7.0f} MB"
+              .format(result['students'], result['houses'], result['dist'], old['ticks_per_second'],
+                      result['ticks_per_second'], result['ticks_per_second'] / old['ticks_per_second'] - 1,
+                      old['peak_rss_mb'], result['peak_rss_mb']))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--points', nargs='+', default=POINTS, help="scale points as students:houses")
+    parser.add_argument('--distr', nargs='+', choices=list(DISTRIBUTIONS), default=list(DISTRIBUTIONS))
+    parser.add_argument('--ticks', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--delivery', choices=["synchronous", "queued"], default="synchronous")
+    parser.add_argument('--output', default=None, help="results file (default bench_scaling-<commit>.json)")
+    parser.add_argument('--compare', default=None, help="results file of another commit")
+    parser.add_argument('--run', help="run a single students:houses:distribution in this process, print JSON")
+    args = parser.parse_args()
+
+    if args.run is not None:
+        students, houses, distribution = args.run.split(":")
+        print(json.dumps(run(int(students), int(houses), DISTRIBUTIONS[distribution], args.ticks, args.seed,
+                             args.delivery)))
+        sys.exit(0)
+
+    results = []
+    for point in args.points:
+        for distribution in args.distr:
+            out = subprocess.run([sys.executable, "-m", "benchmarks.bench_scaling", "--run",
+                                  point + ":" + distribution, "--ticks", str(args.ticks), "--seed", str(args.seed),
+                                  "--delivery", args.delivery],
+                                 check=True, capture_output=True, text=True).stdout
+            result = json.loads(out.strip().splitlines()[-1])
+            results.append(result)
+            print("{students:>7} students {houses:>6} houses {distribution:>17}: {ticks_per_second:8.2f} ticks/s "
+                  "{messages_per_second:10.0f} msg/s  peak RSS {peak_rss_mb:7.0f} MB".format(
+                      distribution=distribution, **result))
+            print("        " + "  ".join("{} {:.2f}s".format(name, result['phases'][name]) for name in PHASES))
+
+    env = environment()
+    output = args.output or "bench_scaling-" + (env['commit'] or "unknown")[:10] + ".json"
+    write_results(output, env, {'ticks': args.ticks, 'seed': args.seed, 'delivery': args.delivery}, results)
+    print("Results written to", output)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
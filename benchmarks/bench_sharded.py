@@ -0,0 +1,47 @@
+"""
+Benchmark of a sharded run (src/sharded.py) per number of workers, against the same run in one process
+
+usage (from the repository root):
+    python -m benchmarks.bench_sharded --students 100000 --houses 15000 --ticks 20 --workers 2 4 8
+"""
+import argparse
+import json
+import os
+
+import src.utils.constants as const
+from src.runner import run_replication
+from src.sharded import run_sharded
+from src.utils.config import SimulationConfig
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=100000)
+    parser.add_argument('--houses', type=int, default=15000)
+    parser.add_argument('--ticks', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, nargs='+', default=[2, 4, 8])
+    parser.add_argument('--output', default=None, help="write the results as JSON")
+    args = parser.parse_args()
+
+    config = SimulationConfig(num_students=args.students, num_houses=args.houses, duration=args.ticks,
+                              delivery=const.QUEUED)
+    single = run_replication(config, args.seed)
+    results = [{'workers': 1, 'seconds': single['summary']['seconds'], 'speedup': 1.0, 'equal': True}]
+    for workers in args.workers:
+        sharded = run_sharded(config, args.seed, workers)
+        results.append({'workers': workers, 'seconds': sharded['summary']['seconds'],
+                        'speedup': single['summary']['seconds'] / sharded['summary']['seconds'],
+                        'equal': all(sharded['summary'][name] == single['summary'][name]
+                                     for name in single['summary'] if name != 'seconds'),
+                        'cross_shard_messages': sharded['cross_shard_messages']})
+
+    print("{} students, {} houses, {} ticks on {} CPUs".format(args.students, args.houses, args.ticks,
+                                                                os.cpu_count()))
+    for result in results:
+        print("{workers:>3} workers: {seconds:8.1f}s  speedup {speedup:5.2f}x  same result: {equal}".format(**result))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'config': config.to_dict(), 'seed': args.seed, 'cpus': os.cpu_count(), 'results': results},
+                      f, indent=2)
@@ -0,0 +1,36 @@
+"""
+Shared result files of the benchmarks: the results are written as JSON together with the environment
+(commit, Python and NumPy version, CPUs), so that the results of two commits can be diffed
+"""
+import json
+import os
+import platform
+import subprocess
+
+import numpy as np
+
+
+def environment():
+    """
+    function to describe the environment of a benchmark run
+    :return: dict with the commit (None outside of a git checkout), the versions and the number of CPUs
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], check=True, capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'numpy': np.__version__,
+            'platform': platform.platform(), 'cpus': os.cpu_count()}
+
+
+def write_results(path, env, settings, results):
+    """
+    function to write the results of a benchmark
+    :param path: path of the JSON file
+    :param env: environment of the run (see environment)
+    :param settings: arguments of the benchmark
+    :param results: list of result dicts
+    """
+    with open(path, 'w') as f:
+        json.dump({'environment': env, 'settings': settings, 'results': results}, f, indent=2)
@@ -1,10 +1,21 @@
-import random
+import hashlib
+
+import numpy as np
 
 import src.utils.constants as const
+from src.utils.checkpoint import save_checkpoint
+from src.utils.config import SimulationConfig
+from src.utils.instrumentation import Instrumentation
+from src.utils.messages import create_template, routing_key, template_routing_key
 from datetime import datetime
 
-all_agents = {}
-periodic_behaviours = []
+
+def sender_of(message):
+    return str(message.sender)
+
+
+def class_name(cls):
+    return cls.__module__ + "." + cls.__qualname__
 
 
 class MASAgent:
@@ -19,12 +30,22 @@ class MASAgent:
         """
         self.behaviours = []
         self.templates = []
+        self.routes = {}
+        self.unrouted_templates = []
         self.identifier = identifier
         self.sim = None
+        # random number generator of the agent, derived from the seed of the simulation (see MASSimulation.stream)
+        self.rng = None
 
     def setup(self):
         pass
 
+    def takedown(self):
+        """
+        function called once the simulation ran all ticks, after the messages of the last tick were delivered
+        """
+        pass
+
     def add_behaviour(self, behavior, template=None):
         """
         function to add behaviours to the agent
@@ -32,9 +53,17 @@ class MASAgent:
         :param template: the used messaging/behaviour template
         """
         self.behaviours.append(behavior)
+        behavior.agent = self
+        behavior.removed = False
+        if behavior.periodic and self.sim is not None:
+            self.sim.wake(behavior)
         if template is not None:
             self.templates.append((template, behavior))
-        behavior.agent = self
+            key = template_routing_key(template)
+            if key is None:
+                self.unrouted_templates.append((template, behavior))
+            else:
+                self.routes[key] = self.routes.get(key, ()) + (behavior,)
 
     def remove_behaviour(self, behavior):
         """
@@ -43,29 +72,74 @@ class MASAgent:
         :return:
         """
         self.behaviours.remove(behavior)
+        behavior.removed = True
+        if behavior.periodic and self.sim is not None:
+            self.sim.awake.pop(behavior, None)
         for index, (template, behav) in enumerate(self.templates):
             if behavior == behav:
                 del self.templates[index]
+                key = template_routing_key(template)
+                if key is None:
+                    self.unrouted_templates.remove((template, behav))
+                    return
+                behaviours = tuple(b for b in self.routes[key] if b is not behavior)
+                if behaviours:
+                    self.routes[key] = behaviours
+                else:
+                    del self.routes[key]
                 return
 
+    def wake(self):
+        """
+        function to wake up the sleeping periodic behaviours of the agent (see MASPeriodicBehaviour.sleep_until)
+        """
+        for behaviour in self.behaviours:
+            if behaviour.periodic and behaviour.asleep:
+                self.sim.wake(behaviour)
+
+    def dispatch(self, message):
+        """
+        function to look up the behaviours whose template matches a message
+        templates are indexed by performative and routing metadata (see utils/messages.py),
+        so only templates with further constraints are matched one by one
+        :param message: received message
+        :return: tuple of matching behaviours
+        """
+        key = routing_key(message)
+        behaviours = self.routes.get(key, ())
+        if key[3] is not None:
+            # templates without routing metadata match every message of their performative
+            behaviours += self.routes.get(key[:3] + (None, None), ())
+        if self.unrouted_templates:
+            behaviours += tuple(behav for template, behav in self.unrouted_templates if template.match(message))
+        return behaviours
+
     def send(self, message):
         """
         function for sending messages to facilitate agent-to-agent communication
+
+        synchronous delivery (const.SYNCHRONOUS) runs the receiving behaviours before send returns,
+        so a chain of messages is handled depth-first as nested calls within the sender's turn,
+        and every agent observes the effects of a message before the sender continues;
+        the receiving behaviours are resolved once, before the first one runs,
+        so a behaviour that removes itself (or another one) does not affect the delivery of this message
+
+        queued delivery (const.QUEUED) appends the message to the simulation's message queue,
+        which is drained in rounds after the periodic behaviours of a tick (see MASSimulation.deliver_messages)
         :param message: message to be sent
         """
-        sent = False
-        to = str(message.to)
         message.sender = self.identifier
-        if to in self.sim.all_agents.keys():
-            agent = self.sim.all_agents[to]
-            for template, behavior in agent.templates:
-                if template.match(message):
-                    sent = True
-                    behavior.run(message)
-            if sent is False:
-                print("Didn't send message to '" + to + "' no behaviour with a match")
-        else:
-            print("Can't send message to '" + to + "' it doesn't exist")
+        instrumentation = self.sim.instrumentation
+        if instrumentation is not None:
+            instrumentation.count_message(message)
+        if self.sim.delivery == const.QUEUED:
+            self.sim.message_queue.append(message)
+            return
+        for behavior in self.sim.receivers(message):
+            if instrumentation is None:
+                behavior.run(message)
+            else:
+                instrumentation.run(type(behavior), 1, behavior.run, message)
 
 
 class MASBehaviour:
@@ -77,6 +151,7 @@ class MASBehaviour:
         self.agent = None
         self.exit_code = ""
         self.periodic = False
+        self.removed = False
 
     def send(self, msg):
         self.agent.send(msg)
@@ -85,35 +160,117 @@ class MASBehaviour:
         self.agent.remove_behaviour(self)
 
 
-# currently unused
 class MASReceivingBehaviour(MASBehaviour):
+    """
+    extends MASBehaviour, implements behaviour that reacts to received messages
+    """
+
     def __init__(self):
         super().__init__()
 
     def run(self, msg):
         raise NotImplementedError("Please Implement this method")
 
+    @classmethod
+    def run_batch(cls, deliveries):
+        """
+        function to handle all messages of one delivery round that are addressed to behaviours of this class,
+        can be overridden to process the batch at once (queued delivery only)
+        :param deliveries: list of (behaviour, message) tuples in delivery order (see MASSimulation.deliver_round)
+        """
+        for behaviour, msg in deliveries:
+            # skip behaviours that were removed earlier in the same round
+            if not behaviour.removed:
+                behaviour.run(msg)
+
 
 class MASPeriodicBehaviour(MASBehaviour):
     """
     extends MASBehaviour, implements basic periodic behaviour
+    a periodic behaviour runs every tick, unless it sleeps until a later tick
     """
 
     def __init__(self):
         super().__init__()
         self.periodic = True
+        self.asleep = False
+        self.wake_tick = None
+
+    def sleep_until(self, tick):
+        """
+        function to skip the behaviour until the given tick,
+        it is woken up earlier by wake (e.g. by a received message)
+        :param tick: tick in which the behaviour runs again, None to sleep until it is woken up
+        """
+        self.agent.sim.sleep(self, tick)
+
+    def wake_at(self, tick):
+        """
+        function to make sure that a sleeping behaviour runs again at the latest in the given tick
+        :param tick: latest tick in which the behaviour runs, None for no change
+        """
+        if self.asleep and tick is not None and (self.wake_tick is None or tick < self.wake_tick):
+            self.agent.sim.sleep(self, tick)
+
+    def wake(self):
+        """
+        function to run the behaviour every tick again, starting with the current tick
+        if its agent did not act yet, the next tick otherwise
+        """
+        self.agent.sim.wake(self)
 
 
 class MASSimulation:
     """
     Simulation class, manages agents and timed behaviour (ticks)
+    owns all state of a simulation run, so that several simulations can run in one process
     """
 
-    def __init__(self):
+    def __init__(self, config=None, seed=None):
+        """
+        constructor for simulations
+        :param config: SimulationConfig of the run, defaults to the constants
+        :param seed: root seed of all random number streams of the run, drawn from the OS if None
+        """
+        self.config = config if config is not None else SimulationConfig()
+        self.seed = seed if seed is not None else int(np.random.SeedSequence().entropy)
+        self.rng = self.stream("scheduler")
         self.ticks_passed = 0
         self.periodic_behaviours = []
         self.all_agents = {}
+        # periodic behaviours that run every tick (dict used as insertion-ordered set)
+        self.awake = {}
+        # tick -> sleeping behaviours to be woken up, entries of behaviours that were rescheduled are skipped
+        self.timers = {}
+        # objects with an advance(tick) function, called at the start of every tick, and a settle() function,
+        # called once all agents acted in the tick
+        self.clocks = []
+        # behaviours woken up while the agents act in a tick (see run_agents), None between the ticks
+        self.woken = None
+        self.delivery = self.config.delivery
+        self.message_queue = []
+        # templates shared by the agents of the simulation (see template)
+        self.templates = {}
+        # exchanges the messages of other processes in every delivery round (sharded runs, see src/sharded.py)
+        self.transport = None
+        # records the time per tick and behaviour class and the messages, if enabled (see instrument)
+        self.instrumentation = None
+        # checkpoints of the run every checkpoint_every ticks, if enabled (see enable_checkpoints)
+        self.checkpoint_every = None
+        self.checkpoint_path = None
+        # the agents are set up once, a simulation restored from a checkpoint continues with the next tick
+        self.set_up = False
         self.id = datetime.now().strftime('%Y%m%d-%H%M%S')
+        # agents and shared state of the housing simulation (see main.setup_simulation)
+        self.students = []
+        self.houses = []
+        self.population = None
+        self.rooms = None
+        # agent identifier -> shard of a sharded run (see src/sharded.py)
+        self.owners = {}
+        # currently unused (for visualization)
+        self.student_moving = {'from': [],
+                               'to': []}
 
     def add_agent(self, agent):
         """
@@ -122,28 +279,234 @@ class MASSimulation:
         """
         self.all_agents[agent.identifier] = agent
         agent.sim = self
+        agent.rng = self.stream(agent.identifier)
+        for behaviour in agent.behaviours:
+            if behaviour.periodic:
+                self.wake(behaviour)
+
+    def stream(self, name):
+        """
+        function to derive a named random number stream from the root seed:
+        a counter-based Philox generator keyed by a hash of the seed and the name,
+        so the numbers drawn from a stream do not depend on the order in which agents are created or run
+        :param name: name of the stream (agent identifier, 'scheduler', 'setup')
+        :return: numpy Generator
+        """
+        digest = hashlib.sha256((str(self.seed) + ":" + name).encode()).digest()
+        return np.random.Generator(np.random.Philox(key=np.frombuffer(digest[:16], dtype=np.uint64)))
+
+    def template(self, performative, meta_data=None):
+        """
+        function to get a messaging template (see utils.messages.create_template),
+        templates are never changed after creation, so all agents of the simulation share them
+        :param performative: performative identifier
+        :param meta_data: additional metadata
+        :return: template
+        """
+        key = (performative,) + tuple(sorted(meta_data.items())) if meta_data is not None else (performative,)
+        template = self.templates.get(key)
+        if template is None:
+            template = create_template(performative, meta_data)
+            self.templates[key] = template
+        return template
+
+    def instrument(self, print_ticks=True):
+        """
+        function to enable the instrumentation of the run (see utils/instrumentation.py),
+        without it, the run only checks that the instrumentation is disabled
+        :param print_ticks: print the time, messages, searching students and open listings of every tick
+        :return: Instrumentation, exports the ticks as CSV and a summary
+        """
+        self.instrumentation = Instrumentation(self, print_ticks)
+        return self.instrumentation
+
+    def enable_checkpoints(self, every, path=None):
+        """
+        function to write a checkpoint of the complete state of the run every few ticks (see utils/checkpoint.py),
+        every checkpoint replaces the previous one, and the run continues from it with utils.checkpoint.load_checkpoint
+        :param every: number of ticks between two checkpoints
+        :param path: path of the checkpoint file, defaults to data-<id>.checkpoint
+        """
+        self.checkpoint_every = every
+        self.checkpoint_path = path if path is not None else "data-" + self.id + ".checkpoint"
+
+    def add_clock(self, clock):
+        """
+        function to add an object that is advanced at the start of every tick (e.g. a room table)
+        and settled once all agents acted in the tick
+        :param clock: object with an advance(tick) and a settle() function
+        """
+        if clock not in self.clocks:
+            self.clocks.append(clock)
+
+    def wake(self, behaviour):
+        """
+        function to run a periodic behaviour every tick
+        :param behaviour: periodic behaviour
+        """
+        behaviour.asleep = False
+        behaviour.wake_tick = None
+        self.awake[behaviour] = None
+        if self.woken is not None:
+            self.woken.append(behaviour)
+
+    def sleep(self, behaviour, tick):
+        """
+        function to let a periodic behaviour sleep until the given tick (see MASPeriodicBehaviour.sleep_until)
+        :param behaviour: periodic behaviour
+        :param tick: tick to wake up in, None to sleep until woken up
+        """
+        if tick is not None and tick <= self.ticks_passed:
+            # due already, runs in the current tick if its agent did not act yet
+            self.wake(behaviour)
+            return
+        self.awake.pop(behaviour, None)
+        behaviour.asleep = True
+        behaviour.wake_tick = tick
+        if tick is not None:
+            self.timers.setdefault(tick, []).append(behaviour)
+
+    def acting_agents(self):
+        """
+        function to wake up the behaviours whose timer ends in the current tick
+        and to collect the agents with a periodic behaviour to run, in the order they were woken up
+        :return: list of agents
+        """
+        for behaviour in self.timers.pop(self.ticks_passed, ()):
+            # skip timers of behaviours that were woken up or rescheduled in the meantime
+            if behaviour.asleep and not behaviour.removed and behaviour.wake_tick is not None and \
+                    behaviour.wake_tick <= self.ticks_passed:
+                self.wake(behaviour)
+        return list(dict.fromkeys(behaviour.agent for behaviour in self.awake))
+
+    def receivers(self, message):
+        """
+        function to look up the behaviours a message is delivered to
+        :param message: message to be delivered
+        :return: tuple of receiving behaviours
+        """
+        to = str(message.to)
+        if to not in self.all_agents.keys():
+            print("Can't send message to '" + to + "' it doesn't exist")
+            return ()
+        behaviours = self.all_agents[to].dispatch(message)
+        if not behaviours:
+            print("Didn't send message to '" + to + "' no behaviour with a match")
+        return behaviours
+
+    def deliver_messages(self):
+        """
+        function to drain the message queue (queued delivery):
+            every round delivers the messages queued so far, messages sent by the handlers go to the next round
+            with a transport, the messages of a round are exchanged with the other shards first,
+            and the rounds continue until no shard has messages left
+        """
+        while True:
+            messages = self.message_queue
+            self.message_queue = []
+            if self.transport is not None:
+                messages, pending = self.transport.exchange(messages)
+                if not pending:
+                    return
+            elif not messages:
+                return
+            self.deliver_round(messages)
+
+    def deliver_round(self, messages):
+        """
+        function to deliver the messages of one round in a canonical order, which does not depend on the order
+        in which the agents acted (or on the shard they live in):
+            the messages are sorted by sender, the messages of one sender stay in the order they were sent
+            the deliveries are grouped by behaviour class, and the groups are handed to the class' run_batch
+            in the order of the class names
+        :param messages: messages of the round
+        """
+        batches = {}
+        for message in sorted(messages, key=sender_of):
+            for behaviour in self.receivers(message):
+                batches.setdefault(type(behaviour), []).append((behaviour, message))
+        for behaviour_class in sorted(batches, key=class_name):
+            if self.instrumentation is None:
+                behaviour_class.run_batch(batches[behaviour_class])
+            else:
+                self.instrumentation.run(behaviour_class, len(batches[behaviour_class]), behaviour_class.run_batch,
+                                         batches[behaviour_class])
+
+    def run_agents(self, agents):
+        """
+        function to run the awake periodic behaviours of agents, one agent after the other,
+        an agent that is woken up meanwhile (e.g. by a message) and is not in the list yet is inserted at a random
+        position among the agents that did not act yet, so the order of the agents that act stays random
+        :param agents: list of agents, in the order they act
+        """
+        instrumentation = self.instrumentation
+        # the next agent to act is at the end
+        pending = agents[::-1]
+        scheduled = set(agents)
+        self.woken = []
+        while pending:
+            agent = pending.pop()
+            for behaviour in list(agent.behaviours):
+                if not behaviour.periodic or behaviour.asleep or behaviour.removed:
+                    continue
+                if instrumentation is None:
+                    behaviour.run()
+                else:
+                    instrumentation.run(type(behaviour), 1, behaviour.run)
+                if behaviour.exit_code != "":
+                    behaviour.agent.remove_behaviour(behaviour)
+            if self.woken:
+                for woken in dict.fromkeys(behaviour.agent for behaviour in self.woken):
+                    if woken not in scheduled:
+                        scheduled.add(woken)
+                        pending.insert(int(self.rng.integers(len(pending) + 1)), woken)
+                self.woken = []
+        self.woken = None
 
     def simulate(self):
         """
         main simulation function:
             starts up agents and runs simulation with defined parameters
-            manages tick-time for periodic behaviours
+            manages tick-time for periodic behaviours, behaviours that sleep (see MASPeriodicBehaviour.sleep_until)
+            are skipped, and agents without an awake periodic behaviour are not touched,
+            an agent that is woken up during the tick acts in the same tick, at a random position among the agents
+            that did not act yet (see run_agents), an agent that already acted acts again in the next tick
+            with queued delivery, every tick runs the periodic behaviours first and then drains the message queue
+            an enabled instrumentation (see instrument) records every tick, the setup of the agents as tick 0
+            enabled checkpoints (see enable_checkpoints) are written after every checkpoint_every-th tick,
+            a simulation restored from a checkpoint continues with the next tick, without setting up the agents again
+            the agents are taken down (see MASAgent.takedown) after the last tick
         """
-        print("Setting up agents")
-        for agent in self.all_agents.values():
-            agent.setup()
+        instrumentation = self.instrumentation
+        if not self.set_up:
+            print("Setting up agents")
+            if instrumentation is not None:
+                instrumentation.start_tick(0)
+            for agent in self.all_agents.values():
+                agent.setup()
+            if instrumentation is not None:
+                instrumentation.end_tick()
+            self.set_up = True
 
         print("Simulation started")
-        while self.ticks_passed < const.SIMULATION_DURATION:  # ticks
+        while self.ticks_passed < self.config.duration:  # ticks
 
             self.ticks_passed += 1
-            print("TICK", self.ticks_passed)
-            agents = list(self.all_agents.values())
-            random.shuffle(agents)
-            for agent in agents:
-                for behaviour in agent.behaviours:
-                    if not behaviour.periodic:
-                        continue
-                    behaviour.run()
-                    if behaviour.exit_code is not "":
-                        behaviour.agent.remove_behaviour(behaviour)
+            if instrumentation is not None:
+                instrumentation.start_tick(self.ticks_passed)
+            for clock in self.clocks:
+                clock.advance(self.ticks_passed)
+            # only the agents with an awake periodic behaviour act, in random order
+            agents = self.acting_agents()
+            self.rng.shuffle(agents)
+            self.run_agents(agents)
+            for clock in self.clocks:
+                clock.settle()
+            self.deliver_messages()
+            if instrumentation is not None:
+                instrumentation.end_tick()
+            if self.checkpoint_every and self.ticks_passed % self.checkpoint_every == 0:
+                save_checkpoint(self, self.checkpoint_path)
+
+        for agent in self.all_agents.values():
+            agent.takedown()
@@ -1,45 +1,128 @@
-import random
-import uuid
+import numpy as np
 
 import src.utils.constants as const
 from src.agents.agent import MASAgent, MASPeriodicBehaviour, MASReceivingBehaviour
 from src.utils.messages import *
-
-
-def get_application_days(housing_method):
-    """
-    function to return remaining application days
-    :param housing_method: applied distribution method
-    :return: number of remaining open application days
-    """
-    return const.DEFAULT_APPLICATION_DAYS + (const.EXTRA_COOP_DAYS if housing_method == const.COOP else 0)
+from src.utils.payloads import Listing, Application, ContractProposal, RoomReference, StudentReference, HouseScore, \
+    Payload, freeze_vector
+from src.utils.rooms import RoomTable, RoomsView, RoomView, get_application_days
 
 
 class HouseAgent(MASAgent):
     """
     HouseAgent class, extends general MASAgent
+    the rooms live in a (shared) RoomTable, self.rooms is a dict-like view of the rooms of this house
     """
-    def __init__(self, jid, password, num_rooms, appl_type, accept_internationals=False):
+    def __init__(self, jid, password, num_rooms, appl_type, accept_internationals=False, room_table=None):
         super().__init__(jid)
-        self.rooms = {}
+        self.room_table = room_table if room_table is not None else RoomTable()
+        self.number, self.room_ids = self.room_table.add_house(num_rooms, appl_type)
+        self.rooms = RoomsView(self.room_table, self.room_ids)
         self.accept_internationals = accept_internationals
         self.appl_type = appl_type
-        self.attractiveness = random.uniform(0, 1)
+        # drawn from the random number stream of the house in setup
+        self.attractiveness = None
         self.house_score = None
-        for room in range(num_rooms):
-            new_room = {
-                'id': str(uuid.uuid1()),
-                'resident_jid': None,
-                'questionnaire': None,
-                'listed': False,
-                'listing_time': False,
-                'application_in_process': False,
-                'housing_method': appl_type,
-                'applicants': [],
-                'application_days_left': get_application_days(appl_type),
-                'contract_days_left': 0
-            }
-            self.rooms[new_room['id']] = new_room
+        # running sum of the personality vectors of the residents, house_score is their average
+        self.personality_sum = np.zeros(5)
+        self.residents = 0
+        # compatibility of every pair of residents, indexed by the position of the room in the house
+        self.personalities = np.zeros((num_rooms, 5))
+        self.occupied = np.zeros(num_rooms, dtype=bool)
+        self.compatibility = np.zeros((num_rooms, num_rooms))
+        self.matching_score_dirty = False
+        self.cached_matching_score = None
+
+    def move_in(self, room_id, questionnaire):
+        """
+        function to add a resident to the running sum and the compatibility matrix,
+        update_house_score is called once the room is updated
+        :param room_id: id of the room
+        :param questionnaire: questionnaire of the new resident
+        """
+        if questionnaire is None:
+            return
+        self.personality_sum += questionnaire['personality_vector']
+        self.residents += 1
+
+        i = room_id - self.room_ids.start
+        self.personalities[i] = questionnaire['personality_vector']
+        self.occupied[i] = True
+        compatibility = const.calculate_dist_matrix(self.personalities[i:i + 1], self.personalities)[0]
+        compatibility[~self.occupied] = 0
+        compatibility[i] = 0
+        self.compatibility[i, :] = compatibility
+        self.compatibility[:, i] = compatibility
+        self.matching_score_dirty = True
+
+    def move_out(self, room_id, questionnaire):
+        """
+        function to remove a resident from the running sum and the compatibility matrix,
+        update_house_score is called once the room is updated
+        :param room_id: id of the room
+        :param questionnaire: questionnaire of the leaving resident
+        """
+        if questionnaire is None:
+            return
+        self.personality_sum -= questionnaire['personality_vector']
+        self.residents -= 1
+        if self.residents == 0:
+            # drop the rounding error of the running sum
+            self.personality_sum[:] = 0
+
+        i = room_id - self.room_ids.start
+        self.occupied[i] = False
+        self.compatibility[i, :] = 0
+        self.compatibility[:, i] = 0
+        self.matching_score_dirty = True
+
+    def choose_cooptation_applicant(self, applicants):
+        """
+        function to pick the applicant with the highest average compatibility with the current residents,
+        computed as one applicants x residents matrix, the first applicant wins ties and the first applicant
+        is chosen if no applicant has an average compatibility above 0
+        :param applicants: list of applicants (dicts with the application), the house needs at least one resident
+        :return: chosen applicant
+        """
+        vectors = [applicant['application']['questionnaire']['personality_vector'] for applicant in applicants]
+        compatibility = const.calculate_dist_matrix(vectors, self.personalities[self.occupied])
+        average_match_score = compatibility.sum(axis=1) / self.residents
+        best = int(np.argmax(average_match_score))
+        return applicants[best] if average_match_score[best] > 0 else applicants[0]
+
+    def matching_score(self):
+        """
+        function to get the average compatibility of all housemates (see const.calculate_house_matching_score),
+        recalculated from the compatibility matrix only if a resident moved in or out since the last call
+        :return: averaged compatibility or None for less than two residents
+        """
+        if self.matching_score_dirty:
+            self.matching_score_dirty = False
+            self.cached_matching_score = None
+            if self.residents > 1:
+                # the unoccupied rooms and the diagonal are 0, so the rows sum up the roommates only
+                roommates_score = self.compatibility[self.occupied].sum(axis=1) / (self.residents - 1)
+                self.cached_matching_score = roommates_score.sum().item() / self.residents
+            if const.DEBUG_HOUSE_SCORE:
+                expected = const.calculate_house_matching_score(self)
+                if (expected is None) != (self.cached_matching_score is None) or (
+                        expected is not None and not np.isclose(expected, self.cached_matching_score)):
+                    raise RuntimeError("matching score of " + self.identifier + " is " +
+                                       str(self.cached_matching_score) + ", expected " + str(expected))
+        return self.cached_matching_score
+
+    def update_house_score(self):
+        """
+        function to set the house-score (avg. personality vector of the residents) from the running sum,
+        checked against the full recalculation if DEBUG_HOUSE_SCORE is set
+        """
+        self.house_score = freeze_vector(self.personality_sum / self.residents) if self.residents > 0 else None
+        if const.DEBUG_HOUSE_SCORE:
+            expected = const.calc_avg_personality(self)
+            if (expected is None) != (self.house_score is None) or (
+                    expected is not None and not np.allclose(expected, self.house_score)):
+                raise RuntimeError("house-score of " + self.identifier + " is " + str(self.house_score) +
+                                   ", expected " + str(expected))
 
     class HouseUpdate(MASPeriodicBehaviour):
         """
@@ -50,53 +133,45 @@ class HouseAgent(MASAgent):
             """
             function to post free rooms as listings to the listing agent
             """
-            for room_id in self.agent.rooms:
+            for room_id in self.agent.room_table.unlisted_rooms(self.agent.number, self.agent.room_ids):
                 room = self.agent.rooms[room_id]
-                if room['listed'] or room['application_in_process'] or room['resident_jid'] is not None:
-                    continue
-
-                self.agent.house_score = const.calc_avg_personality(self.agent)
-
                 msg = create_message("listing_agent@localhost",
                                      "inform",
-                                     json.dumps({'id': room_id, 'housing_method': room['housing_method'],
-                                                 'accept_internationals': self.agent.accept_internationals,
-                                                 'attractiveness': self.agent.attractiveness,
-                                                 'house_score': self.agent.house_score}),
+                                     Listing(id=room_id, housing_method=room['housing_method'],
+                                             accept_internationals=self.agent.accept_internationals,
+                                             attractiveness=self.agent.attractiveness,
+                                             house_score=self.agent.house_score),
                                      {'inform-type': 'listing'})
                 self.agent.rooms[room_id]['listed'] = True
                 self.send(msg)
 
         def run(self):
             """
-            main house-function to update contracts and listings
+            main house-function to update contracts and listings,
+            the countdowns of the rooms are derived from the tick, only the rooms that cross a threshold
+            are handled (see RoomTable.due_rooms), then the house sleeps until the room table wakes it up again
             """
-            for room_id in self.agent.rooms:
-                room = self.agent.rooms[room_id]
-                if room['listed']:
-                    room['listing_time'] += 1
-                else:
-                    room['listing_time'] = 0
+            table = self.agent.room_table
+            for room_id in table.due_rooms(self.agent.number, self.agent.room_ids):
+                room = RoomView(table, room_id)
                 if room['resident_jid'] is not None:
-                    room['contract_days_left'] -= 1
                     if room['contract_days_left'] == 4:
                         self.on_warn_student(room)
                     if room['contract_days_left'] <= 0:
                         self.on_rent_period_end(room)
                     continue
 
-                if room['listed'] and not room['application_in_process'] and room['resident_jid'] is None:
-                    if room['application_days_left'] == const.EXTRA_COOP_DAYS and len(room['applicants']) > 0 and len(
-                            room['applicants']) <= 25:
-                        msg = create_message("listing_agent@localhost", "request", {'room_id': room_id},
-                                             {'request-type': 'remove-listing'})
-                        self.send(msg)
-
-                room['application_days_left'] -= 1
+                # co-optation starts (EXTRA_COOP_DAYS days left before this tick)
+                if room['listed'] and not room['application_in_process'] and 0 < len(room['applicants']) <= 25 and \
+                        room['application_days_left'] + 1 == const.EXTRA_COOP_DAYS:
+                    msg = create_message("listing_agent@localhost", "request", RoomReference(room_id=room_id),
+                                         {'request-type': 'remove-listing'})
+                    self.send(msg)
 
                 if room['application_days_left'] <= 0:
                     self.on_application_end(room)
             self.post_listings()
+            self.sleep_until(None)
 
         def on_application_end(self, room):
             """
@@ -112,59 +187,40 @@ class HouseAgent(MASAgent):
             if len(room['applicants']) == 0:
                 return
             room['application_in_process'] = True
-            msg = create_message("listing_agent@localhost", "request", {'room_id': room_id},
+            msg = create_message("listing_agent@localhost", "request", RoomReference(room_id=room_id),
                                  {'request-type': 'remove-listing'})
             self.send(msg)
             room['listed'] = False
             room['application_days_left'] = get_application_days(room['housing_method'])
 
             chosen_applicant = room['applicants'][0]
-            is_first_coop = room['housing_method'] == const.COOP and len(
-                [i for i in self.agent.rooms.values() if i['resident_jid'] is not None]) == 0
+            is_first_coop = room['housing_method'] == const.COOP and self.agent.residents == 0
 
             if room['housing_method'] == const.RAND or is_first_coop:
                 # if method  is random assignment or if house is empty -> choose rand. applicant
-                chosen_applicant = random.choice(room['applicants'])
+                chosen_applicant = room['applicants'][self.agent.rng.integers(len(room['applicants']))]
             elif room['housing_method'] == const.WAIT_LIST:
                 # select applicant with highest waiting time
                 chosen_applicant = max(room['applicants'], key=lambda x: x['application']['waiting_time'])
             elif room['housing_method'] == const.COOP and len(room['applicants']) > 1:
                 # select best-fitting housemate for co-optation
-                highest_match_score = 0
-                for applicant in room['applicants']:
-                    match_score_sum = 0
-                    housemates = 0
-                    # select matching score with housemates for each applicant
-                    for housemate_room in self.agent.rooms.values():
-                        if housemate_room['resident_jid'] is None:
-                            continue
-                        match_score = const.calculate_dist(housemate_room['questionnaire']['personality_vector'],
-                                                                  applicant['application']['questionnaire']['personality_vector'])
-                        match_score_sum += match_score
-                        housemates += 1
-                    average_match_score = match_score_sum / housemates
-                    # select best fit
-                    if average_match_score > highest_match_score:
-                        highest_match_score = average_match_score
-                        chosen_applicant = applicant
+                chosen_applicant = self.agent.choose_cooptation_applicant(room['applicants'])
 
             # send rejection to students that were not chosen
             applicants = list(room['applicants'])
             for applicant in applicants:
-                if applicant['student_jid'] is chosen_applicant["student_jid"]:
+                if applicant['student_jid'] == chosen_applicant["student_jid"]:
                     continue
-                rejected_msg = create_message(applicant["student_jid"], "inform", {'room_id': room_id},
+                rejected_msg = create_message(applicant["student_jid"], "inform", RoomReference(room_id=room_id),
                                               {'inform-type': 'application-rejection'})
                 self.send(rejected_msg)
 
             # propose a rental contract to chosen student
             if chosen_applicant is not None:
-                proposed_contract = {
-                    'room_id': room['id'],
-                    'rent_period': const.DEFAULT_RENT_PERIOD,
-                    'house_jid': self.agent.identifier,
-                    'house_attractiveness': self.agent.attractiveness
-                }
+                proposed_contract = ContractProposal(room_id=room['id'],
+                                                     rent_period=const.DEFAULT_RENT_PERIOD,
+                                                     house_jid=self.agent.identifier,
+                                                     house_attractiveness=self.agent.attractiveness)
 
                 proposal_msg = create_message(chosen_applicant["student_jid"], "propose", proposed_contract,
                                               {'propose-type': 'room-contract'})
@@ -177,18 +233,19 @@ class HouseAgent(MASAgent):
             """
 
             # inform tenant that rental period has ended
-            rent_ended_msg = create_message(room["resident_jid"], "inform", {},
+            rent_ended_msg = create_message(room["resident_jid"], "inform", Payload(),
                                             {'inform-type': 'contract-ended'})
 
             # remove tenant
+            self.agent.move_out(room['id'], room['questionnaire'])
             room['resident_jid'] = None
             room['questionnaire'] = None
             room['applicants'] = []
             room['application_days_left'] = get_application_days(room['housing_method'])
             room['contract_days_left'] = 0
 
-            # recalculate the avg. house vector
-            self.agent.house_score = const.calc_avg_personality(self.agent)
+            # update the avg. house vector
+            self.agent.update_house_score()
 
             self.send(rent_ended_msg)
 
@@ -197,7 +254,7 @@ class HouseAgent(MASAgent):
             function to warn tenant that their rental agreement will end soon
             :param room: rented room
             """
-            rent_ended_msg = create_message(room["resident_jid"], "inform", {},
+            rent_ended_msg = create_message(room["resident_jid"], "inform", Payload(),
                                             {'inform-type': 'contract-almost-ends'})
             self.send(rent_ended_msg)
 
@@ -206,14 +263,17 @@ class HouseAgent(MASAgent):
         reacts to students accepted rental contract, updates room accordingly
         """
         def run(self, received_msg):
-            proposal = json.loads(received_msg.body)
-            self.agent.rooms[proposal['room_id']]['application_in_process'] = False
-            self.agent.rooms[proposal['room_id']]['applicants'] = []
-            self.agent.rooms[proposal['room_id']]['resident_jid'] = str(received_msg.sender)
-            self.agent.rooms[proposal['room_id']]['questionnaire'] = json.loads(received_msg.body)[
-                'questionnaire']
-            self.agent.rooms[proposal['room_id']]['contract_days_left'] = const.DEFAULT_RENT_PERIOD
-            self.agent.house_score = const.calc_avg_personality(self.agent)  # recalculate avg. house vector
+            proposal = read_body(received_msg, ContractProposal)
+            room = self.agent.rooms[proposal['room_id']]
+            room['application_in_process'] = False
+            room['applicants'] = []
+            room['resident_jid'] = str(received_msg.sender)
+            self.agent.move_out(room['id'], room['questionnaire'])
+            room['questionnaire'] = proposal['questionnaire']
+            self.agent.move_in(room['id'], room['questionnaire'])
+            room['contract_days_left'] = const.DEFAULT_RENT_PERIOD
+            # update avg. house vector
+            self.agent.update_house_score()
 
     class ReceiveCancelApplication(MASReceivingBehaviour):
         """
@@ -221,7 +281,7 @@ class HouseAgent(MASAgent):
         removes applicant from list
         """
         def run(self, received_msg):
-            cancellation = json.loads(received_msg.body)
+            cancellation = read_body(received_msg, RoomReference)
             room = self.agent.rooms[cancellation['room_id']]
             room['applicants'] = list(
                 filter(lambda x: x['student_jid'] != str(received_msg.sender), room['applicants']))
@@ -236,8 +296,8 @@ class HouseAgent(MASAgent):
         informs residents of current house matching score
         """
         def run(self, received_msg):
-            proposal = json.loads(received_msg.body)
-            msg = create_message(proposal['student_jid'], "inform", {"house_score": self.agent.house_score},
+            proposal = read_body(received_msg, StudentReference)
+            msg = create_message(proposal['student_jid'], "inform", HouseScore(house_score=self.agent.house_score),
                                  {'inform-type': 'house-score'})
 
             self.send(msg)
@@ -247,22 +307,25 @@ class HouseAgent(MASAgent):
         handles residents moving out
         """
         def run(self, received_msg):
-            proposal = json.loads(received_msg.body)
+            proposal = read_body(received_msg, StudentReference)
 
-            room = None
-            for r in self.agent.rooms.values():
-                if r['resident_jid'] == proposal['student_jid']:
-                    room = r
-            rent_ended_msg = create_message(room["resident_jid"], "inform", {},
+            room_id = self.agent.room_table.room_of_resident(self.agent.room_ids, proposal['student_jid'])
+            if room_id is None:
+                return  # the contract already ended (queued delivery)
+            room = self.agent.rooms[room_id]
+            rent_ended_msg = create_message(room["resident_jid"], "inform", Payload(),
                                             {'inform-type': 'contract-ended'})
 
+            self.agent.move_out(room['id'], room['questionnaire'])
             room['resident_jid'] = None
             room['questionnaire'] = None
             room['applicants'] = []
             room['application_days_left'] = get_application_days(room['housing_method'])
             room['contract_days_left'] = 0
 
-            self.agent.house_score = const.calc_avg_personality(self.agent)  # recalculate avg. house vector
+            # update avg. house vector
+            self.agent.update_house_score()
+
             self.send(rent_ended_msg)
 
     class ReceiveRoomApplications(MASReceivingBehaviour):
@@ -270,24 +333,25 @@ class HouseAgent(MASAgent):
         handles incoming applications to posted room listings
         """
         def run(self, received_msg):
-            received_application = json.loads(received_msg.body)
+            received_application = read_body(received_msg, Application)
             room = self.agent.rooms[received_application["id"]]
 
             if room['resident_jid'] is not None or room['application_in_process']:
                 rejected_msg = create_message(str(received_msg.sender), "inform",
-                                              {'room_id': received_application['id']},
+                                              RoomReference(room_id=received_application['id']),
                                               {'inform-type': 'application-rejection'})
                 self.send(rejected_msg)
                 return
 
             # inform students of received application
-            room = self.agent.rooms[received_application["id"]]
-            room['applicants'].append(
-                {'student_jid': str(received_msg.sender), 'application': received_application})
+            self.agent.room_table.add_applicant(received_application["id"],
+                                                {'student_jid': str(received_msg.sender),
+                                                 'application': received_application})
 
             # request a removal of the listing after more than 25 applications
             if len(room['applicants']) > 25:
-                msg = create_message("listing_agent@localhost", "request", {'room_id': received_application["id"]},
+                msg = create_message("listing_agent@localhost", "request",
+                                     RoomReference(room_id=received_application["id"]),
                                      {'request-type': 'remove-listing'})
                 self.send(msg)
                 room['listed'] = False
@@ -297,20 +361,25 @@ class HouseAgent(MASAgent):
         setup of the house agent, initialization of defined behaviours
         """
         print("HouseAgent: HouseAgent started")
+        self.attractiveness = self.rng.uniform(0, 1)
 
-        template = create_template("inform", {"inform-type": "room_application"})
+        template = self.sim.template("inform", {"inform-type": "room_application"})
         self.add_behaviour(self.ReceiveRoomApplications(), template)
 
-        template = create_template("accept-proposal")
+        template = self.sim.template("accept-proposal")
         self.add_behaviour(self.ReceiveAcceptedProposal(), template)
 
-        template = create_template("cancel-application")
+        template = self.sim.template("cancel-application")
         self.add_behaviour(self.ReceiveCancelApplication(), template)
 
-        template = create_template("request", {"request-type": "house-score"})
+        template = self.sim.template("request", {"request-type": "house-score"})
         self.add_behaviour(self.ReceiveHouseScore(), template)
 
-        template = create_template("request", {"request-type": "contract-end"})
+        template = self.sim.template("request", {"request-type": "contract-end"})
         self.add_behaviour(self.ReceiveContractEnd(), template)
 
-        self.add_behaviour(self.HouseUpdate())
+        # the countdowns of the rooms are derived from the tick of the room table, which wakes the HouseUpdate up
+        self.sim.add_clock(self.room_table)
+        self.house_update = self.HouseUpdate()
+        self.room_table.updates[self.number] = self.house_update
+        self.add_behaviour(self.house_update)
@@ -1,5 +1,151 @@
+import json
+import numpy as np
+
+import src.utils.constants as const
 from src.agents.agent import MASReceivingBehaviour, MASAgent
 from src.utils.messages import *
+from src.utils.payloads import Listing, ListingQuery, ListingResults, RoomReference
+
+
+class ListingIndex:
+    """
+    NumPy index over the open listings, kept in the insertion order of the listings dict,
+    removed listings leave a dead slot until the index is compacted
+    """
+
+    def __init__(self, capacity=64):
+        self.slots = {}
+        self.listings = np.empty(capacity, dtype=object)
+        self.size = 0
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.attractiveness = np.zeros(capacity)
+        self.accept_internationals = np.zeros(capacity, dtype=bool)
+        self.house_scores = np.zeros((capacity, 5))
+        self.has_score = np.zeros(capacity, dtype=bool)
+
+    def grow(self):
+        """
+        function to double the capacity of the index arrays
+        """
+        for name in ('listings', 'alive', 'attractiveness', 'accept_internationals', 'house_scores', 'has_score'):
+            array = getattr(self, name)
+            grown = np.zeros((2 * len(array),) + array.shape[1:], dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+
+    def add(self, listing):
+        """
+        function to add a listing, a listing with a known id is replaced in place (like in a dict)
+        :param listing: listing to be added
+        """
+        slot = self.slots.get(listing['id'])
+        if slot is None:
+            if self.size == len(self.alive):
+                self.grow()
+            slot = self.size
+            self.size += 1
+            self.slots[listing['id']] = slot
+        self.listings[slot] = listing
+        self.alive[slot] = True
+        self.attractiveness[slot] = listing['attractiveness']
+        self.accept_internationals[slot] = listing['accept_internationals']
+        self.has_score[slot] = listing['house_score'] is not None
+        self.house_scores[slot] = listing['house_score'] if listing['house_score'] is not None else 0
+
+    def remove(self, room_id):
+        """
+        function to remove a listing, compacts the index once most of its slots are dead
+        :param room_id: id of the listed room
+        """
+        slot = self.slots.pop(room_id)
+        self.listings[slot] = None
+        self.alive[slot] = False
+        if self.size > 64 and len(self.slots) < self.size / 2:
+            listings = self.listings[:self.size][self.alive[:self.size]]
+            self.__init__(len(self.alive))
+            for listing in listings:
+                self.add(listing)
+
+    def top_k(self, personality_vector, international, k=None, min_compatibility=None, min_attractiveness=None):
+        """
+        function to rank the open listings for a student,
+        by attractiveness + compatibility with the house-score (0 for empty houses), ties keep the listing order
+        :param personality_vector: personality vector of the student
+        :param international: only listings that accept internationals are considered for international students
+        :param k: number of listings to return, defaults to the top half (total / 2 + 1)
+        :param min_compatibility: only consider listings with a higher compatibility
+        :param min_attractiveness: only consider listings with at least this attractiveness
+        :return: read-only array of the k best listings and the number of listings that were considered
+        """
+        size = self.size
+        candidates = self.alive[:size].copy()
+        if international:
+            candidates &= self.accept_internationals[:size]
+
+        compatibility = const.calculate_dist_matrix([personality_vector], self.house_scores[:size])[0]
+        compatibility[~self.has_score[:size]] = 0
+        if min_compatibility is not None:
+            candidates &= compatibility > min_compatibility
+        if min_attractiveness is not None:
+            candidates &= self.attractiveness[:size] >= min_attractiveness
+
+        candidates = np.flatnonzero(candidates)
+        scores = self.attractiveness[candidates] + compatibility[candidates]
+        ranked = candidates[np.argsort(-scores, kind='stable')]
+
+        total = len(ranked)
+        if k is None:
+            k = int(total / 2) + 1
+        listings = self.listings[ranked[:k]]
+        listings.flags.writeable = False
+        return listings, total
+
+    def top_k_batch(self, queries, block_size=256):
+        """
+        function to rank the open listings for many students at once (see top_k),
+        the compatibility of every student with every listing is computed as one matrix per block of students,
+        which is ranked with one sort, the listings that are not considered sort last with a score of -inf
+        :param queries: list of listing queries
+        :param block_size: number of queries per compatibility matrix, bounds the memory use
+        :return: list of (read-only array of the k best listings, number of listings considered) per query
+        """
+        size = self.size
+        results = []
+        for start in range(0, len(queries), block_size):
+            block = queries[start:start + block_size]
+            international = np.array([query['international'] for query in block], dtype=bool)
+            min_compatibility = np.array([-np.inf if query['min_compatibility'] is None
+                                          else query['min_compatibility'] for query in block])
+            min_attractiveness = np.array([-np.inf if query['min_attractiveness'] is None
+                                           else query['min_attractiveness'] for query in block])
+
+            compatibility = const.calculate_dist_matrix([query['personality_vector'] for query in block],
+                                                        self.house_scores[:size])
+            compatibility[:, ~self.has_score[:size]] = 0
+
+            candidates = self.alive[:size] & (self.accept_internationals[:size] | ~international[:, np.newaxis])
+            candidates &= compatibility > min_compatibility[:, np.newaxis]
+            candidates &= self.attractiveness[:size] >= min_attractiveness[:, np.newaxis]
+
+            scores = self.attractiveness[:size] + compatibility
+            scores[~candidates] = -np.inf
+            # the unstable sort is much faster, only the rows in which two considered listings have the same score
+            # are sorted again with a stable sort, to keep the listing order
+            keys = -scores
+            ranked = np.argsort(keys, axis=1)
+            ordered = np.take_along_axis(keys, ranked, axis=1)
+            ties = np.flatnonzero(((ordered[:, 1:] == ordered[:, :-1]) & np.isfinite(ordered[:, 1:])).any(axis=1))
+            if len(ties):
+                ranked[ties] = np.argsort(keys[ties], axis=1, kind='stable')
+
+            totals = candidates.sum(axis=1)
+            ks = np.array([query['k'] if query['k'] is not None else -1 for query in block])
+            ks = np.minimum(np.where(ks < 0, totals // 2 + 1, ks), totals)
+            for row, total, k in zip(ranked, totals.tolist(), ks.tolist()):
+                listings = self.listings[row[:k]]
+                listings.flags.writeable = False
+                results.append((listings, total))
+        return results
 
 
 class ListingAgent(MASAgent):
@@ -7,7 +153,57 @@ class ListingAgent(MASAgent):
     ListingAgent class, extends general MASAgent
     """
 
-    listings = {}
+    # messages (request- or inform-type) that change the listings, in a sharded run every shard keeps a replica
+    # of the listings, these messages are sent to all replicas and every replica answers the queries of its shard
+    UPDATES = ('listing', 'remove-listing')
+
+    def __init__(self, jid):
+        super().__init__(jid)
+        self.listings = {}
+        self.index = ListingIndex()
+        self.version = 0
+        self.snapshot_version = None
+        self.snapshot = None
+        self.encoded_snapshot = None
+        self.snapshot_hits = 0
+        self.snapshot_misses = 0
+
+    def listing_snapshot(self, encoded=False):
+        """
+        function to get the snapshot of all open listings, built once per version of the listings
+        and shared by all requests of that version,
+        only full-listing requests (ReceiveListingRequest) use it, the listing queries of the students are ranked
+        on the index, which is updated with every listing
+        :param encoded: return the JSON-encoded snapshot (for external transports)
+        :return: tuple of listings or its JSON string
+        """
+        if self.snapshot_version == self.version:
+            self.snapshot_hits += 1
+        else:
+            self.snapshot_misses += 1
+            self.snapshot = tuple(self.listings.values())
+            self.encoded_snapshot = None
+            self.snapshot_version = self.version
+
+        if not encoded:
+            return self.snapshot
+        if self.encoded_snapshot is None:
+            self.encoded_snapshot = json.dumps(self.snapshot)
+        return self.encoded_snapshot
+
+    def cache_stats(self):
+        """
+        function to report the listing snapshot cache
+        :return: dict with the current version and the hits and misses of the run
+        """
+        return {'version': self.version, 'hits': self.snapshot_hits, 'misses': self.snapshot_misses}
+
+    def top_k(self, personality_vector, international, k=None, min_compatibility=None, min_attractiveness=None):
+        """
+        function to query the best listings for a student (see ListingIndex.top_k)
+        :return: read-only array of the k best listings and the number of listings that were considered
+        """
+        return self.index.top_k(personality_vector, international, k, min_compatibility, min_attractiveness)
 
     class ReceiveListingRequest(MASReceivingBehaviour):
         """
@@ -15,27 +211,64 @@ class ListingAgent(MASAgent):
         responds with up-to date room listings
         """
         def run(self, received_msg):
-            msg = create_message(str(received_msg.sender), "inform", json.dumps(list(self.agent.listings.values())),
-                                 {'inform-type': 'listing'})
+            # listings are immutable, so the snapshot can be shared by reference
+            snapshot = self.agent.listing_snapshot(encoded=const.MESSAGE_TRANSPORT != const.INTERNAL)
+            msg = create_message(str(received_msg.sender), "inform", snapshot, {'inform-type': 'listing'})
             self.send(msg)
 
+    class ReceiveListingQuery(MASReceivingBehaviour):
+        """
+        handles incoming queries for the best listings of a student
+        responds with the top-k listings and the number of listings that matched the query
+        """
+        def run(self, received_msg):
+            query = read_body(received_msg, ListingQuery)
+            listings, total = self.agent.top_k(query['personality_vector'], query['international'], query['k'],
+                                               query['min_compatibility'], query['min_attractiveness'])
+            msg = create_message(str(received_msg.sender), "inform", ListingResults(listings=listings, total=total),
+                                 {'inform-type': 'listing-results'})
+            self.send(msg)
+
+        @classmethod
+        def run_batch(cls, deliveries):
+            """
+            function to answer all queries of a delivery round with one compatibility matrix (queued delivery)
+            :param deliveries: list of (behaviour, message) tuples
+            """
+            queries = {}
+            for behaviour, received_msg in deliveries:
+                queries.setdefault(behaviour, []).append(received_msg)
+            for behaviour, received_msgs in queries.items():
+                if behaviour.removed:
+                    continue
+                results = behaviour.agent.index.top_k_batch([read_body(received_msg, ListingQuery)
+                                                             for received_msg in received_msgs])
+                for received_msg, (listings, total) in zip(received_msgs, results):
+                    msg = create_message(str(received_msg.sender), "inform",
+                                         ListingResults(listings=listings, total=total),
+                                         {'inform-type': 'listing-results'})
+                    behaviour.send(msg)
+
     class ReceiveListingRemovalRequest(MASReceivingBehaviour):
         """
         handles requests to remove listings
         """
         def run(self, received_msg):
-            room_id = json.loads(received_msg.body)['room_id']
+            room_id = read_body(received_msg, RoomReference)['room_id']
             if room_id in self.agent.listings.keys():
                 del self.agent.listings[room_id]
+                self.agent.index.remove(room_id)
+                self.agent.version += 1
 
     class ReceiveListing(MASReceivingBehaviour):
         """
         handles incoming new listings, addsa them to list
         """
         def run(self, received_msg):
-            received_listing = json.loads(received_msg.body)
-            received_listing['house_jid'] = str(received_msg.sender)
+            received_listing = read_body(received_msg, Listing).replace(house_jid=str(received_msg.sender))
             self.agent.listings[received_listing['id']] = received_listing
+            self.agent.index.add(received_listing)
+            self.agent.version += 1
 
     def setup(self):
         """
@@ -43,11 +276,14 @@ class ListingAgent(MASAgent):
         :return:
         """
         print("ListingAgent: ListingAgent started")
-        template = create_template("request", {"request-type": "listings"})
+        template = self.sim.template("request", {"request-type": "listings"})
         self.add_behaviour(self.ReceiveListingRequest(), template)
 
-        template = create_template("inform", {"inform-type": "listing"})
+        template = self.sim.template("request", {"request-type": "listing-query"})
+        self.add_behaviour(self.ReceiveListingQuery(), template)
+
+        template = self.sim.template("inform", {"inform-type": "listing"})
         self.add_behaviour(self.ReceiveListing(), template)
 
-        template = create_template("request", {"request-type": "remove-listing"})
+        template = self.sim.template("request", {"request-type": "remove-listing"})
         self.add_behaviour(self.ReceiveListingRemovalRequest(), template)
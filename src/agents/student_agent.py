@@ -1,30 +1,47 @@
-import random
-import json
 import numpy as np
 
 from src.agents.agent import MASAgent, MASPeriodicBehaviour, MASReceivingBehaviour
-from src.utils.messages import create_message, create_template
+from src.utils.messages import create_message, read_body
+from src.utils.population import PopulationField, PopulationHouse, PopulationQuestionnaire
+from src.utils.payloads import Questionnaire, ListingQuery, ListingResults, Application, ContractProposal, \
+    RoomReference, StudentReference, HouseScore
 import src.utils.constants as const
 
-# currently unused (for visualization)
-student_moving = {'from': [],
-                  'to': []}
-
 
 class StudentAgent(MASAgent):
     """
     StudentAgent class, extends MASAgent
+    with a population store, the student is a view on its row of the store (see utils/population.py),
+    only the house-score and the applied rooms stay in the instance
     """
 
-    def __init__(self, jid, password, start_delay, is_international, is_female, sim):
+    start_delay = PopulationField('start_delay')
+    waiting_time = PopulationField('waiting_time')
+    total_waiting_time = PopulationField('total_waiting_time')
+    num_applications = PopulationField('num_applications')
+    num_rooms_obtained = PopulationField('num_rooms_obtained')
+    moved_in_tick = PopulationField('moved_in_tick')
+    started = PopulationField('started')
+    has_room = PopulationField('has_room')
+    is_searching = PopulationField('is_searching')
+    contract_almost_ends = PopulationField('contract_almost_ends')
+    has_applied = PopulationField('has_applied')
+    house_attractiveness = PopulationField('house_attractiveness')
+    house_compatibility = PopulationField('house_compatibility')
+    house_jid = PopulationHouse()
+    questionnaire = PopulationQuestionnaire()
+
+    def __init__(self, jid, password, start_delay, is_international, is_female, sim, population=None):
         super().__init__(jid)
+        self.population = population
+        self.row = population.add() if population is not None else None
 
         self.start_delay = start_delay
         self.waiting_time = 0
         self.total_waiting_time = 0
         self.num_applications = 0
         self.num_rooms_obtained = 0
-        self.ticks_in_current_room = 0
+        self.moved_in_tick = 0
         self.started = False
         self.has_room = False
         self.is_searching = True
@@ -37,11 +54,9 @@ class StudentAgent(MASAgent):
         self.applied_rooms = [
 
         ]
-        self.questionnaire = {
-            'personality_vector': [],
-            'international': is_international,
-            'is_female': is_female
-        }
+        self.questionnaire = Questionnaire(personality_vector=(),
+                                           international=is_international,
+                                           is_female=is_female)
         self.sim = sim
 
     class RequestRoomListing(MASPeriodicBehaviour):
@@ -50,19 +65,28 @@ class StudentAgent(MASAgent):
         """
         def run(self):
             if self.agent.has_room:
-                self.agent.ticks_in_current_room += 1
-                if self.agent.ticks_in_current_room > const.DEFAULT_RENT_PERIOD / 2 and (self.agent.ticks_in_current_room % const.CHECK_COMP_EVERY_X == 0):
-                    msg = create_message(self.agent.house_jid, "request", {"student_jid": self.agent.identifier},
+                ticks_in_current_room = self.agent.ticks_in_current_room
+                if ticks_in_current_room > const.DEFAULT_RENT_PERIOD / 2 and \
+                        (ticks_in_current_room % const.CHECK_COMP_EVERY_X == 0):
+                    msg = create_message(self.agent.house_jid, "request",
+                                         StudentReference(student_jid=self.agent.identifier),
                                          {'request-type': 'house-score'})
                     self.send(msg)
+                # nothing to do until the next check, the contract messages wake the student up
+                self.sleep_until(self.agent.next_compatibility_check())
                 return
             if not self.agent.is_searching:
                 return
+            # delay start of agent, students only query listings once they started
+            if self.agent.sim.ticks_passed <= self.agent.start_delay:
+                self.agent.started = False
+                self.sleep_until(self.agent.start_delay + 1)
+                return
             if not self.agent.has_applied:
                 msg = create_message("listing_agent@localhost",
                                      "request",
-                                     "Do you have rooms available?",
-                                     {"request-type": "listings"})
+                                     self.agent.listing_query(),
+                                     {"request-type": "listing-query"})
                 self.send(msg)
 
             if self.agent.started:
@@ -74,16 +98,21 @@ class StudentAgent(MASAgent):
         handles incoming contract proposals
         """
         def run(self, received_msg):
-            proposal = json.loads(received_msg.body)
-            proposal['questionnaire'] = self.agent.questionnaire
+            proposal = read_body(received_msg, ContractProposal).replace(questionnaire=self.agent.questionnaire)
 
             if self.agent.has_room:
-                msg = create_message(self.agent.house_jid, "request", {"student_jid": self.agent.identifier},
+                msg = create_message(self.agent.house_jid, "request",
+                                     StudentReference(student_jid=self.agent.identifier),
                                      {'request-type': 'contract-end'})
                 self.send(msg)
+                # the warning of the old contract is not needed anymore
+                for behaviour in list(self.agent.behaviours):
+                    if isinstance(behaviour, self.ReceiveAlmostContractEnd) and \
+                            behaviour.house_jid == self.agent.house_jid:
+                        behaviour.kill()
 
-            student_moving['from'].append(self.agent.house_jid)
-            student_moving['to'].append(proposal['house_jid'])
+            self.agent.sim.student_moving['from'].append(self.agent.house_jid)
+            self.agent.sim.student_moving['to'].append(proposal['house_jid'])
 
             # accept contract proposal
             msg = create_message(str(received_msg.sender), "accept-proposal", proposal)
@@ -93,38 +122,49 @@ class StudentAgent(MASAgent):
             self.agent.house_jid = proposal['house_jid']
             self.agent.house_attractiveness = proposal['house_attractiveness']
             self.agent.has_applied = False
-            self.agent.ticks_in_current_room = 0
+            self.agent.moved_in_tick = self.agent.sim.ticks_passed
+            # the next compatibility check depends on the tick of the move
+            self.agent.wake()
 
-            msg = create_message(self.agent.house_jid, "request", {"student_jid": self.agent.identifier},
+            msg = create_message(self.agent.house_jid, "request", StudentReference(student_jid=self.agent.identifier),
                                  {'request-type': 'house-score'})
             self.send(msg)
 
             # cancel other applications
             for (house, room_id) in self.agent.applied_rooms:
-                if proposal['room_id'] is room_id:
+                if proposal['room_id'] == room_id:
                     continue
-                msg = create_message(house, "cancel-application", {'room_id': room_id})
+                msg = create_message(house, "cancel-application", RoomReference(room_id=room_id))
                 self.send(msg)
             self.agent.applied_rooms = []
 
             self.agent.num_rooms_obtained += 1
-            template = create_template("inform", {"inform-type": "contract-ended"})
-            self.agent.add_behaviour(self.ReceiveContractEnd(), template)
+            template = self.agent.sim.template("inform", {"inform-type": "contract-ended"})
+            self.agent.add_behaviour(self.ReceiveContractEnd(proposal['house_jid']), template)
 
-            template = create_template("inform", {"inform-type": "contract-almost-ends"})
-            self.agent.add_behaviour(self.ReceiveAlmostContractEnd(), template)
+            template = self.agent.sim.template("inform", {"inform-type": "contract-almost-ends"})
+            self.agent.add_behaviour(self.ReceiveAlmostContractEnd(proposal['house_jid']), template)
 
         class ReceiveContractEnd(MASReceivingBehaviour):
             """
             handles incoming notice that rental contract has ended,
             updates own values accordingly
             """
+            def __init__(self, house_jid):
+                super().__init__()
+                self.house_jid = house_jid
+
             def run(self, received_msg):
-                self.agent.has_room = False
-                self.agent.is_searching = True
-                self.agent.has_applied = False
-                self.agent.waiting_time = 0
-                self.agent.contract_almost_ends = False
+                if str(received_msg.sender) != self.house_jid:
+                    return  # notice of another contract
+                # with queued delivery, the notice can arrive after the student moved on
+                if self.agent.house_jid == self.house_jid:
+                    self.agent.has_room = False
+                    self.agent.is_searching = True
+                    self.agent.has_applied = False
+                    self.agent.waiting_time = 0
+                    self.agent.contract_almost_ends = False
+                    self.agent.wake()
                 self.kill()
 
         class ReceiveAlmostContractEnd(MASReceivingBehaviour):
@@ -132,9 +172,17 @@ class StudentAgent(MASAgent):
             handles incoming notice that rental contract nears end,
             prompts student to start searching for new accommodation
             """
+            def __init__(self, house_jid):
+                super().__init__()
+                self.house_jid = house_jid
+
             def run(self, received_msg):
-                self.agent.is_searching = True
-                self.agent.contract_almost_ends = True
+                if str(received_msg.sender) != self.house_jid:
+                    return  # notice of another contract
+                if self.agent.house_jid == self.house_jid:
+                    self.agent.is_searching = True
+                    self.agent.contract_almost_ends = True
+                    self.agent.wake()
                 self.kill()
 
     class ReceiveApplicationRejection(MASReceivingBehaviour):
@@ -143,8 +191,10 @@ class StudentAgent(MASAgent):
         """
         def run(self, received_msg):
             self.agent.has_applied = False
-            received_rejection = json.loads(received_msg.body)
-            self.agent.applied_rooms.remove((str(received_msg.sender), received_rejection['room_id']))
+            received_rejection = read_body(received_msg, RoomReference)
+            # with queued delivery, the applications can already be cancelled by an accepted proposal
+            if (str(received_msg.sender), received_rejection['room_id']) in self.agent.applied_rooms:
+                self.agent.applied_rooms.remove((str(received_msg.sender), received_rejection['room_id']))
 
     class ReceiveHouseScore(MASReceivingBehaviour):
         """
@@ -152,7 +202,9 @@ class StudentAgent(MASAgent):
         if below threshold, start searching for new room
         """
         def run(self, received_msg):
-            proposal = json.loads(received_msg.body)
+            if str(received_msg.sender) != self.agent.house_jid:
+                return  # score of a house the student already moved out of
+            proposal = read_body(received_msg, HouseScore)
             self.agent.house_score = proposal['house_score']
             compatibility = const.calculate_dist(self.agent.questionnaire['personality_vector'], self.agent.house_score)
 
@@ -163,20 +215,10 @@ class StudentAgent(MASAgent):
 
     class ReceiveRoomListings(MASReceivingBehaviour):
         """
-        class to handle requested listings
+        class to handle requested listings,
+        the listing agent ranks the listings (see StudentAgent.listing_query) and sends the top half
         """
 
-        def calc_compatibility(self, pers_vector, house_score):
-            """
-            function to calculate matching score with listed house
-            :param pers_vector: student personality
-            :param house_score: averaged house personality
-            :return: calculated score
-            """
-            if house_score is not None:
-                return const.calculate_dist(pers_vector, house_score)
-            return 0
-
         def run(self, received_msg):
 
             # delay start of agent
@@ -187,44 +229,63 @@ class StudentAgent(MASAgent):
             self.agent.started = True
             if not self.agent.is_searching:
                 return
-            received_listings = json.loads(received_msg.body)
-
-            # currently unused, only apply to suitable houses (nationality)
-            if self.agent.questionnaire['international']:
-                received_listings = list(
-                    filter(lambda listing: listing['accept_internationals'], received_listings))
-
-            received_listings.sort(reverse=True, key=lambda listing: listing['attractiveness'] +
-                                                                     self.calc_compatibility(
-                                                                         self.agent.questionnaire['personality_vector'],
-                                                                         listing["house_score"]))
-
-            # do not move to less attractive house
-            if self.agent.has_room and self.agent.is_searching and not self.agent.contract_almost_ends:
-                received_listings = list(
-                    filter(lambda listing: self.calc_compatibility(self.agent.questionnaire['personality_vector'],
-                                                                   listing["house_score"]) > .96 and listing[
-                                               'attractiveness'] >= self.agent.house_attractiveness + .05,
-                           received_listings))
-
-            # apply to houses/rooms
+            results = read_body(received_msg, ListingResults)
+            received_listings = results['listings']
+
+            # apply to houses/rooms, picked from the top half of all matching listings
             applications_done = 0
-            while applications_done < 3 and len(self.agent.applied_rooms) < 10 and len(received_listings) > 0:
+            while applications_done < 3 and len(self.agent.applied_rooms) < 10 and results['total'] > 0:
                 applications_done += 1
-                room_nr = random.randint(0, int(len(received_listings) / 2))
+                room_nr = self.agent.rng.integers(0, int(results['total'] / 2), endpoint=True)
                 room = received_listings[room_nr]
-                application = {"id": room["id"],
-                               "housing_method": room["housing_method"],
-                               "questionnaire": self.agent.questionnaire,
-                               "waiting_time": self.agent.waiting_time}
+                application = Application(id=room["id"],
+                                          housing_method=room["housing_method"],
+                                          questionnaire=self.agent.questionnaire,
+                                          waiting_time=self.agent.waiting_time)
 
-                msg = create_message(room["house_jid"], "inform", json.dumps(application),
+                msg = create_message(room["house_jid"], "inform", application,
                                      {'inform-type': 'room_application'})
                 self.agent.num_applications += 1
                 self.agent.has_applied = True
                 self.agent.applied_rooms.append((room["house_jid"], room["id"]))
                 self.send(msg)
 
+    @property
+    def ticks_in_current_room(self):
+        """
+        number of ticks since the student moved into the current room, derived from the tick of the move
+        """
+        return self.sim.ticks_passed - self.moved_in_tick
+
+    def next_compatibility_check(self):
+        """
+        function to find the next tick in which a housed student checks the compatibility with its house,
+        every CHECK_COMP_EVERY_X ticks once more than half of the rent period passed
+        :return: tick of the next check
+        """
+        ticks = max(self.ticks_in_current_room + 1, int(const.DEFAULT_RENT_PERIOD / 2) + 1)
+        ticks += -ticks % const.CHECK_COMP_EVERY_X
+        return self.moved_in_tick + ticks
+
+    def listing_query(self):
+        """
+        function to build the query for the listings the student is interested in:
+            listings are ranked by attractiveness + compatibility with the house-score,
+            international students only consider houses that accept internationals,
+            students that have a room do not move to a less attractive or less compatible house
+        :return: listing query
+        """
+        min_compatibility = None
+        min_attractiveness = None
+        if self.has_room and self.is_searching and not self.contract_almost_ends:
+            min_compatibility = .96
+            min_attractiveness = self.house_attractiveness + .05
+        questionnaire = self.questionnaire
+        return ListingQuery(personality_vector=questionnaire['personality_vector'],
+                            international=questionnaire['international'],
+                            min_compatibility=min_compatibility,
+                            min_attractiveness=min_attractiveness)
+
     def setup(self):
         """
         setup of student agent, add defined behaviours
@@ -238,14 +299,15 @@ class StudentAgent(MASAgent):
         # Neuroticism(M: 48.61 SD: 9.71)
         # Openness(M: 49.94 SD: 9.21)
 
-        num_samples = 1
         desired_means = [49.75, 46.08, 43.91, 48.61, 49.94]
         desired_std_dev = [9.22, 8.77, 10.9, 9.71, 9.21]
 
+        personality_vector = []
         for i in range(5):
-            samples = np.random.normal(loc=0.0, scale=desired_std_dev[i], size=1)
+            samples = self.rng.normal(loc=0.0, scale=desired_std_dev[i], size=1)
             final_samples = samples + desired_means[i]
-            self.questionnaire['personality_vector'].append(final_samples[0] / 100)
+            personality_vector.append(final_samples[0] / 100)
+        self.questionnaire = self.questionnaire.replace(personality_vector=tuple(personality_vector))
 
         self.started = True
         self.has_room = False
@@ -256,14 +318,14 @@ class StudentAgent(MASAgent):
 
         self.add_behaviour(self.RequestRoomListing())
 
-        template = create_template("inform", {"inform-type": "listing"})
+        template = self.sim.template("inform", {"inform-type": "listing-results"})
         self.add_behaviour(self.ReceiveRoomListings(), template)
 
-        template = create_template("propose", {"propose-type": "room-contract"})
+        template = self.sim.template("propose", {"propose-type": "room-contract"})
         self.add_behaviour(self.ReceiveRoomContractProposal(), template)
 
-        template = create_template("inform", {"inform-type": "application-rejection"})
+        template = self.sim.template("inform", {"inform-type": "application-rejection"})
         self.add_behaviour(self.ReceiveApplicationRejection(), template)
 
-        template = create_template("inform", {"inform-type": "house-score"})
+        template = self.sim.template("inform", {"inform-type": "house-score"})
         self.add_behaviour(self.ReceiveHouseScore(), template)
@@ -1,13 +1,9 @@
-from matplotlib import pyplot as plt
 import src.utils.constants as const
-import json
-import time
 import numpy as np
-from PIL import Image
 
 from src.agents.agent import MASAgent, MASPeriodicBehaviour
-
-imgs = []
+from src.utils.rooms import HOUSING_METHODS
+from src.utils.trace import TraceWriter
 
 
 class VisualizeAgent(MASAgent):
@@ -17,97 +13,13 @@ class VisualizeAgent(MASAgent):
     """
     class Visualize(MASPeriodicBehaviour):
         def run(self):
-            students = self.agent.students
-            houses = self.agent.houses
-
-            student_data = []
-            house_data = []
-            time_t = time.time()
-
-            # Create a 1024x1024x3 array of 8 bit unsigned integers
-            im = Image.new('RGB', (len(students) + 10, 50))
-
-            i = 0
-            for student in students:
-                if student.started:
-                    color = (255, 0, 0) if student.questionnaire['international'] else (0, 255, 0)
-                    if not student.has_room:
-                        color = (int(color[0] / 3), int(color[1] / 3), int(color[2] / 3))
-                    im.putpixel((i, 5), color)
-
-                    # (255, 255, 255) - white - International and a room
-                    # (255, 0, 255) - purple - Non-internation and a room
-                    # (255, 0, 0) - red - Non-internation and a room
-                i += 1
-                serialized_data = {
-                    "wt": student.waiting_time,
-                    "s": student.started,
-                    "hr": student.has_room,
-                    "twt": student.total_waiting_time,
-                    "na": student.num_applications,
-                    "nro": student.num_rooms_obtained,
-                    "q": student.questionnaire
-                }
-                student_data.append(serialized_data)
-
-            i = 0
-            houses.sort(reverse=True, key=lambda h: h.attractiveness)
-
-            for house in houses:
-                rooms = []
-                i += 1
-                residents = 0
-                sum_avg_personality = [0] * 5
-
-                for room in house.rooms.values():
-                    color = (255, 255, 255) if room["resident_jid"] is not None else (100, 100, 100)
-                    if room["listed"]:
-                        color = (140, 140, 0)
-                    im.putpixel((i * 2, 10 + len(rooms)), color)
-                    serialized_data = {
-                        "id": room["id"],
-                        "q": room["questionnaire"]
-                    }
-                    rooms.append(serialized_data)
+            tick = self.agent.sim.ticks_passed
+            if self.agent.trace is None:
+                self.agent.open_trace()
 
-                    if room["questionnaire"] is None:
-                        continue
-
-                    sum_avg_personality = np.add(sum_avg_personality, room["questionnaire"]['personality_vector'])
-                    residents += 1
-
-                house_matching_score = const.calculate_house_matching_score(house)
-                avg_personality = None
-                if residents > 0:
-                    avg_personality = np.true_divide(sum_avg_personality, residents).tolist()
-
-                house_data.append({
-                    'ms': house_matching_score,
-                    'at': house.appl_type,
-                    'a': house.attractiveness,
-                    'ai': house.accept_internationals,
-                    'avg_p': avg_personality})
-
-            imgs.append(im)
-
-            # with open('test.png', 'wb') as f:
-            #     im.save(f)
-            #     f.close()
-
-            if self.agent.sim.ticks_passed % const.SAVE_DATA_EVERY_X == 0 and self.agent.sim.ticks_passed >= const.WARM_UP_TICKS:
-                with open("data-" + self.agent.sim.id + ".json", 'a+') as f:
-                    tick = self.agent.sim.ticks_passed
-                    if tick == const.WARM_UP_TICKS:
-                        f.write("[")
-                    # indent=2 is not needed but makes the file human-readable
-                    json.dump({'tick': tick, 'students': student_data, 'houses': house_data}, f, indent=2)
-                    if tick == const.SIMULATION_DURATION:
-                        f.write("]")
-                        with open('data-' + self.agent.sim.id + '.gif', 'wb') as f:
-                            im.save(f, save_all=True, append_images=imgs, optimize=False, duration=100, loop=0)
-                            f.close()
-                    else:
-                        f.write(",")
+            # the last tick is recorded once it ended (see takedown)
+            if tick % const.SAVE_DATA_EVERY_X == 0 and const.WARM_UP_TICKS <= tick < self.agent.sim.config.duration:
+                self.agent.trace.write_tick(tick, self.agent.collect())
 
     def __init__(self, jid, password, sim, students, houses, list_agent):
         super().__init__(jid)
@@ -117,8 +29,78 @@ class VisualizeAgent(MASAgent):
         self.list_agent = list_agent
         self.sim = sim
         self.all_data = []
+        # trace of the recorded ticks (see utils/trace.py), opened in the first tick,
+        # the figures of the run are rendered from it afterwards (see render.py)
+        self.trace_path = "data-" + sim.id + ".trace"
+        self.trace = None
+        self.room_ids = None
+        self.student_index = None
+        # student number of the room table -> index in students
+        self.resident_index = np.zeros(0, dtype=np.int32)
+
+    def open_trace(self):
+        """
+        function to open the trace of the run and write the static columns:
+        the questionnaires of the students, the houses and the house of every room
+        the rooms are recorded in the order of the houses, and the residents as the index of the student
+        """
+        students = self.students
+        houses = self.houses
+        self.student_index = {student.identifier: i for i, student in enumerate(students)}
+        self.room_ids = np.array([room_id for house in houses for room_id in house.room_ids], dtype=np.intp)
+        questionnaires = [student.questionnaire for student in students]
+        static = {'personality': [questionnaire['personality_vector'] for questionnaire in questionnaires],
+                  'international': [questionnaire['international'] for questionnaire in questionnaires],
+                  'is_female': [questionnaire['is_female'] for questionnaire in questionnaires],
+                  'housing_method': [HOUSING_METHODS.index(house.appl_type) for house in houses],
+                  'attractiveness': [house.attractiveness for house in houses],
+                  'accept_internationals': [house.accept_internationals for house in houses],
+                  'house': np.repeat(np.arange(len(houses)), [len(house.room_ids) for house in houses])}
+        meta = {'id': self.sim.id, 'seed': self.sim.seed, 'config': self.sim.config.to_dict(),
+                'housing_methods': HOUSING_METHODS}
+        self.trace = TraceWriter(self.trace_path,
+                                 {'students': len(students), 'houses': len(houses), 'rooms': len(self.room_ids)},
+                                 static, meta)
+
+    def collect(self):
+        """
+        function to collect the raw state of the students and rooms of the current tick,
+        the matching scores of the houses are computed from it when the trace is read
+        :return: dict of the frame columns (see utils/trace.py)
+        """
+        students = self.students
+        table = self.sim.rooms
+
+        new_jids = table.student_jids[len(self.resident_index):]
+        if new_jids:
+            self.resident_index = np.append(self.resident_index,
+                                            [self.student_index.get(jid, -1) for jid in new_jids]).astype(np.int32)
+        numbers = table.rooms['resident'][self.room_ids]
+        resident = np.full(len(numbers), -1, dtype=np.int32)
+        occupied = numbers >= 0
+        resident[occupied] = self.resident_index[numbers[occupied]]
+
+        return {
+            'waiting_time': [student.waiting_time for student in students],
+            'started': [student.started for student in students],
+            'has_room': [student.has_room for student in students],
+            'total_waiting_time': [student.total_waiting_time for student in students],
+            'num_applications': [student.num_applications for student in students],
+            'num_rooms_obtained': [student.num_rooms_obtained for student in students],
+            'resident': resident,
+            'listed': table.rooms['listed'][self.room_ids]}
 
     def setup(self):
-        plt.axis()
         self.add_behaviour(self.Visualize())
 
+    def takedown(self):
+        """
+        function to record the end state of the run as its last tick and to close the trace,
+        the Visualize behaviour records the other ticks while the agents act, so only the last recorded tick
+        holds the state the summary of the run is built from (see runner.summarize)
+        """
+        if self.trace is None:
+            self.open_trace()
+        self.trace.write_tick(self.sim.ticks_passed, self.collect())
+        self.trace.close()
+
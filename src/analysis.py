@@ -0,0 +1,159 @@
+"""
+Vectorized analysis of recorded runs, on their memory-mapped traces (see MappedTrace in utils/trace.py):
+the statistics of the README tables (inter-house compatibility, waiting time per student and students that never
+find a room, at the last recorded tick) of many runs at once, averaged over the runs of every setup
+
+usage (from the repository root):
+    python -m src.analysis data-*.trace --workers 4 --output analysis.json
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from src.runner import aggregate
+from src.utils.trace import MappedTrace
+
+# recorded ticks per block of the queries over time, bounds the loaded rows
+CHUNK_TICKS = 64
+
+DISTRIBUTION_NAMES = ["Co-optation", "Waiting list", "Random assignment"]  # order of const.DISTR_METHODS
+
+
+def run_label(meta):
+    """
+    function to name the distribution of the housing methods of a run, e.g. "Co-optation" or
+    "50-50 (Co-optation, Random assignment)"
+    :param meta: metadata of the trace
+    :return: label of the run
+    """
+    shares = [(share, name) for share, name in zip(meta['config']['dist'], DISTRIBUTION_NAMES) if share > 0]
+    if len(shares) == 1:
+        return shares[0][1]
+    return "-".join(str(round(share * 100)) for share, _ in shares) + " (" + ", ".join(
+        name for _, name in shares) + ")"
+
+
+def summarize_state(trace, tick=None):
+    """
+    function to compute the statistics of the README tables from the recorded state of one tick,
+    the same statistics as runner.summarize_values, which the last recorded tick (the end state of the run,
+    see VisualizeAgent.takedown) matches
+    :param trace: MappedTrace
+    :param tick: recorded tick, defaults to the last recorded tick
+    :return: dict of the statistics
+    """
+    row = trace.tick_index(tick) if tick is not None else len(trace.ticks) - 1
+    columns = trace.columns
+    waiting_times = np.asarray(columns['total_waiting_time'][row])
+    scores = np.asarray(columns['matching_score'][row])
+    scores = scores[~np.isnan(scores)]
+    return {'housed': int(np.count_nonzero(columns['has_room'][row])),
+            'never_housed': int(np.count_nonzero(columns['num_rooms_obtained'][row] == 0)),
+            'mean_waiting_time': waiting_times.mean().item() if len(waiting_times) else None,
+            'std_waiting_time': waiting_times.std().item() if len(waiting_times) else None,
+            'mean_matching_score': scores.mean().item() if len(scores) else None,
+            'std_matching_score': scores.std().item() if len(scores) else None}
+
+
+def over_time(trace):
+    """
+    function to compute the searching and resident students and the mean and standard deviation of the matching
+    scores of the houses per recorded tick, CHUNK_TICKS ticks at a time
+    :param trace: MappedTrace
+    :return: dict of arrays, indexed like trace.ticks
+    """
+    columns = trace.columns
+    series = {'ticks': np.asarray(trace.ticks)}
+    parts = {'searching': [], 'resident': [], 'score_mean': [], 'score_std': []}
+    for start in range(0, len(trace.ticks), CHUNK_TICKS):
+        rows = slice(start, start + CHUNK_TICKS)
+        has_room = np.asarray(columns['has_room'][rows])
+        parts['searching'].append(np.count_nonzero(columns['started'][rows] & ~has_room, axis=1))
+        parts['resident'].append(np.count_nonzero(has_room, axis=1))
+        scores = np.asarray(columns['matching_score'][rows])
+        scored = ~np.isnan(scores)
+        counts = scored.sum(axis=1)
+        mean = np.where(scored, scores, 0).sum(axis=1) / np.maximum(counts, 1)
+        std = np.sqrt(np.where(scored, (scores - mean[:, np.newaxis]) ** 2, 0).sum(axis=1) / np.maximum(counts, 1))
+        parts['score_mean'].append(np.where(counts > 0, mean, np.nan))
+        parts['score_std'].append(np.where(counts > 0, std, np.nan))
+    for name, values in parts.items():
+        series[name] = np.concatenate(values) if values else np.zeros(0)
+    return series
+
+
+def summarize_trace(path):
+    """
+    function to summarize one recorded run, in the format of runner.run_replication
+    :param path: path of the trace file
+    :return: dict with the config (as dict), the seed and the summary of the run
+    """
+    trace = MappedTrace(path)
+    return {'config': trace.meta['config'], 'seed': trace.meta['seed'], 'summary': summarize_state(trace)}
+
+
+def analyze(paths, workers=None):
+    """
+    function to summarize many recorded runs on a process pool and to average them per setup
+    :param paths: paths of the trace files
+    :param workers: number of worker processes, defaults to the number of CPUs
+    :return: list of run summaries (in the order of the paths), list of averaged setups (see runner.aggregate)
+    """
+    workers = max(1, min(workers or os.cpu_count() or 1, len(paths)))
+    if workers == 1:
+        runs = [summarize_trace(path) for path in paths]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            runs = list(pool.map(summarize_trace, paths))
+    return runs, aggregate(runs)
+
+
+def readme_tables(aggregated):
+    """
+    function to format the averaged setups as the tables of the README, a row per distribution and a column
+    per number of houses
+    :param aggregated: list of averaged setups (see runner.aggregate)
+    :return: markdown of the three tables
+    """
+    houses = sorted({setup['config']['num_houses'] for setup in aggregated})
+    rows = {}
+    for setup in aggregated:
+        label = run_label({'config': setup['config']})
+        rows.setdefault(label, {})[setup['config']['num_houses']] = setup['mean']
+
+    def table(title, cell):
+        lines = ["#### " + title, "",
+                 "| **Distribution**        | " + " | ".join("**" + str(h) + " Houses**" for h in houses) + " |",
+                 "|--------------|" + "|".join("-----------" for _ in houses) + "|"]
+        for label, means in rows.items():
+            lines.append("|" + label + " | " + " | ".join(cell(means[h]) if h in means else "-" for h in houses) +
+                         " |")
+        return "\n".join(lines)
+
+    def avg_std(name):
+        return lambda mean: "avg: {:.3f} std: {:.3f}".format(mean['mean_' + name], mean['std_' + name]) \
+            if mean['mean_' + name] is not None else "-"
+
+    return "\n\n".join([
+        table("Means of inter-house compatibility", avg_std('matching_score')),
+        table("Average waiting-time per student", avg_std('waiting_time')),
+        table("Number of students that do not find a room throughout simulation period",
+              lambda mean: "{:g}".format(mean['never_housed']))])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('traces', nargs='+', help="trace files of the runs")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', default=None, help="write the run summaries and the averages as JSON")
+    args = parser.parse_args()
+
+    runs, aggregated = analyze(args.traces, args.workers)
+    print(readme_tables(aggregated))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'runs': runs, 'aggregate': aggregated}, f, indent=2)
+        print("Results written to", args.output)
@@ -1,33 +1,46 @@
-from agents.student_agent import *
-from agents.listing_agent import *
-from agents.house_agent import *
-from agents.agent import MASSimulation
+from src.agents.student_agent import *
+from src.agents.listing_agent import *
+from src.agents.house_agent import *
+from src.agents.agent import MASSimulation
+from src.utils.config import SimulationConfig
+from src.utils.population import Population
+from src.utils.rooms import RoomTable
 
-from agents.visualize_agent import *
+from src.agents.visualize_agent import *
 
-students = []
-houses = []
 
-
-def setup_simulation(num_houses, num_students, percentage_accepting_international, percentage_international,
-                     percentage_female, dist):
+def setup_simulation(config=None, seed=None, shard=None):
     """
     Setup of the Multi-Agent simulation
 
-    :param num_houses: number of houses in simulation
-    :param num_students: number of students in simulation
-    :param percentage_accepting_international: percentage of houses that accept international students
-    :param percentage_international: percentage of international students (currently unused)
-    :param percentage_female: percentage of female students (currently unused)
-    :param dist: [const.COOP, const.WAIT_LIST, const.RAND]
-    list containing percentages of distribution methods (should add up to 1)
-    :return: set-up simulation containing running agents
+    :param config: SimulationConfig with
+        num_houses: number of houses in simulation
+        num_students: number of students in simulation
+        percentage_accepting_international: percentage of houses that accept international students
+        percentage_international: percentage of international students (currently unused)
+        percentage_female: percentage of female students (currently unused)
+        dist: [const.COOP, const.WAIT_LIST, const.RAND]
+        list containing percentages of distribution methods (should add up to 1)
+    defaults to the constants
+    :param seed: root seed of the random number streams (see MASSimulation.stream), drawn from the OS if None
+    :param shard: (index, number of shards) to set up only the agents of one shard of a sharded run
+        (see src/sharded.py), agent i of each kind belongs to shard i % number of shards;
+        the random numbers of all agents are drawn anyway, so every shard sets up the same world
+    :return: set-up simulation containing running agents (students and houses in sim.students and sim.houses)
     """
+    config = config if config is not None else SimulationConfig()
+    num_houses = config.num_houses
+    num_students = config.num_students
+    percentage_accepting_international = config.percentage_accepting_international
+    dist = config.dist
 
     # initialization
-    sim = MASSimulation()
-    max_internationals = int(num_students * percentage_international)
-    max_female = int(num_students * percentage_female)
+    sim = MASSimulation(config, seed)
+    rng = sim.stream("setup")
+    shard_index, shards = shard if shard is not None else (0, 1)
+    sim.population = Population(-(-num_students // shards)) if config.population_store else None
+    max_internationals = int(num_students * config.percentage_international)
+    max_female = int(num_students * config.percentage_female)
     num_internationals = 0
     num_females = 0
 
@@ -37,23 +50,30 @@ def setup_simulation(num_houses, num_students, percentage_accepting_internationa
         is_international = False
 
         if num_internationals < max_internationals:
-            if bool(random.getrandbits(1)):
+            if bool(rng.integers(2)):
                 is_international = True
                 num_internationals += 1
 
         if num_females < max_female:
-            if bool(random.getrandbits(1)):
+            if bool(rng.integers(2)):
                 is_female = True
                 num_females += 1
 
+        start_delay = int(rng.integers(0, const.DEFAULT_RENT_PERIOD, endpoint=True))
+        sim.owners["student" + str(i) + "@localhost"] = i % shards
+        if i % shards != shard_index:
+            continue
         student_agent = StudentAgent("student" + str(i) + "@localhost", "mas2021",
-                                     random.randint(0, const.DEFAULT_RENT_PERIOD),
+                                     start_delay,
                                      is_international,
                                      is_female,
-                                     sim)
-        students.append(student_agent)
+                                     sim,
+                                     sim.population)
+        sim.students.append(student_agent)
         sim.add_agent(student_agent)
 
+    # the rooms of all houses share one table, so that the room ids are unique across houses
+    sim.rooms = RoomTable()
     num_international_houses = 0
     houses_dist = [0, 0, 0]
     cur_meth = 0
@@ -65,11 +85,17 @@ def setup_simulation(num_houses, num_students, percentage_accepting_internationa
         houses_dist[cur_meth] += 1
 
         international = num_international_houses < percentage_accepting_international * num_houses
-        house_agent = HouseAgent("house" + str(i) + "@localhost", "mas2021", random.randint(3, 7), meths[cur_meth],
-                                 international)
+        num_rooms = int(rng.integers(3, 7, endpoint=True))
         if international:
             num_international_houses += 1
-        houses.append(house_agent)
+        sim.owners["house" + str(i) + "@localhost"] = i % shards
+        if i % shards != shard_index:
+            # the rooms of the houses of other shards keep the room ids unique across shards
+            sim.rooms.add_house(num_rooms, meths[cur_meth])
+            continue
+        house_agent = HouseAgent("house" + str(i) + "@localhost", "mas2021", num_rooms, meths[cur_meth],
+                                 international, sim.rooms)
+        sim.houses.append(house_agent)
         sim.add_agent(house_agent)
 
     # print setup to console and return simulation
@@ -81,25 +107,55 @@ def setup_simulation(num_houses, num_students, percentage_accepting_internationa
           "\nInternationals:", num_internationals,
           "\nFemale students:", num_females,
           "\nHouses: ", num_houses, "(", num_international_houses, "international )",
+          "\nSeed:", sim.seed,
           "\n********************************************************\n")
     return sim
 
 
 if __name__ == "__main__":
     """
-    Initialization of system and agents
+    Initialization of system and agents, or of a run restored from a checkpoint (--resume)
     """
+    import argparse
+    from src.utils.checkpoint import load_checkpoint
+
+    parser = argparse.ArgumentParser(description="Multi-agent student housing simulation, with the setup of "
+                                                 "utils/constants.py")
+    parser.add_argument('--resume', metavar='CHECKPOINT', default=None,
+                        help="continue the run of a checkpoint (data-<id>.checkpoint, see CHECKPOINT_EVERY)")
+    args = parser.parse_args()
+
+    if args.resume is not None:
+        # the checkpoint holds all agents, the instrumentation and the open trace of the run
+        sim = load_checkpoint(args.resume)
+        vis_agent = sim.all_agents["visualize_agent@localhost"]
+        print("Resuming run", sim.id, "after tick", sim.ticks_passed, "of", sim.config.duration)
+    else:
+        # create listing agent
+        list_agent = ListingAgent("listing_agent@localhost")
+
+        # start simulation, with the setup of utils/constants.py
+        sim = setup_simulation(SimulationConfig())
+
+        # add listing- an visualization-agent to system
+        sim.add_agent(list_agent)
+        vis_agent = VisualizeAgent("visualize_agent@localhost", "mas2021", sim, sim.students, sim.houses, list_agent)
+        sim.add_agent(vis_agent)
+
+        if const.INSTRUMENT:
+            sim.instrument()
+        if const.CHECKPOINT_EVERY:
+            sim.enable_checkpoints(const.CHECKPOINT_EVERY)
 
-    # create listing agent
-    list_agent = ListingAgent("listing_agent@localhost")
-
-    # start simulation
-    # num_houses, num_students, percentage_accepting_international, percentage_international, percentage_female
-    sim = setup_simulation(const.NUMBER_HOUSES, const.NUMBER_STUDENTS, .6, 0, .5, const.DISTR_METHODS)
+    sim.simulate()
 
-    # add listing- an visualization-agent to system
-    sim.add_agent(list_agent)
-    vis_agent = VisualizeAgent("visualize_agent@localhost", "mas2021", sim, students, houses, list_agent)
-    sim.add_agent(vis_agent)
+    instrumentation = sim.instrumentation
+    if instrumentation is not None:
+        instrumentation.write_csv("data-" + sim.id + "-ticks.csv")
+        instrumentation.write_summary("data-" + sim.id + "-summary.json")
+        print(instrumentation.report())
 
-    sim.simulate()
+    # the gif is rendered from the recorded trace, after the simulation (see src/render.py)
+    if const.RENDER_GIF:
+        from src.render import render_gif
+        render_gif(vis_agent.trace_path, "data-" + sim.id + ".gif")
@@ -0,0 +1,171 @@
+"""
+Offline rendering of the figures of recorded runs, from their traces (see utils/trace.py):
+the gif of a run, the distribution of searching/resident students over time and the average matching-score of
+all houses per simulation step (one line per run), so that no figure requires running the simulation again
+the frames of a gif are encoded in contiguous segments on a process pool, every worker reads its own ticks
+
+usage (from the repository root):
+    python -m src.render data-<id>.trace [data-<id>.trace ...] --output-dir visualization --workers 4
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from src.analysis import over_time, run_label
+from src.utils.frames import FrameLayout, GifEncoder, GIF_TRAILER
+from src.utils.trace import MappedTrace, TraceReader
+
+
+def frame_layout(trace):
+    """
+    function to compute the pixel layout of the gif frames from the static columns of a trace
+    :param trace: TraceReader
+    :return: FrameLayout
+    """
+    return FrameLayout(trace.static['international'], trace.static['attractiveness'], trace.static['house'])
+
+
+def render_frame(layout, columns):
+    return layout.render(columns['started'], columns['has_room'], columns['resident'], columns['listed'])
+
+
+def encode_segment(path, start, stop):
+    """
+    function to encode the gif frames of the recorded ticks start, ..., stop - 1 of a trace,
+    the first segment starts with the header of the gif, any other segment is drawn over the frame before it
+    :param path: path of the trace file
+    :param start: position of the first tick of the segment in the recorded ticks
+    :param stop: position after the last tick of the segment
+    :return: encoded frames
+    """
+    with TraceReader(path) as trace:
+        layout = frame_layout(trace)
+        ticks = trace.ticks
+        previous = render_frame(layout, trace.read_tick(ticks[start - 1])) if start > 0 else None
+        encoder = GifEncoder(previous=previous)
+        return b"".join(encoder.encode(render_frame(layout, trace.read_tick(tick))) for tick in ticks[start:stop])
+
+
+def render_gif(path, output, workers=None):
+    """
+    function to render the gif of a run, a frame per recorded tick
+    :param path: path of the trace file
+    :param output: path of the gif
+    :param workers: number of processes that encode the frames, defaults to the number of CPUs
+    """
+    with TraceReader(path) as trace:
+        num_ticks = len(trace.ticks)
+    workers = max(1, min(workers or os.cpu_count() or 1, num_ticks))
+    bounds = np.linspace(0, num_ticks, workers + 1).astype(int)
+    starts, stops = bounds[:-1].tolist(), bounds[1:].tolist()
+    with open(output, 'wb') as f:
+        if workers == 1:
+            f.write(encode_segment(path, 0, num_ticks))
+        else:
+            with ProcessPoolExecutor(workers) as pool:
+                # the segments are written in order, as soon as the segments before them are done
+                for segment in pool.map(encode_segment, [path] * workers, starts, stops):
+                    f.write(segment)
+        f.write(GIF_TRAILER)
+
+
+def trace_series(path):
+    """
+    function to compute the series of a run that are plotted, per recorded tick (see analysis.over_time)
+    :param path: path of the trace file
+    :return: dict with the ticks, the number of searching and resident students,
+        the mean and standard deviation of the matching scores of the houses, the counts and the metadata of the run
+    """
+    trace = MappedTrace(path)
+    series = over_time(trace)
+    series['meta'] = trace.meta
+    series['counts'] = trace.counts
+    return series
+
+
+def pyplot():
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib import pyplot as plt
+    return plt
+
+
+def plot_distribution(series, output):
+    """
+    function to plot the number of searching and resident students per simulation step of a run
+    :param series: series of the run (see trace_series)
+    :param output: path of the figure
+    """
+    plt = pyplot()
+    fig, ax = plt.subplots(figsize=(22, 4.8), dpi=72)
+    ticks = series['ticks']
+    for name in ('searching', 'resident'):
+        line, = ax.plot(ticks, series[name], label=name + "_students")
+        ax.fill_between(ticks, series[name], color=line.get_color(), alpha=0.1)
+    ax.axhline(series['counts']['students'])
+    ax.set_xlabel("simulation step")
+    ax.set_ylabel("students")
+    ax.legend(loc='center left', bbox_to_anchor=(1, 0.5))
+    fig.suptitle("distribution of searching students over time: " + run_label(series['meta']) + ", " +
+                 str(series['counts']['houses']) + " houses", fontweight='bold')
+    fig.savefig(output, bbox_inches='tight')
+    plt.close(fig)
+
+
+def plot_average_scores(all_series, output):
+    """
+    function to plot the average matching-score of all houses per simulation step, a line per run,
+    shaded by the standard deviation between the houses
+    :param all_series: list of the series of the runs (see trace_series)
+    :param output: path of the figure
+    """
+    plt = pyplot()
+    fig, ax = plt.subplots()
+    for series in all_series:
+        mean, std = series['score_mean'], series['score_std']
+        line, = ax.plot(series['ticks'], mean, label=run_label(series['meta']))
+        ax.fill_between(series['ticks'], mean - std, mean + std, color=line.get_color(), alpha=0.2)
+    ax.set_xlabel("simulation step")
+    ax.set_ylabel("average matching-score")
+    ax.legend()
+    fig.savefig(output, bbox_inches='tight')
+    plt.close(fig)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('traces', nargs='+', help="trace files of the runs")
+    parser.add_argument('--output-dir', default=".")
+    parser.add_argument('--workers', type=int, default=None, help="processes per gif, defaults to the CPUs")
+    parser.add_argument('--gif', action='store_true', help="render the gif of every run")
+    parser.add_argument('--distribution', action='store_true',
+                        help="plot the searching/resident students over time of every run")
+    parser.add_argument('--scores', action='store_true', help="plot the average matching-score of all runs")
+    args = parser.parse_args()
+    # without a selection, every figure is rendered
+    if not (args.gif or args.distribution or args.scores):
+        args.gif = args.distribution = args.scores = True
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    stems = [os.path.splitext(os.path.basename(path))[0] for path in args.traces]
+    if args.gif:
+        for path, stem in zip(args.traces, stems):
+            output = os.path.join(args.output_dir, stem + ".gif")
+            render_gif(path, output, args.workers)
+            print("rendered", output)
+    if args.distribution or args.scores:
+        with ProcessPoolExecutor(max(1, min(args.workers or os.cpu_count() or 1, len(args.traces)))) as pool:
+            all_series = list(pool.map(trace_series, args.traces))
+    if args.distribution:
+        for series, stem in zip(all_series, stems):
+            output = os.path.join(args.output_dir, stem + "-dist-over-time.png")
+            plot_distribution(series, output)
+            print("rendered", output)
+    if args.scores:
+        houses = {series['counts']['houses'] for series in all_series}
+        output = os.path.join(args.output_dir,
+                              "avg_score_" + str(houses.pop()) + ".svg" if len(houses) == 1 else "avg_score.svg")
+        plot_average_scores(all_series, output)
+        print("rendered", output)
@@ -0,0 +1,139 @@
+"""
+Runs replications of the simulation (seeds x distribution methods x number of houses) in a process pool
+
+usage (from the repository root):
+    python -m src.runner --seeds 5 --houses 400 600 --distr 0.5,0,0.5 1,0,0 0,0,1 --workers 4
+"""
+import argparse
+import contextlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+import src.utils.constants as const
+from src.agents.listing_agent import ListingAgent
+from src.main import setup_simulation
+from src.utils.config import SimulationConfig
+
+
+def run_replication(config, seed):
+    """
+    function to run one replication in a fresh simulation, without visualization
+    :param config: SimulationConfig of the run
+    :param seed: root seed of the random number streams of the run
+    :return: dict with the config (as dict), the seed and the summary of the run
+    """
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        sim = setup_simulation(config, seed)
+        sim.add_agent(ListingAgent("listing_agent@localhost"))
+        sim.simulate()
+    summary = summarize(sim)
+    summary['seconds'] = time.perf_counter() - start
+    return {'config': config.to_dict(), 'seed': seed, 'summary': summary}
+
+
+def summarize(sim):
+    """
+    function to summarize the end state of a simulation, with the statistics of the README tables
+    :param sim: finished simulation
+    :return: dict of the statistics
+    """
+    return summarize_values(collect_values(sim))
+
+
+def collect_values(sim):
+    """
+    function to collect the end state of the students and houses of a simulation that the summary is built from
+    :param sim: finished simulation
+    :return: dict of lists, in the order of sim.students and sim.houses
+    """
+    return {'waiting_time': [int(student.total_waiting_time) for student in sim.students],
+            'has_room': [bool(student.has_room) for student in sim.students],
+            'rooms_obtained': [student.num_rooms_obtained for student in sim.students],
+            'matching_score': [house.matching_score() for house in sim.houses]}
+
+
+def summarize_values(values):
+    """
+    function to compute the statistics of the README tables from the collected end state (see collect_values)
+    :param values: dict of lists
+    :return: dict of the statistics
+    """
+    waiting_times = np.array(values['waiting_time'])
+    scores = np.array([score for score in values['matching_score'] if score is not None])
+    return {'housed': sum(values['has_room']),
+            'never_housed': sum(rooms == 0 for rooms in values['rooms_obtained']),
+            'mean_waiting_time': waiting_times.mean().item() if len(waiting_times) else None,
+            'std_waiting_time': waiting_times.std().item() if len(waiting_times) else None,
+            'mean_matching_score': scores.mean().item() if len(scores) else None,
+            'std_matching_score': scores.std().item() if len(scores) else None}
+
+
+def aggregate(results):
+    """
+    function to average the summaries of the replications of every setup (all seeds of a config)
+    :param results: list of run results (see run_replication)
+    :return: list of dicts with the config, the number of replications and the mean of every statistic
+    """
+    setups = {}
+    for result in results:
+        setups.setdefault(json.dumps(result['config'], sort_keys=True), []).append(result)
+
+    aggregated = []
+    for runs in setups.values():
+        summaries = [run['summary'] for run in runs]
+        means = {}
+        for name in summaries[0]:
+            values = [summary[name] for summary in summaries if summary[name] is not None]
+            means[name] = float(np.mean(values)) if values else None
+        aggregated.append({'config': runs[0]['config'], 'replications': len(runs), 'mean': means})
+    return aggregated
+
+
+def run_replications(configs, workers=None):
+    """
+    function to spread the replications across a process pool
+    :param configs: list of (SimulationConfig, seed) tuples
+    :param workers: number of worker processes, defaults to the number of CPUs
+    :return: list of run results, in the order of the configs
+    """
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run_replication, *zip(*configs)))
+
+
+def parse_dist(value):
+    dist = [float(share) for share in value.split(",")]
+    if len(dist) != 3:
+        raise argparse.ArgumentTypeError("expected three shares [COOP, WAIT_LIST, RAND], e.g. 0.5,0,0.5")
+    return dist
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seeds', type=int, default=5, help="number of replications (seeds 0 .. n-1) per setup")
+    parser.add_argument('--houses', type=int, nargs='+', default=[const.NUMBER_HOUSES])
+    parser.add_argument('--students', type=int, default=const.NUMBER_STUDENTS)
+    parser.add_argument('--distr', type=parse_dist, nargs='+', default=[const.DISTR_METHODS],
+                        help="shares of the distribution methods [COOP, WAIT_LIST, RAND], e.g. 0.5,0,0.5")
+    parser.add_argument('--ticks', type=int, default=const.SIMULATION_DURATION)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', default=None, help="aggregated result file (default results-<timestamp>.json)")
+    args = parser.parse_args()
+
+    configs = [(SimulationConfig(num_houses=num_houses, num_students=args.students, dist=dist,
+                                 duration=args.ticks), seed)
+               for num_houses in args.houses for dist in args.distr for seed in range(args.seeds)]
+    print("Running", len(configs), "replications")
+    start = time.perf_counter()
+    results = run_replications(configs, args.workers)
+    print("Finished in {:.1f}s".format(time.perf_counter() - start))
+
+    output = args.output or "results-" + datetime.now().strftime('%Y%m%d-%H%M%S') + ".json"
+    with open(output, 'w') as f:
+        json.dump({'runs': results, 'aggregate': aggregate(results)}, f, indent=2)
+    print("Results written to", output)
@@ -0,0 +1,205 @@
+"""
+Runs one simulation sharded across worker processes
+
+the students and houses are split across the workers (agent i of each kind runs in worker i % workers,
+see main.setup_simulation), and every worker runs the behaviours of its agents with queued delivery;
+the messages to agents of other shards are exchanged in every delivery round over pipes, routed by the
+coordinating process (a local stand-in for an external message transport, see utils/open_fire.py)
+
+every worker keeps a replica of the listings: the listing updates of the houses are sent to all replicas,
+and every replica answers the listing queries of the students of its shard
+
+the messages of a round are delivered in a canonical order (see MASSimulation.deliver_round), so a sharded run
+ends in the same state as the same config and seed in one process with queued delivery
+
+usage (from the repository root):
+    python -m src.sharded --students 100000 --houses 15000 --ticks 20 --workers 4 --compare
+"""
+import argparse
+import contextlib
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+import src.utils.constants as const
+from src.agents.listing_agent import ListingAgent
+from src.main import setup_simulation
+from src.runner import collect_values, summarize_values, run_replication
+from src.utils.config import SimulationConfig
+from src.utils.messages import routing_key
+
+ROUND = "round"
+DONE = "done"
+
+
+class PipeTransport:
+    """
+    message transport of a shard, exchanges the messages of every delivery round with the coordinator
+    """
+
+    def __init__(self, sim, connection, index, shards):
+        """
+        constructor for the transport of a shard
+        :param sim: simulation of the shard
+        :param connection: pipe to the coordinator
+        :param index: index of the shard
+        :param shards: number of shards
+        """
+        self.sim = sim
+        self.connection = connection
+        self.index = index
+        self.shards = shards
+        # agent -> types of the messages that are sent to the replicas of the agent in all shards
+        self.replicated = {"listing_agent@localhost": ListingAgent.UPDATES}
+        self.sent = 0
+        self.received = 0
+
+    def exchange(self, messages):
+        """
+        function to send the messages of a round to the agents of other shards, and to receive theirs
+        :param messages: messages sent in this shard
+        :return: messages to the agents of this shard and whether any shard has messages in this round
+        """
+        local = []
+        outboxes = [[] for _ in range(self.shards)]
+        for message in messages:
+            to = str(message.to)
+            # agents that are not sharded (the listing agent) run in every shard
+            shard = self.sim.owners.get(to, self.index)
+            if shard != self.index:
+                outboxes[shard].append(message)
+                continue
+            local.append(message)
+            if to in self.replicated and routing_key(message)[4] in self.replicated[to]:
+                for other in range(self.shards):
+                    if other != self.index:
+                        outboxes[other].append(message)
+
+        self.connection.send((ROUND, len(local), outboxes))
+        inbox, pending = self.connection.recv()
+        self.sent += sum(len(outbox) for outbox in outboxes)
+        self.received += len(inbox)
+        return local + inbox, pending
+
+
+def run_shard(config, seed, index, shards, connection):
+    """
+    function to run one shard of a simulation (worker process),
+    sends the collected end state of its agents (see runner.collect_values) to the coordinator
+    :param config: SimulationConfig of the run (queued delivery)
+    :param seed: root seed of the run
+    :param index: index of the shard
+    :param shards: number of shards
+    :param connection: pipe to the coordinator
+    """
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        sim = setup_simulation(config, seed, (index, shards))
+        sim.add_agent(ListingAgent("listing_agent@localhost"))
+        sim.transport = PipeTransport(sim, connection, index, shards)
+        sim.simulate()
+    connection.send((DONE, collect_values(sim), {'sent': sim.transport.sent, 'received': sim.transport.received}))
+    connection.close()
+
+
+def route(connections):
+    """
+    function to route the messages of every delivery round between the shards, until all shards are done
+    :param connections: pipes to the shards, in the order of the shards
+    :return: list of (end state, transport statistics) per shard and the number of rounds
+    """
+    rounds = 0
+    while True:
+        received = [connection.recv() for connection in connections]
+        kinds = set(message[0] for message in received)
+        if kinds == {DONE}:
+            return [message[1:] for message in received], rounds
+        if kinds != {ROUND}:
+            raise RuntimeError("shards out of step: " + str([message[0] for message in received]))
+
+        pending = any(local > 0 or any(outboxes) for _, local, outboxes in received)
+        for index, connection in enumerate(connections):
+            inbox = [message for _, _, outboxes in received for message in outboxes[index]]
+            connection.send((inbox, pending))
+        rounds += 1
+
+
+def merge_values(values):
+    """
+    function to merge the end states of the shards into the order of the agents in one process,
+    agent i of each kind ran in shard i % shards
+    :param values: list of end states (see runner.collect_values), in the order of the shards
+    :return: merged end state
+    """
+    shards = len(values)
+    merged = {}
+    for name in values[0]:
+        merged[name] = [None] * sum(len(shard_values[name]) for shard_values in values)
+        for index, shard_values in enumerate(values):
+            merged[name][index::shards] = shard_values[name]
+    return merged
+
+
+def run_sharded(config, seed=None, workers=None):
+    """
+    function to run one simulation sharded across worker processes
+    :param config: SimulationConfig of the run, always runs with queued delivery
+    :param seed: root seed of the run, drawn from the OS if None
+    :param workers: number of shards, defaults to the number of CPUs
+    :return: dict with the config (as dict), the seed, the number of workers, the summary of the run
+        and the statistics of the exchange
+    """
+    config = config.replace(delivery=const.QUEUED)
+    seed = seed if seed is not None else int(np.random.SeedSequence().entropy)
+    workers = workers or os.cpu_count()
+
+    start = time.perf_counter()
+    connections = []
+    processes = []
+    for index in range(workers):
+        connection, worker_connection = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=run_shard, args=(config, seed, index, workers, worker_connection))
+        process.start()
+        # only the worker holds its end, so a crashed worker closes the pipe
+        worker_connection.close()
+        connections.append(connection)
+        processes.append(process)
+
+    try:
+        results, rounds = route(connections)
+    finally:
+        for process in processes:
+            process.join()
+
+    summary = summarize_values(merge_values([values for values, _ in results]))
+    summary['seconds'] = time.perf_counter() - start
+    return {'config': config.to_dict(), 'seed': seed, 'workers': workers, 'summary': summary,
+            'rounds': rounds, 'cross_shard_messages': sum(stats['sent'] for _, stats in results)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=const.NUMBER_STUDENTS)
+    parser.add_argument('--houses', type=int, default=const.NUMBER_HOUSES)
+    parser.add_argument('--ticks', type=int, default=const.SIMULATION_DURATION)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--compare', action='store_true',
+                        help="run the same config and seed in one process as well and compare the summaries")
+    args = parser.parse_args()
+
+    config = SimulationConfig(num_students=args.students, num_houses=args.houses, duration=args.ticks,
+                              delivery=const.QUEUED)
+    result = run_sharded(config, args.seed, args.workers)
+    print("{} workers: {:.1f}s, {} delivery rounds, {} messages across shards".format(
+        result['workers'], result['summary']['seconds'], result['rounds'], result['cross_shard_messages']))
+    print(result['summary'])
+
+    if args.compare:
+        single = run_replication(config, args.seed)
+        print("1 process: {:.1f}s".format(single['summary']['seconds']))
+        print(single['summary'])
+        equal = all(result['summary'][name] == single['summary'][name]
+                    for name in single['summary'] if name != 'seconds')
+        print("summaries equal:", equal)
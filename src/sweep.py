@@ -0,0 +1,128 @@
+"""
+Parameter sweep over a grid of simulation configs, with the results of finished runs cached on disk
+
+every run (config x seed) is stored in the cache directory under a hash of the config, the seed and the model
+constants (see SimulationConfig.cache_key) as soon as it finishes, so re-running a sweep skips the finished runs
+and an interrupted sweep resumes where it stopped
+
+usage (from the repository root):
+    python -m src.sweep --grid num_houses=400,600 --grid dist=1/0/0,0.5/0/0.5,0/0/1 --seeds 5 --workers 4
+"""
+import argparse
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from src.runner import run_replication, aggregate
+from src.utils.config import SimulationConfig
+
+DEFAULT_CACHE_DIR = ".sweep-cache"
+
+
+def expand_grid(grid, base=None):
+    """
+    function to expand a grid of parameter values into the list of all combinations
+    :param grid: dict of parameter name -> list of values
+    :param base: config with the values of the parameters that are not swept, defaults to the constants
+    :return: list of configs
+    """
+    base = base if base is not None else SimulationConfig()
+    names = list(grid)
+    return [base.replace(**dict(zip(names, values))) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def cache_path(cache_dir, config, seed):
+    return os.path.join(cache_dir, config.cache_key(seed) + ".json")
+
+
+def load_cached(cache_dir, config, seed):
+    """
+    function to load the result of a finished run from the cache
+    :return: run result or None if the run is not cached
+    """
+    path = cache_path(cache_dir, config, seed)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def store_cached(cache_dir, config, seed, result):
+    """
+    function to store the result of a finished run in the cache,
+    written to a temporary file first, so that an interrupted sweep never leaves a partial result
+    """
+    path = cache_path(cache_dir, config, seed)
+    with open(path + ".tmp", 'w') as f:
+        json.dump(result, f)
+    os.replace(path + ".tmp", path)
+
+
+def run_sweep(configs, seeds, cache_dir=DEFAULT_CACHE_DIR, workers=None):
+    """
+    function to run every config with every seed, runs that are cached are not run again
+    :param configs: list of configs
+    :param seeds: list of seeds
+    :param cache_dir: directory of the result cache
+    :param workers: number of worker processes, defaults to the number of CPUs
+    :return: list of run results (in the order of the configs and seeds) and the number of cached runs
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    runs = [(config, seed) for config in configs for seed in seeds]
+    results = [load_cached(cache_dir, config, seed) for config, seed in runs]
+    pending = [index for index, result in enumerate(results) if result is None]
+    print(len(runs) - len(pending), "of", len(runs), "runs cached,", len(pending), "to run")
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(run_replication, *runs[index]): index for index in pending}
+            for done, future in enumerate(as_completed(futures), 1):
+                index = futures[future]
+                results[index] = future.result()
+                store_cached(cache_dir, *runs[index], results[index])
+                print("finished run", done, "of", len(pending), runs[index][0], "seed", runs[index][1])
+    return results, len(runs) - len(pending)
+
+
+def parse_grid(values):
+    """
+    function to parse the grid arguments (name=value1,value2,...) of the command line
+    :param values: list of grid arguments
+    :return: dict of parameter name -> list of values
+    """
+    grid = {}
+    for value in values:
+        name, _, options = value.partition("=")
+        if not options:
+            raise argparse.ArgumentTypeError("expected name=value1,value2,..., got '" + value + "'")
+        grid[name] = [SimulationConfig.parse(name, option) for option in options.split(",")]
+    return grid
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--grid', action='append', default=[],
+                        help="swept parameter and its values, e.g. num_houses=400,600 or dist=1/0/0,0/0/1 "
+                             "(parameters: " + ", ".join(SimulationConfig.FIELDS) + ")")
+    parser.add_argument('--set', action='append', default=[],
+                        help="fixed parameter that differs from the constants, e.g. duration=200")
+    parser.add_argument('--seeds', type=int, default=5, help="number of replications (seeds 0 .. n-1) per config")
+    parser.add_argument('--cache', default=DEFAULT_CACHE_DIR, help="directory of the result cache")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', default=None, help="aggregated result file (default sweep-<timestamp>.json)")
+    args = parser.parse_args()
+
+    fixed = {name: values[0] for name, values in parse_grid(args.set).items()}
+    configs = expand_grid(parse_grid(args.grid), SimulationConfig(**fixed))
+
+    start = time.perf_counter()
+    results, cached = run_sweep(configs, list(range(args.seeds)), args.cache, args.workers)
+    print("Finished in {:.1f}s ({} runs from the cache)".format(time.perf_counter() - start, cached))
+
+    output = args.output or "sweep-" + datetime.now().strftime('%Y%m%d-%H%M%S') + ".json"
+    with open(output, 'w') as f:
+        json.dump({'runs': results, 'aggregate': aggregate(results)}, f, indent=2)
+    print("Results written to", output)
@@ -0,0 +1,125 @@
+import copyreg
+import gc
+import json
+import os
+import pickle
+import struct
+
+import numpy as np
+
+from src.utils.payloads import Payload
+
+"""
+Checkpoints of a simulation run, the complete state between two ticks (see MASSimulation.enable_checkpoints)
+
+layout of a checkpoint file:
+    MAGIC, length of the header (uint64), JSON header (version, id, seed, tick and config of the run),
+    the pickled simulation: the agents with their behaviours (including the ones added during the run),
+    the room table, the listings, the applications, the timers, the random number generators and the open trace
+a checkpoint is written to a temporary file first, so a crash while writing keeps the previous checkpoint
+the random number streams of the agents and the message payloads are pickled without their default
+reconstruction (a new Philox seeded by the OS, the field checks of the payloads), which dominates loading,
+and the garbage collector is paused while the millions of objects of a large run are written and read
+"""
+
+MAGIC = b"MASCHKPT"
+VERSION = 1
+# seeds the Philox generators of a restored run, whose state is replaced right away
+RESTORE_SEED = np.random.SeedSequence(0)
+
+
+def restore_stream(counter, key, buffer, buffer_pos, has_uint32, uinteger):
+    bit_generator = np.random.Philox(RESTORE_SEED)
+    bit_generator.state = {'bit_generator': 'Philox', 'state': {'counter': counter, 'key': key},
+                           'buffer': buffer, 'buffer_pos': buffer_pos, 'has_uint32': has_uint32,
+                           'uinteger': uinteger}
+    return np.random.Generator(bit_generator)
+
+
+def reduce_stream(generator):
+    state = generator.bit_generator.state
+    if state['bit_generator'] != 'Philox':
+        return generator.__reduce__()
+    return restore_stream, (state['state']['counter'], state['state']['key'], state['buffer'],
+                            state['buffer_pos'], state['has_uint32'], state['uinteger'])
+
+
+def restore_payload(payload_type, items):
+    payload = payload_type.__new__(payload_type)
+    dict.update(payload, items)
+    return payload
+
+
+def reduce_payload(payload):
+    return restore_payload, (type(payload), dict(payload))
+
+
+class CheckpointPickler(pickle.Pickler):
+    dispatch_table = copyreg.dispatch_table.copy()
+    dispatch_table[np.random.Generator] = reduce_stream
+    # the dispatch table matches exact types, so every payload type is listed
+    dispatch_table.update({payload_type: reduce_payload for payload_type in [Payload] + Payload.__subclasses__()})
+
+
+def save_checkpoint(sim, path):
+    """
+    function to write a checkpoint of a simulation between two ticks
+    :param sim: simulation, with an empty message queue
+    :param path: path of the checkpoint file
+    """
+    if sim.transport is not None:
+        raise ValueError("the shards of a sharded run can't be checkpointed")
+    if sim.message_queue:
+        raise ValueError("a checkpoint can only be written between two ticks, " + str(len(sim.message_queue)) +
+                         " messages are queued")
+    header = json.dumps({'version': VERSION, 'id': sim.id, 'seed': sim.seed, 'tick': sim.ticks_passed,
+                         'config': sim.config.to_dict()}).encode()
+    temporary = path + ".tmp"
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        with open(temporary, 'wb') as f:
+            f.write(MAGIC + struct.pack('<Q', len(header)) + header)
+            CheckpointPickler(f, protocol=pickle.HIGHEST_PROTOCOL).dump(sim)
+    finally:
+        if enabled:
+            gc.enable()
+    os.replace(temporary, path)
+
+
+def read_header(f, path):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError(path + " is not a simulation checkpoint")
+    length, = struct.unpack('<Q', f.read(8))
+    header = json.loads(f.read(length))
+    if header['version'] != VERSION:
+        raise ValueError(path + " has the checkpoint version " + str(header['version']) + ", expected " +
+                         str(VERSION))
+    return header
+
+
+def checkpoint_info(path):
+    """
+    function to read the header of a checkpoint, without loading the simulation
+    :param path: path of the checkpoint file
+    :return: dict with the id, seed, tick and config of the run
+    """
+    with open(path, 'rb') as f:
+        return read_header(f, path)
+
+
+def load_checkpoint(path):
+    """
+    function to restore a simulation from a checkpoint, simulate continues with the tick after the checkpoint
+    :param path: path of the checkpoint file
+    :return: simulation
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        with open(path, 'rb') as f:
+            read_header(f, path)
+            return pickle.load(f)
+    finally:
+        if enabled:
+            gc.enable()
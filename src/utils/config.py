@@ -0,0 +1,104 @@
+import hashlib
+import json
+
+import src.utils.constants as const
+
+"""
+Configuration of a simulation run
+"""
+
+
+class SimulationConfig:
+    """
+    parameters of a simulation run, the defaults are the constants in utils/constants.py
+    the model parameters (application days, rent period, ...) stay constants
+    """
+
+    # name -> name of the constant with the default value
+    FIELDS = {
+        'num_students': 'NUMBER_STUDENTS',
+        'num_houses': 'NUMBER_HOUSES',
+        'dist': 'DISTR_METHODS',
+        'percentage_accepting_international': 'PERCENTAGE_ACCEPTING_INTERNATIONAL',
+        'percentage_international': 'PERCENTAGE_INTERNATIONAL',
+        'percentage_female': 'PERCENTAGE_FEMALE',
+        'duration': 'SIMULATION_DURATION',
+        'delivery': 'MESSAGE_DELIVERY',
+        'population_store': 'POPULATION_STORE',
+    }
+
+    def __init__(self, **values):
+        """
+        constructor for simulation configs
+        :param values: parameters that differ from the constants, see FIELDS
+        """
+        for name in values:
+            if name not in self.FIELDS:
+                raise TypeError("SimulationConfig has no parameter '" + name + "', expected one of " +
+                                str(tuple(self.FIELDS)))
+        for name, constant in self.FIELDS.items():
+            value = values[name] if name in values else getattr(const, constant)
+            # shares as floats, so that equal configs have equal cache keys
+            if name == 'dist':
+                value = [float(share) for share in value]
+            elif name.startswith('percentage'):
+                value = float(value)
+            setattr(self, name, value)
+
+    def replace(self, **changes):
+        """
+        function to derive a changed copy of the config
+        :param changes: parameters to be replaced
+        :return: new config
+        """
+        return SimulationConfig(**dict(self.to_dict(), **changes))
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    def cache_key(self, seed):
+        """
+        function to hash the config together with a seed and the model constants,
+        so that results of a changed model are not mixed up with cached ones
+        :param seed: seed of the run
+        :return: hex digest
+        """
+        model = {name: getattr(const, name) for name in ('DEFAULT_APPLICATION_DAYS', 'EXTRA_COOP_DAYS',
+                                                         'DEFAULT_RENT_PERIOD', 'CHECK_COMP_EVERY_X')}
+        # the random number streams (see MASSimulation.stream) belong to the model as well
+        model['streams'] = 'philox-sha256'
+        text = json.dumps({'config': self.to_dict(), 'seed': seed, 'model': model}, sort_keys=True)
+        return hashlib.sha256(text.encode()).hexdigest()[:24]
+
+    @classmethod
+    def parse(cls, name, text):
+        """
+        function to parse the value of a parameter from the command line,
+        lists (dist) are separated by '/', e.g. 0.5/0/0.5
+        :param name: name of the parameter
+        :param text: value as text
+        :return: value of the type of the default value
+        """
+        if name not in cls.FIELDS:
+            raise ValueError("unknown parameter '" + name + "', expected one of " + str(tuple(cls.FIELDS)))
+        default = getattr(const, cls.FIELDS[name])
+        if isinstance(default, bool):
+            if text.lower() not in ('true', 'false', '1', '0'):
+                raise ValueError("expected true or false for '" + name + "', got '" + text + "'")
+            return text.lower() in ('true', '1')
+        if isinstance(default, list):
+            return [float(value) for value in text.split("/")]
+        if isinstance(default, str):
+            return text
+        if isinstance(default, int) and "." not in text:
+            return int(text)
+        return float(text)
+
+    def __eq__(self, other):
+        return isinstance(other, SimulationConfig) and self.to_dict() == other.to_dict()
+
+    def __hash__(self):
+        return hash(json.dumps(self.to_dict(), sort_keys=True))
+
+    def __repr__(self):
+        return "SimulationConfig(" + ", ".join(name + "=" + repr(value) for name, value in self.to_dict().items()) + ")"
@@ -15,14 +15,42 @@ SETUP SIMULATION
 NUMBER_STUDENTS = 3000
 NUMBER_HOUSES = 400
 DISTR_METHODS = [0.5, 0, 0.5] #  [COOP, WAIT_LIST, RAND] (values should add up to 1.0)
+PERCENTAGE_ACCEPTING_INTERNATIONAL = .6
+PERCENTAGE_INTERNATIONAL = 0  # currently unused
+PERCENTAGE_FEMALE = .5  # currently unused
 
 DEFAULT_APPLICATION_DAYS = 2
 EXTRA_COOP_DAYS = 2
 DEFAULT_RENT_PERIOD = 104
 SIMULATION_DURATION = 52 * 10
 SAVE_DATA_EVERY_X = 1
+TRACE_KEYFRAME_EVERY = 50  # recorded ticks per full keyframe of the trace, the ticks in between are deltas
 CHECK_COMP_EVERY_X = 10
 WARM_UP_TICKS = 1
+RENDER_GIF = True  # render the gif from the trace after the run, PIL is only imported if the gif is rendered
+POPULATION_STORE = False  # keep the student state in contiguous arrays (float32 personality vectors)
+CHECKPOINT_EVERY = 0  # ticks between two checkpoints of a run (src/main.py), 0 writes no checkpoints
+INSTRUMENT = False  # record the time per tick and behaviour class and the messages of a run (src/main.py)
+DEBUG_HOUSE_SCORE = False  # check the running house-scores and matching scores against the full recalculation
+DEBUG_ROOM_COUNTDOWNS = False  # check the countdowns of the room table against per-room counters
+
+"""
+MESSAGING
+"""
+
+INTERNAL = "internal"
+XMPP = "xmpp"
+
+# with the internal transport, message bodies are passed by reference as immutable payloads,
+# any external transport receives JSON-encoded bodies
+MESSAGE_TRANSPORT = INTERNAL
+
+SYNCHRONOUS = "synchronous"
+QUEUED = "queued"
+
+# synchronous delivery runs the receiving behaviours within send,
+# queued delivery collects the messages and delivers them in rounds after the periodic behaviours of a tick
+MESSAGE_DELIVERY = SYNCHRONOUS
 
 """
 FORMULAS
@@ -52,6 +80,22 @@ def calculate_dist(questionnaire1, questionnaire2):
     return 1 - distance
 
 
+def calculate_dist_matrix(vectors1, vectors2):
+    """
+    vectorized calculate_dist between every vector of vectors1 and every vector of vectors2
+    :param vectors1: array-like of shape (n, d)
+    :param vectors2: array-like of shape (m, d)
+    :return: array of shape (n, m) with the normalized distances
+    """
+    vectors1 = np.asarray(vectors1, dtype=float)
+    vectors2 = np.asarray(vectors2, dtype=float)
+    # summed dimension by dimension, in the same order as dist
+    distance = np.zeros((len(vectors1), len(vectors2)))
+    for d in range(vectors1.shape[1]):
+        distance += np.abs(vectors1[:, d, np.newaxis] - vectors2[np.newaxis, :, d])
+    return 1 - distance / vectors1.shape[1]
+
+
 def calculate_house_matching_score(house):
     """
     function ot calculate average distance of all roommates within a house
@@ -70,7 +114,7 @@ def calculate_house_matching_score(house):
         roommates = 0
 
         for roommate in house.rooms.values():
-            if roommate["id"] is room["id"] or roommate["questionnaire"] is None:
+            if roommate["id"] == room["id"] or roommate["questionnaire"] is None:
                 continue
             roommates += 1
             roommates_score += calculate_dist(room["questionnaire"]["personality_vector"],
@@ -84,6 +128,41 @@ def calculate_house_matching_score(house):
     return None
 
 
+def calculate_house_matching_scores(personality, room_house, resident, num_houses):
+    """
+    vectorized calculate_house_matching_score of all houses, from the recorded columns of a tick (see utils/trace.py)
+    :param personality: array of shape (students, d) with the personality vectors
+    :param room_house: int array with the house of every room, the rooms of a house are contiguous
+    :param resident: int array with the student index of the resident of every room, -1 for a free room
+    :param num_houses: number of houses
+    :return: float array with the matching score per house, nan for less than two residents
+    """
+    personality = np.asarray(personality, dtype=float)
+    room_house = np.asarray(room_house, dtype=np.intp)
+    resident = np.asarray(resident, dtype=np.intp)
+    # position of every room in its house
+    position = np.arange(len(room_house)) - np.searchsorted(room_house, room_house)
+    num_rooms = int(position.max()) + 1 if len(position) else 0
+    occupied = np.zeros((num_houses, num_rooms), dtype=bool)
+    occupied[room_house, position] = resident >= 0
+    vectors = np.zeros((num_houses, num_rooms, personality.shape[1]))
+    vectors[room_house, position] = personality[np.maximum(resident, 0)]
+
+    # summed compatibility of every ordered pair of housemates, the diagonal adds 1 per resident
+    distance = np.zeros((num_houses, num_rooms, num_rooms))
+    for d in range(personality.shape[1]):
+        distance += np.abs(vectors[:, :, np.newaxis, d] - vectors[:, np.newaxis, :, d])
+    compatibility = 1 - distance / personality.shape[1]
+    pairs = occupied[:, :, np.newaxis] & occupied[:, np.newaxis, :]
+    residents = occupied.sum(axis=1)
+    total = np.where(pairs, compatibility, 0).sum(axis=(1, 2)) - residents
+
+    scores = np.full(num_houses, np.nan)
+    housemates = residents > 1
+    scores[housemates] = total[housemates] / (residents[housemates] * (residents[housemates] - 1))
+    return scores
+
+
 def calc_avg_personality(house):
     """
     function to calculate average personality of roommates
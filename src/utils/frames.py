@@ -0,0 +1,131 @@
+import numpy as np
+
+"""
+Frames of the simulation gif, rendered from the recorded columns of a tick (see utils/trace.py and render.py)
+"""
+
+# palette of the gif, the frames are arrays of palette indices
+BACKGROUND = 0
+STUDENT = 1  # searching: STUDENT + 1
+INTERNATIONAL_STUDENT = 3  # searching: INTERNATIONAL_STUDENT + 1
+OCCUPIED_ROOM = 5
+FREE_ROOM = 6
+LISTED_ROOM = 7
+PALETTE = [(0, 0, 0),
+           (0, 255, 0), (0, 85, 0),
+           (255, 0, 0), (85, 0, 0),
+           (255, 255, 255), (100, 100, 100), (140, 140, 0)]
+
+FRAME_HEIGHT = 50
+STUDENT_ROW = 5
+FIRST_ROOM_ROW = 10
+
+
+class FrameLayout:
+    """
+    pixel layout of the frames, computed once:
+    a pixel per student in the student row, a column per house (every second pixel) with a pixel per room,
+    the houses are sorted by attractiveness, from most attractive (left) to least attractive (right)
+    """
+
+    def __init__(self, international, attractiveness, room_house):
+        """
+        constructor for frame layouts
+        :param international: bool array, per student
+        :param attractiveness: float array, per house
+        :param room_house: int array with the house of every room, the rooms of a house are contiguous
+        """
+        international = np.asarray(international, dtype=bool)
+        attractiveness = np.asarray(attractiveness, dtype=float)
+        room_house = np.asarray(room_house, dtype=np.intp)
+        self.num_students = len(international)
+        self.width = max(self.num_students + 10, 2 * len(attractiveness) + 1)
+        self.student_colors = np.where(international, INTERNATIONAL_STUDENT, STUDENT).astype(np.uint8)
+
+        # rank of every house, ties keep the order of the houses
+        rank = np.empty(len(attractiveness), dtype=np.intp)
+        rank[np.argsort(-attractiveness, kind='stable')] = np.arange(len(attractiveness))
+        self.room_x = 2 * (rank[room_house] + 1)
+        self.room_y = FIRST_ROOM_ROW + np.arange(len(room_house)) - np.searchsorted(room_house, room_house)
+
+    def render(self, started, has_room, resident, listed):
+        """
+        function to render the frame of a tick
+        :param started: bool array, per student
+        :param has_room: bool array, per student
+        :param resident: int array with the resident of every room, -1 for a free room
+        :param listed: bool array, per room
+        :return: uint8 array (FRAME_HEIGHT x width) of palette indices
+        """
+        frame = np.zeros((FRAME_HEIGHT, self.width), dtype=np.uint8)
+        students = self.student_colors + ~np.asarray(has_room, dtype=bool)
+        frame[STUDENT_ROW, :self.num_students] = np.where(started, students, BACKGROUND)
+        frame[self.room_y, self.room_x] = np.where(listed, LISTED_ROOM,
+                                                   np.where(np.asarray(resident) >= 0, OCCUPIED_ROOM, FREE_ROOM))
+        return frame
+
+
+# last byte of a gif
+GIF_TRAILER = b";"
+
+
+class GifEncoder:
+    """
+    encodes the frames of an animated gif one by one, so that no frame has to be kept in memory,
+    only the region that changed since the previous frame is encoded
+    the encoded frames of consecutive encoders can be concatenated, if every encoder starts with the last frame
+    of the previous one (see render.render_gif)
+    """
+
+    def __init__(self, duration=100, loop=0, previous=None):
+        """
+        constructor for gif encoders
+        :param duration: duration of a frame in milliseconds
+        :param loop: number of loops, 0 loops forever
+        :param previous: frame before the first frame of this encoder, None if the encoder starts the gif
+            (the first frame is then encoded with the header of the gif)
+        """
+        from PIL import Image, GifImagePlugin
+        self.image = Image
+        self.gif = GifImagePlugin
+        self.palette = [value for color in PALETTE for value in color]
+        self.duration = duration
+        self.loop = loop
+        self.previous = previous
+
+    def encode(self, frame):
+        """
+        function to encode the next frame
+        :param frame: uint8 array of palette indices (see FrameLayout.render)
+        :return: encoded frame, drawn over the previous frame
+        """
+        if self.previous is None:
+            data = self.encode_image(frame, (0, 0), header=True)
+        else:
+            changed = frame != self.previous
+            rows = np.flatnonzero(changed.any(axis=1))
+            columns = np.flatnonzero(changed.any(axis=0))
+            if len(rows) == 0:
+                # an unchanged frame still takes its time, as one unchanged pixel
+                rows = columns = np.zeros(1, dtype=np.intp)
+            top, bottom, left, right = rows[0], rows[-1] + 1, columns[0], columns[-1] + 1
+            data = self.encode_image(frame[top:bottom, left:right], (int(left), int(top)))
+        self.previous = frame
+        return data
+
+    def encode_image(self, pixels, offset, header=False):
+        """
+        function to encode a (part of a) frame
+        :param pixels: uint8 array of palette indices
+        :param offset: (x, y) position of the pixels in the frame
+        :param header: start with the header of the gif (first frame)
+        :return: encoded image
+        """
+        height, width = pixels.shape
+        im = self.image.frombytes('P', (width, height), np.ascontiguousarray(pixels).tobytes())
+        im.putpalette(self.palette)
+        data = b""
+        if header:
+            header, _ = self.gif.getheader(im, info={'loop': self.loop, 'duration': self.duration})
+            data = b"".join(header)
+        return data + b"".join(self.gif.getdata(im, offset, duration=self.duration))
@@ -0,0 +1,172 @@
+import csv
+import json
+import time
+
+import numpy as np
+
+from src.utils.messages import routing_key
+
+"""
+Opt-in instrumentation of a simulation run (see MASSimulation.instrument)
+"""
+
+
+def message_type(message):
+    """
+    function to name the type of a message by its performative and routing metadata, e.g. 'request/listings'
+    :param message: sent message
+    :return: type of the message
+    """
+    key = routing_key(message)
+    return str(key[0]) + "/" + str(key[4]) if key[4] is not None else str(key[0])
+
+
+class Instrumentation:
+    """
+    records per tick: the wall time of the tick, the time per behaviour class, the sent messages per type,
+    the number of searching students and the number of open listings
+    the time of a behaviour excludes the time of the behaviours it runs through synchronous delivery,
+    so that the times of the behaviour classes do not overlap, the rest of a tick is spent in the simulation loop
+    tick 0 is the setup of the agents
+    """
+
+    def __init__(self, sim, print_ticks=True):
+        """
+        constructor for instrumentations
+        :param sim: instrumented simulation
+        :param print_ticks: print a line per tick
+        """
+        self.sim = sim
+        self.print_ticks = print_ticks
+        self.ticks = []
+        self.current = None
+        self.tick_start = None
+        # time of the nested behaviours of every running behaviour
+        self.nested = []
+
+    def start_tick(self, tick):
+        self.current = {'tick': tick, 'behaviours': {}, 'messages': {}}
+        self.tick_start = time.perf_counter()
+
+    def end_tick(self):
+        """
+        function to finish the record of the current tick, with the searching students and open listings
+        at its end
+        """
+        record = self.current
+        record['seconds'] = time.perf_counter() - self.tick_start
+        record['searching_students'] = sum(1 for student in self.sim.students
+                                           if student.started and student.is_searching)
+        table = self.sim.rooms
+        record['open_listings'] = int(np.count_nonzero(table.rooms['listed'][:table.size])) \
+            if table is not None else 0
+        self.ticks.append(record)
+        self.current = None
+        if self.print_ticks:
+            print("TICK {}: {:.3f}s, {} messages, {} searching students, {} open listings".format(
+                record['tick'], record['seconds'], sum(record['messages'].values()), record['searching_students'],
+                record['open_listings']))
+
+    def run(self, behaviour_class, calls, function, *args):
+        """
+        function to run and time a behaviour (or a batch of deliveries to a behaviour class)
+        :param behaviour_class: class of the behaviour
+        :param calls: number of runs (deliveries of a batch)
+        :param function: function to be run
+        :param args: arguments of the function
+        """
+        if self.current is None:
+            # outside of the simulation loop
+            function(*args)
+            return
+        self.nested.append(0.0)
+        start = time.perf_counter()
+        try:
+            function(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self.nested.pop()
+            if self.nested:
+                self.nested[-1] += elapsed
+            behaviours = self.current['behaviours']
+            seconds, count = behaviours.get(behaviour_class.__qualname__, (0.0, 0))
+            behaviours[behaviour_class.__qualname__] = (seconds + elapsed - nested, count + calls)
+
+    def count_message(self, message):
+        if self.current is None:
+            return
+        messages = self.current['messages']
+        name = message_type(message)
+        messages[name] = messages.get(name, 0) + 1
+
+    def columns(self):
+        """
+        function to collect the behaviour classes and message types of all ticks
+        :return: sorted behaviour class names, sorted message types
+        """
+        behaviours = sorted({name for record in self.ticks for name in record['behaviours']})
+        messages = sorted({name for record in self.ticks for name in record['messages']})
+        return behaviours, messages
+
+    def write_csv(self, path):
+        """
+        function to write a row per tick: time, messages, searching students, open listings,
+        the time per behaviour class and the messages per type
+        :param path: path of the CSV file
+        """
+        behaviours, messages = self.columns()
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['tick', 'seconds', 'messages', 'searching_students', 'open_listings'] +
+                            ['seconds:' + name for name in behaviours] + ['messages:' + name for name in messages])
+            for record in self.ticks:
+                writer.writerow([record['tick'], record['seconds'], sum(record['messages'].values()),
+                                 record['searching_students'], record['open_listings']] +
+                                [record['behaviours'].get(name, (0.0, 0))[0] for name in behaviours] +
+                                [record['messages'].get(name, 0) for name in messages])
+
+    def summary(self):
+        """
+        function to summarize the recorded ticks
+        :return: dict with the totals, the time and runs per behaviour class (slowest first),
+            the messages per type and the searching students and open listings at the end
+        """
+        behaviours, messages = self.columns()
+        ticks = [record for record in self.ticks if record['tick'] > 0]
+        seconds = sum(record['seconds'] for record in ticks)
+        per_class = {}
+        for name in behaviours:
+            class_seconds = sum(record['behaviours'].get(name, (0.0, 0))[0] for record in ticks)
+            per_class[name] = {'seconds': class_seconds,
+                               'runs': sum(record['behaviours'].get(name, (0.0, 0))[1] for record in ticks),
+                               'share': class_seconds / seconds if seconds > 0 else None}
+        return {'ticks': len(ticks), 'seconds': seconds,
+                'setup_seconds': sum(record['seconds'] for record in self.ticks if record['tick'] == 0),
+                'seconds_per_tick': seconds / len(ticks) if ticks else None,
+                'slowest_tick': max(ticks, key=lambda record: record['seconds'])['tick'] if ticks else None,
+                'behaviours': dict(sorted(per_class.items(), key=lambda item: -item[1]['seconds'])),
+                'messages': {name: sum(record['messages'].get(name, 0) for record in ticks) for name in messages},
+                'searching_students': ticks[-1]['searching_students'] if ticks else None,
+                'open_listings': ticks[-1]['open_listings'] if ticks else None}
+
+    def write_summary(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def report(self):
+        """
+        function to format the summary as text
+        :return: report
+        """
+        summary = self.summary()
+        lines = ["{} ticks in {:.2f}s ({:.3f}s per tick, slowest tick {}), setup {:.2f}s".format(
+            summary['ticks'], summary['seconds'], summary['seconds_per_tick'] or 0, summary['slowest_tick'],
+            summary['setup_seconds'])]
+        for name, values in summary['behaviours'].items():
+            lines.append("  {:45} {:8.2f}s {:6.1%} {:10} runs".format(name, values['seconds'], values['share'] or 0,
+                                                                       values['runs']))
+        lines.append("messages: " + ", ".join(name + " " + str(count) for name, count in
+                                              sorted(summary['messages'].items(), key=lambda item: -item[1])))
+        lines.append("at the end: {} searching students, {} open listings".format(summary['searching_students'],
+                                                                                  summary['open_listings']))
+        return "\n".join(lines)
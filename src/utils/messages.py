@@ -1,13 +1,106 @@
 import json
 
-from spade.template import Template
-from spade.message import Message
+import src.utils.constants as const
+from src.utils.payloads import Payload
 
 """
 Messaging implementation to avoid external messaging as needed by SPADE
 """
 
 
+class Message:
+    """
+    lightweight in-process message, mirrors the parts of spade.message.Message used by the agents
+    the body may be a string or an immutable payload (see utils/payloads.py)
+    """
+    __slots__ = ('to', 'sender', 'body', 'thread', 'metadata')
+
+    def __init__(self, to=None, sender=None, body=None, thread=None, metadata=None):
+        self.to = to
+        self.sender = sender
+        self.body = body
+        self.thread = thread
+        self.metadata = {} if metadata is None else metadata
+
+    def set_metadata(self, key, value):
+        self.metadata[key] = value
+
+    def get_metadata(self, key):
+        return self.metadata.get(key)
+
+    def __str__(self):
+        return "<message to=\"{}\" from=\"{}\" metadata={}>\n{} payload\n</message>".format(
+            self.to, self.sender, self.metadata, type(self.body).__name__)
+
+
+class Template(Message):
+    """
+    lightweight message template, matches messages that agree on every attribute set in the template
+    """
+    __slots__ = ('route',)
+
+    def match(self, message):
+        """
+        function to check a message against the template
+        :param message: received message
+        :return: True if the message matches
+        """
+        if self.to is not None and str(message.to) != str(self.to):
+            return False
+        if self.sender is not None and str(message.sender) != str(self.sender):
+            return False
+        if self.body and message.body != self.body:
+            return False
+        if self.thread and message.thread != self.thread:
+            return False
+        for key, value in self.metadata.items():
+            if message.get_metadata(key) != value:
+                return False
+        return True
+
+
+ONTOLOGY = "studentHousing"
+LANGUAGE = "OWL-S"
+
+# metadata keys that discriminate messages of the same performative, used to route messages to behaviours
+ROUTING_KEYS = ("request-type", "inform-type", "propose-type")
+
+
+def routing_key(message):
+    """
+    function to compute the dispatch key of a message (or template)
+    :param message: message or template
+    :return: tuple of performative, ontology, language and the first routing key present with its value
+    """
+    key = (message.get_metadata("performative"), message.get_metadata("ontology"), message.get_metadata("language"))
+    for meta_key in ROUTING_KEYS:
+        value = message.get_metadata(meta_key)
+        if value is not None:
+            return key + (meta_key, value)
+    return key + (None, None)
+
+
+def template_routing_key(template):
+    """
+    function to compute the dispatch key of a template,
+    only templates that constrain nothing but the keys used by routing_key can be indexed
+    :param template: template
+    :return: dispatch key or None if the template has to be matched explicitly
+    """
+    if hasattr(template, 'route'):
+        return template.route
+    template.route = None
+    if template.to is not None or template.sender is not None or template.body or template.thread:
+        return None
+    routing_keys = [key for key in ROUTING_KEYS if template.get_metadata(key) is not None]
+    if len(routing_keys) > 1 or len(template.metadata) != 3 + len(routing_keys):
+        return None
+    if template.get_metadata("ontology") is None or template.get_metadata("language") is None:
+        return None
+    template.route = routing_key(template)
+    return template.route
+
+
 def create_template(performative, meta_data=None):
     """
     function to define messaging templates
@@ -20,36 +113,69 @@ def create_template(performative, meta_data=None):
 
     template = Template()
     template.set_metadata("performative", performative)
-    template.set_metadata("ontology", "studentHousing")  # Set the ontology of the message content
-    template.set_metadata("language", "OWL-S")  # Set the language of the message content
-    for key in meta_data:
-        template.set_metadata(key, meta_data[key])
+    template.set_metadata("ontology", ONTOLOGY)  # Set the ontology of the message content
+    template.set_metadata("language", LANGUAGE)  # Set the language of the message content
+    for meta_key in meta_data:
+        template.set_metadata(meta_key, meta_data[meta_key])
 
     return template
 
 
+def encode_json(value):
+    """
+    function to JSON-encode the NumPy arrays of payloads (json.dumps default)
+    :param value: value that the json module cannot encode
+    :return: encodable list
+    """
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError("Object of type " + type(value).__name__ + " is not JSON serializable")
+
+
 def create_message(to, performative, body, meta_data=None):
     """
     function for creating a message
     :param to: receiving agent
     :param performative: template, such as inform, request etc
-    :param body: message content
+    :param body: message content, a string or an immutable payload (see utils/payloads.py)
     :param meta_data: additional metadata
     :return: created message
     """
     if meta_data is None:
         meta_data = {}
 
-    if type(body) != str:
-        body = json.dumps(body)
-
-    msg = Message(to=to)  # Instantiate the message
+    if const.MESSAGE_TRANSPORT == const.INTERNAL:
+        msg = Message(to=to)  # Instantiate the message
+    else:
+        # only external transports need SPADE and a string body
+        from spade.message import Message as SpadeMessage
+        if type(body) != str:
+            body = json.dumps(body, default=encode_json)
+        msg = SpadeMessage(to=to)
     msg.set_metadata("performative", performative)  # Set the "inform" FIPA performative
-    msg.set_metadata("ontology", "studentHousing")  # Set the ontology of the message content
-    msg.set_metadata("language", "OWL-S")  # Set the language of the message content
+    msg.set_metadata("ontology", ONTOLOGY)  # Set the ontology of the message content
+    msg.set_metadata("language", LANGUAGE)  # Set the language of the message content
 
     for key in meta_data:
         msg.set_metadata(key, meta_data[key])
 
     msg.body = body  # Set the message content
     return msg
+
+
+def read_body(msg, payload_type=Payload):
+    """
+    function to read the content of a received message,
+    decodes JSON bodies of external transports into the given payload type
+    :param msg: received message
+    :param payload_type: payload type of the body (or of its items, if the body is a list)
+    :return: message content
+    """
+    body = msg.body
+    if type(body) != str:
+        return body
+
+    body = json.loads(body)
+    if isinstance(body, list):
+        return tuple(payload_type(item) for item in body)
+    return payload_type(body)
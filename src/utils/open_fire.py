@@ -3,6 +3,7 @@ import requests
 
 """
 Currently unused, messaging via openfire database/service
+sharded runs exchange their messages over a local stand-in transport instead (see src/sharded.py)
 """
 
 
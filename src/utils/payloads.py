@@ -0,0 +1,117 @@
+"""
+Typed message payloads, passed by reference between agents of the same process
+"""
+
+
+class Payload(dict):
+    """
+    immutable message payload,
+    a dict subclass so that handlers can keep reading fields by key and payloads stay JSON-encodable
+    """
+    __slots__ = ()
+    fields = ()
+    defaults = {}
+
+    def __init__(self, *args, **kwargs):
+        """
+        constructor for payloads, fills in defaults and checks the fields of typed payloads
+        """
+        super().__init__(*args, **kwargs)
+        if not self.fields:
+            return
+        for key in self.defaults:
+            if key not in self:
+                dict.__setitem__(self, key, self.defaults[key])
+        if len(self) != len(self.fields) or not all(key in self for key in self.fields):
+            raise TypeError(type(self).__name__ + " expects the fields " + str(self.fields) +
+                            ", got " + str(tuple(self.keys())))
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError(type(self).__name__ + " is an immutable message payload, use replace() instead")
+
+    __setitem__ = _immutable
+    __delitem__ = _immutable
+    __ior__ = _immutable
+    clear = _immutable
+    pop = _immutable
+    popitem = _immutable
+    setdefault = _immutable
+    update = _immutable
+
+    def replace(self, **changes):
+        """
+        function to derive a changed copy of the payload
+        :param changes: fields to be replaced
+        :return: new payload of the same type
+        """
+        return type(self)(self, **changes)
+
+    def __reduce__(self):
+        return type(self), (dict(self),)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+class Questionnaire(Payload):
+    __slots__ = ()
+    fields = ('personality_vector', 'international', 'is_female')
+
+
+class Listing(Payload):
+    __slots__ = ()
+    fields = ('id', 'housing_method', 'accept_internationals', 'attractiveness', 'house_score', 'house_jid')
+    defaults = {'house_jid': None}
+
+
+class ListingQuery(Payload):
+    __slots__ = ()
+    fields = ('personality_vector', 'international', 'min_compatibility', 'min_attractiveness', 'k')
+    defaults = {'min_compatibility': None, 'min_attractiveness': None, 'k': None}
+
+
+class ListingResults(Payload):
+    __slots__ = ()
+    fields = ('listings', 'total')
+
+
+class Application(Payload):
+    __slots__ = ()
+    fields = ('id', 'housing_method', 'questionnaire', 'waiting_time')
+
+
+class ContractProposal(Payload):
+    __slots__ = ()
+    fields = ('room_id', 'rent_period', 'house_jid', 'house_attractiveness', 'questionnaire')
+    defaults = {'questionnaire': None}
+
+
+class RoomReference(Payload):
+    __slots__ = ()
+    fields = ('room_id',)
+
+
+class StudentReference(Payload):
+    __slots__ = ()
+    fields = ('student_jid',)
+
+
+class HouseScore(Payload):
+    __slots__ = ()
+    fields = ('house_score',)
+
+
+def freeze_vector(vector):
+    """
+    function to turn a (numpy or list) vector into an immutable tuple of floats
+    :param vector: vector to be frozen, may be None
+    :return: tuple or None
+    """
+    if vector is None:
+        return None
+    if hasattr(vector, 'tolist'):
+        vector = vector.tolist()
+    return tuple(vector)
@@ -0,0 +1,146 @@
+import numpy as np
+
+from src.utils.payloads import Questionnaire
+
+"""
+Struct-of-arrays store for the state of many student agents
+"""
+
+
+class Population:
+    """
+    keeps the per-student state in contiguous NumPy arrays, one row per student
+    the personality vectors are stored as float32, the questionnaire of a row is built from them when it is read
+    """
+
+    # array columns of the store, grown together
+    COLUMNS = ('start_delay', 'waiting_time', 'total_waiting_time', 'num_applications', 'num_rooms_obtained',
+               'moved_in_tick', 'started', 'has_room', 'is_searching', 'contract_almost_ends', 'has_applied',
+               'house_attractiveness', 'house_compatibility', 'house', 'international', 'is_female', 'personality')
+
+    def __init__(self, capacity):
+        """
+        constructor for the population store
+        :param capacity: initial number of rows, grows when more students are added
+        """
+        self.size = 0
+        self.start_delay = np.zeros(capacity, dtype=np.int32)
+        self.waiting_time = np.zeros(capacity, dtype=np.int32)
+        self.total_waiting_time = np.zeros(capacity, dtype=np.int32)
+        self.num_applications = np.zeros(capacity, dtype=np.int32)
+        self.num_rooms_obtained = np.zeros(capacity, dtype=np.int32)
+        self.moved_in_tick = np.zeros(capacity, dtype=np.int32)
+        self.started = np.zeros(capacity, dtype=bool)
+        self.has_room = np.zeros(capacity, dtype=bool)
+        self.is_searching = np.zeros(capacity, dtype=bool)
+        self.contract_almost_ends = np.zeros(capacity, dtype=bool)
+        self.has_applied = np.zeros(capacity, dtype=bool)
+        self.house_attractiveness = np.zeros(capacity)
+        self.house_compatibility = np.zeros(capacity)
+        self.house = np.full(capacity, -1, dtype=np.int32)
+        self.international = np.zeros(capacity, dtype=bool)
+        self.is_female = np.zeros(capacity, dtype=bool)
+        self.personality = np.zeros((capacity, 5), dtype=np.float32)
+        self.house_jids = []
+        self.house_numbers = {}
+
+    def add(self):
+        """
+        function to add a student to the store
+        :return: row of the student
+        """
+        if self.size == len(self.waiting_time):
+            for name in self.COLUMNS:
+                array = getattr(self, name)
+                grown = np.zeros((max(2 * len(array), 1),) + array.shape[1:], dtype=array.dtype)
+                grown[:len(array)] = array
+                if name == 'house':
+                    grown[len(array):] = -1
+                setattr(self, name, grown)
+        self.size += 1
+        return self.size - 1
+
+    def house_number(self, house_jid):
+        """
+        function to translate a house jid to the number stored in the house column
+        :param house_jid: jid of the house or None
+        :return: house number, -1 for None
+        """
+        if house_jid is None:
+            return -1
+        if house_jid not in self.house_numbers:
+            self.house_numbers[house_jid] = len(self.house_jids)
+            self.house_jids.append(house_jid)
+        return self.house_numbers[house_jid]
+
+
+class PopulationField:
+    """
+    attribute of a student that lives in its row of the population store, if the student has one,
+    and in the instance dict otherwise
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, student, owner=None):
+        if student is None:
+            return self
+        if student.population is None:
+            return student.__dict__[self.name]
+        return getattr(student.population, self.name).item(student.row)
+
+    def __set__(self, student, value):
+        if student.population is None:
+            student.__dict__[self.name] = value
+        else:
+            getattr(student.population, self.name)[student.row] = value
+
+
+class PopulationHouse:
+    """
+    house_jid attribute of a student, stored as house number in the population store
+    """
+
+    def __get__(self, student, owner=None):
+        if student is None:
+            return self
+        if student.population is None:
+            return student.__dict__['house_jid']
+        number = student.population.house.item(student.row)
+        return None if number < 0 else student.population.house_jids[number]
+
+    def __set__(self, student, value):
+        if student.population is None:
+            student.__dict__['house_jid'] = value
+        else:
+            student.population.house[student.row] = student.population.house_number(value)
+
+
+class PopulationQuestionnaire:
+    """
+    questionnaire attribute of a student, stored as personality row and flags in the population store,
+    a questionnaire is built on every access (for the message payloads) and not kept in the store
+    """
+
+    def __get__(self, student, owner=None):
+        if student is None:
+            return self
+        population = student.population
+        if population is None:
+            return student.__dict__['questionnaire']
+        row = student.row
+        return Questionnaire(personality_vector=tuple(population.personality[row].tolist()),
+                             international=bool(population.international[row]),
+                             is_female=bool(population.is_female[row]))
+
+    def __set__(self, student, questionnaire):
+        population = student.population
+        if population is None:
+            student.__dict__['questionnaire'] = questionnaire
+            return
+        row = student.row
+        if questionnaire['personality_vector']:
+            population.personality[row] = questionnaire['personality_vector']
+        population.international[row] = questionnaire['international']
+        population.is_female[row] = questionnaire['is_female']
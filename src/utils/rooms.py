@@ -0,0 +1,402 @@
+from collections.abc import Mapping
+
+import numpy as np
+
+import src.utils.constants as const
+from src.utils.payloads import Questionnaire
+
+"""
+Array-backed table of the rooms of all houses
+"""
+
+ROOM_DTYPE = np.dtype([
+    ('house', np.int32),
+    ('resident', np.int32),
+    ('listed', bool),
+    ('in_process', bool),
+    ('listed_since', np.int32),
+    ('contract_end', np.int32),
+    ('application_end', np.int32),
+    ('applicants', np.int32),
+    ('housing_method', np.int8),
+    ('updated', np.int32)
+])
+
+# questionnaire of the resident of a room, kept apart from the rooms so that advancing them stays compact
+QUESTIONNAIRE_DTYPE = np.dtype([
+    ('set', bool),
+    ('personality_vector', np.float64, (5,)),
+    ('international', bool),
+    ('is_female', bool)
+])
+
+HOUSING_METHODS = (const.COOP, const.WAIT_LIST, const.RAND)
+
+
+def get_application_days(housing_method):
+    """
+    function to return remaining application days
+    :param housing_method: applied distribution method
+    :return: number of remaining open application days
+    """
+    return const.DEFAULT_APPLICATION_DAYS + (const.EXTRA_COOP_DAYS if housing_method == const.COOP else 0)
+
+
+def crossing(rooms, tick):
+    """
+    function to find the rooms that cross a threshold when their house advances them to the given tick:
+        occupied rooms warn the student 4 days before the end of the contract and end the rent period
+        free rooms request the removal of their listing once co-optation starts (EXTRA_COOP_DAYS days left
+        before the tick, 1-25 applicants) and end the application once the application days are over,
+        if there are applicants
+    :param rooms: rows of the room table
+    :param tick: tick the rooms are advanced to
+    :return: boolean mask of the rooms
+    """
+    contract_left = rooms['contract_end'] - tick
+    application_left = rooms['application_end'] - tick
+    applicants = rooms['applicants']
+    remove_listing = rooms['listed'] & ~rooms['in_process'] & (applicants > 0) & (applicants <= 25) & \
+        (application_left + 1 == const.EXTRA_COOP_DAYS)
+    application_end = (applicants > 0) & (application_left <= 0)
+    return np.where(rooms['resident'] >= 0, (contract_left == 4) | (contract_left <= 0),
+                    remove_listing | application_end)
+
+
+class RoomTable:
+    """
+    rooms of all houses in one NumPy structured array, the room id is the row,
+    the rooms of a house are contiguous
+    residents are stored as student numbers and their questionnaires in a second array (built when they are read),
+    applicant lists in a Python list per room
+    the countdowns (contract and application days left, listing time) are stored as the tick they end (or started)
+    and derived from the tick the room was last advanced to (see clock), so the table does not have to be updated
+    every tick: a house advances its rooms in its turn, one room after the other (see due_rooms),
+    the rooms of a house that does not act in a tick are advanced once all agents acted (see settle)
+    the table wakes the house up (see updates) only in the ticks in which it has to handle a room
+    with DEBUG_ROOM_COUNTDOWNS, the countdowns are checked against per-room counters (see count_down)
+    """
+
+    def __init__(self, capacity=64):
+        self.size = 0
+        self.rooms = np.zeros(capacity, dtype=ROOM_DTYPE)
+        self.questionnaires = np.zeros(capacity, dtype=QUESTIONNAIRE_DTYPE)
+        self.applicants = []
+        self.house_count = 0
+        self.student_jids = []
+        self.student_numbers = {}
+        self.tick = 0
+        # all agents acted in the current tick, the rooms of the houses that did not act are advanced as well
+        self.settled = False
+        # house -> rooms that cross a threshold in the current tick, found at its start (see advance)
+        self.due = {}
+        # house -> last room of the house that was changed since the start of the tick (or since the house
+        # handled a room, see due_rooms), the due rooms from there on are searched again
+        self.touched = {}
+        # house -> periodic behaviour that handles the rooms of the house, sleeps while the house has nothing to do
+        self.updates = {}
+        # houses that may have free rooms that are neither listed nor in an application process
+        self.unlisted_houses = set()
+        # application and contract days left per room, counted down like the rooms of every house were counted down
+        # one by one in every tick, only kept with DEBUG_ROOM_COUNTDOWNS
+        self.counters = np.zeros((capacity, 2), dtype=np.int32) if const.DEBUG_ROOM_COUNTDOWNS else None
+
+    def add_house(self, num_rooms, housing_method):
+        """
+        function to add the rooms of a new house
+        :param num_rooms: number of rooms
+        :param housing_method: distribution method of the house
+        :return: house number and range of room ids
+        """
+        if self.size + num_rooms > len(self.rooms):
+            grown = np.zeros(max(2 * len(self.rooms), self.size + num_rooms), dtype=ROOM_DTYPE)
+            grown[:self.size] = self.rooms[:self.size]
+            self.rooms = grown
+            questionnaires = np.zeros(len(grown), dtype=QUESTIONNAIRE_DTYPE)
+            questionnaires[:self.size] = self.questionnaires[:self.size]
+            self.questionnaires = questionnaires
+            if self.counters is not None:
+                counters = np.zeros((len(grown), 2), dtype=np.int32)
+                counters[:self.size] = self.counters[:self.size]
+                self.counters = counters
+        house = self.house_count
+        self.house_count += 1
+        room_ids = range(self.size, self.size + num_rooms)
+        self.size += num_rooms
+
+        rooms = self.rooms[room_ids.start:room_ids.stop]
+        rooms['house'] = house
+        rooms['resident'] = -1
+        rooms['contract_end'] = self.tick
+        rooms['application_end'] = self.tick + get_application_days(housing_method)
+        rooms['housing_method'] = HOUSING_METHODS.index(housing_method)
+        rooms['updated'] = self.tick
+        if self.counters is not None:
+            self.counters[room_ids.start:room_ids.stop] = (get_application_days(housing_method), 0)
+        self.applicants.extend([] for _ in range(num_rooms))
+        self.unlisted_houses.add(house)
+        return house, room_ids
+
+    def advance(self, tick):
+        """
+        function to set the current tick, called by the simulation at the start of every tick (see add_clock),
+        to find the rooms of all houses that cross a threshold in it at once and to wake up the houses
+        that have to handle a room or to list free rooms
+        :param tick: current tick
+        """
+        self.tick = tick
+        self.settled = False
+        self.touched.clear()
+        self.due = {}
+        due = np.flatnonzero(crossing(self.rooms[:self.size], tick))
+        for room_id, house in zip(due.tolist(), self.rooms['house'][due].tolist()):
+            self.due.setdefault(house, []).append(room_id)
+        # in house order, the order the agents are woken up in is the input of the shuffle of the tick
+        for house in sorted(self.unlisted_houses.union(self.due)):
+            update = self.updates.get(house)
+            if update is not None and update.asleep:
+                update.wake()
+
+    def settle(self):
+        """
+        function to advance the rooms of the houses that did not act in the current tick,
+        called by the simulation once all agents acted (see add_clock)
+        """
+        if self.counters is not None:
+            self.count_down(np.flatnonzero(self.rooms['updated'][:self.size] != self.tick))
+        self.settled = True
+
+    def count_down(self, room_ids, handled=None):
+        """
+        function to check the rooms that are advanced to the current tick against the per-room counters
+        (DEBUG_ROOM_COUNTDOWNS): the counters of the occupied rooms count the contract days down, the ones of the free
+        rooms the application days, as the houses did in every tick, the derived countdowns have to match them
+        and only the handled room may cross a threshold (see crossing)
+        :param room_ids: array of the ids of the rooms that are advanced
+        :param handled: id of the room the house handles next, None if the rooms are advanced without their house
+        """
+        rooms = self.rooms[room_ids]
+        occupied = rooms['resident'] >= 0
+        self.counters[room_ids, occupied.astype(int)] -= 1
+        derived = np.where(occupied, rooms['contract_end'], rooms['application_end']) - self.tick
+        counted = self.counters[room_ids, occupied.astype(int)]
+        crossed = room_ids[crossing(rooms, self.tick)]
+        if not np.array_equal(derived, counted) or crossed.tolist() != ([] if handled is None else [handled]):
+            raise RuntimeError("countdowns of the rooms " + str(room_ids.tolist()) + " are " + str(derived.tolist()) +
+                               ", expected " + str(counted.tolist()) + ", crossing rooms " + str(crossed.tolist()) +
+                               ", handled room " + str(handled))
+
+    def clock(self, room_id):
+        """
+        function to get the tick the countdowns of a room are advanced to:
+        the current tick once its house handled the room (or all agents acted), the previous tick before
+        :param room_id: id of the room
+        :return: tick
+        """
+        if self.settled or self.rooms['updated'][room_id] == self.tick:
+            return self.tick
+        return self.tick - 1
+
+    def student_number(self, student_jid):
+        """
+        function to translate a student jid to the number stored in the resident column
+        :param student_jid: jid of the student or None
+        :return: student number, -1 for None
+        """
+        if student_jid is None:
+            return -1
+        if student_jid not in self.student_numbers:
+            self.student_numbers[student_jid] = len(self.student_jids)
+            self.student_jids.append(student_jid)
+        return self.student_numbers[student_jid]
+
+    def resident_jid(self, room_id):
+        number = self.rooms['resident'][room_id]
+        return None if number < 0 else self.student_jids[number]
+
+    def questionnaire(self, room_id):
+        """
+        function to build the questionnaire of the resident of a room
+        :param room_id: id of the room
+        :return: Questionnaire or None
+        """
+        row = self.questionnaires[room_id]
+        if not row['set']:
+            return None
+        return Questionnaire(personality_vector=tuple(row['personality_vector'].tolist()),
+                             international=bool(row['international']), is_female=bool(row['is_female']))
+
+    def set_questionnaire(self, room_id, questionnaire):
+        row = self.questionnaires[room_id:room_id + 1]
+        row['set'] = questionnaire is not None
+        if questionnaire is not None:
+            row['personality_vector'] = questionnaire['personality_vector']
+            row['international'] = questionnaire['international']
+            row['is_female'] = questionnaire['is_female']
+
+    def touch(self, room_id):
+        """
+        function to note a change of a room, a sleeping house that did not handle the room in the current tick yet
+        is woken up, so that it acts in the same tick (a change after its turn is found by the next advance)
+        :param room_id: id of the changed room
+        :return: house number
+        """
+        house = self.rooms['house'][room_id].item()
+        if self.touched.get(house, -1) < room_id:
+            self.touched[house] = room_id
+        update = self.updates.get(house)
+        if update is not None and update.asleep and not self.settled and self.rooms['updated'][room_id] != self.tick:
+            update.wake()
+        return house
+
+    def set_applicants(self, room_id, applicants):
+        self.applicants[room_id] = list(applicants)
+        self.rooms['applicants'][room_id] = len(applicants)
+        self.touch(room_id)
+
+    def add_applicant(self, room_id, applicant):
+        self.applicants[room_id].append(applicant)
+        self.rooms['applicants'][room_id] += 1
+        self.touch(room_id)
+
+    def due_rooms(self, house, room_ids):
+        """
+        function to advance the rooms of a house to the current tick in room order, and to hand out the rooms
+        that cross a threshold (see crossing), each one before the rooms after it are advanced:
+            the due rooms found at the start of the tick are used, unless the rooms of the house were changed since,
+            then the rooms from the first one that is not handled yet are searched again
+            (e.g. a handler cancelled the applications of a student)
+        :param house: house number
+        :param room_ids: range of room ids of the house
+        :return: generator of room ids, the caller handles every room before the next one
+        """
+        due = self.due.pop(house, [])
+        position = room_ids.start
+        while True:
+            if self.touched.pop(house, -1) >= position:
+                due = (np.flatnonzero(crossing(self.rooms[position:room_ids.stop], self.tick)) + position).tolist()
+            if not due:
+                break
+            room_id = due.pop(0)
+            if self.counters is not None:
+                self.count_down(np.arange(position, room_id + 1), room_id)
+            self.rooms['updated'][position:room_id + 1] = self.tick
+            position = room_id + 1
+            yield room_id
+        if self.counters is not None:
+            self.count_down(np.arange(position, room_ids.stop))
+        self.rooms['updated'][position:room_ids.stop] = self.tick
+
+    def unlisted_rooms(self, house, room_ids):
+        """
+        function to take the free rooms of a house that are neither listed nor in an application process,
+        houses are only searched if one of their rooms was freed, unlisted or its application ended since the
+        last call (the caller lists all returned rooms)
+        :param house: house number
+        :param room_ids: range of room ids of the house
+        :return: list of room ids
+        """
+        if house not in self.unlisted_houses:
+            return []
+        self.unlisted_houses.discard(house)
+        rooms = self.rooms[room_ids.start:room_ids.stop]
+        unlisted = ~rooms['listed'] & ~rooms['in_process'] & (rooms['resident'] < 0)
+        return (np.flatnonzero(unlisted) + room_ids.start).tolist()
+
+    def room_of_resident(self, room_ids, student_jid):
+        """
+        function to find the room of a resident within a house
+        :return: room id or None
+        """
+        number = self.student_numbers.get(student_jid, -1)
+        if number < 0:
+            return None
+        matches = np.flatnonzero(self.rooms['resident'][room_ids.start:room_ids.stop] == number)
+        return int(matches[-1]) + room_ids.start if len(matches) else None
+
+
+class RoomView(Mapping):
+    """
+    dict-like view of one row of the room table, with the keys of the former room dicts
+    """
+    __slots__ = ('table', 'room_id')
+
+    KEYS = ('id', 'resident_jid', 'questionnaire', 'listed', 'listing_time', 'application_in_process',
+            'housing_method', 'applicants', 'application_days_left', 'contract_days_left')
+    COLUMNS = {'listed': 'listed', 'application_in_process': 'in_process'}
+    # countdowns, stored as the tick they end
+    DEADLINES = {'application_days_left': 'application_end', 'contract_days_left': 'contract_end'}
+
+    def __init__(self, table, room_id):
+        self.table = table
+        self.room_id = room_id
+
+    def __getitem__(self, key):
+        if key in self.COLUMNS:
+            return self.table.rooms[self.COLUMNS[key]][self.room_id].item()
+        if key in self.DEADLINES:
+            return self.table.rooms[self.DEADLINES[key]][self.room_id].item() - self.table.clock(self.room_id)
+        if key == 'listing_time':
+            if not self.table.rooms['listed'][self.room_id]:
+                return 0
+            return self.table.clock(self.room_id) - self.table.rooms['listed_since'][self.room_id].item()
+        if key == 'id':
+            return self.room_id
+        if key == 'resident_jid':
+            return self.table.resident_jid(self.room_id)
+        if key == 'questionnaire':
+            return self.table.questionnaire(self.room_id)
+        if key == 'housing_method':
+            return HOUSING_METHODS[self.table.rooms['housing_method'][self.room_id]]
+        if key == 'applicants':
+            return tuple(self.table.applicants[self.room_id])
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        house = self.table.touch(self.room_id)
+        if (key in ('listed', 'application_in_process') and not value) or (key == 'resident_jid' and value is None):
+            self.table.unlisted_houses.add(house)
+        if key == 'listed' and value and not self.table.rooms['listed'][self.room_id]:
+            self.table.rooms['listed_since'][self.room_id] = self.table.clock(self.room_id)
+        if key in self.COLUMNS:
+            self.table.rooms[self.COLUMNS[key]][self.room_id] = value
+        elif key in self.DEADLINES:
+            self.table.rooms[self.DEADLINES[key]][self.room_id] = self.table.clock(self.room_id) + value
+            if self.table.counters is not None:
+                self.table.counters[self.room_id, int(key == 'contract_days_left')] = value
+        elif key == 'resident_jid':
+            self.table.rooms['resident'][self.room_id] = self.table.student_number(value)
+        elif key == 'questionnaire':
+            self.table.set_questionnaire(self.room_id, value)
+        elif key == 'applicants':
+            self.table.set_applicants(self.room_id, value)
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self.KEYS)
+
+    def __len__(self):
+        return len(self.KEYS)
+
+
+class RoomsView(Mapping):
+    """
+    dict-like view of the rooms of one house, room id -> RoomView
+    """
+    __slots__ = ('table', 'room_ids')
+
+    def __init__(self, table, room_ids):
+        self.table = table
+        self.room_ids = room_ids
+
+    def __getitem__(self, room_id):
+        if room_id not in self.room_ids:
+            raise KeyError(room_id)
+        return RoomView(self.table, room_id)
+
+    def __iter__(self):
+        return iter(self.room_ids)
+
+    def __len__(self):
+        return len(self.room_ids)
@@ -0,0 +1,425 @@
+import json
+import os
+import shutil
+import struct
+import zlib
+from bisect import bisect_right
+
+import numpy as np
+
+import src.utils.constants as const
+
+"""
+Binary trace of a simulation run, the recorded state of the students, rooms and houses per tick
+
+layout of a trace file:
+    MAGIC, length of the header (uint64), JSON header (counts of the groups, layout of the columns, run metadata)
+    chunks: chunk header (kind, tick, length of the body), body
+the first chunk holds the static columns (written once), every further chunk one recorded tick, either
+    a keyframe: the raw bytes of all columns in layout order
+    a delta to the previous recorded tick, zlib-compressed: per column the number of changed elements (uint32),
+    the gaps between their indices (uint32) and their new values (for integer columns the difference to the
+    previous value)
+for analysis, the ticks of a trace are expanded once into a directory of .npy files, that are memory-mapped
+as arrays indexed by (tick, element) (see MappedTrace)
+"""
+
+MAGIC = b"MASTRACE"
+VERSION = 3
+CHUNK_HEADER = struct.Struct('<4siQ')
+COUNT = struct.Struct('<I')
+STATIC = b"STAT"
+KEYFRAME = b"TICK"
+DELTA = b"DELT"
+
+# (group, name, dtype, shape per element), the groups are sized by the counts in the header
+STATIC_COLUMNS = (
+    ('students', 'personality', 'f8', (5,)),
+    ('students', 'international', '?', ()),
+    ('students', 'is_female', '?', ()),
+    ('houses', 'housing_method', 'i1', ()),
+    ('houses', 'attractiveness', 'f8', ()),
+    ('houses', 'accept_internationals', '?', ()),
+    ('rooms', 'house', 'i4', ()),
+)
+FRAME_COLUMNS = (
+    ('students', 'waiting_time', 'i4', ()),
+    ('students', 'started', '?', ()),
+    ('students', 'has_room', '?', ()),
+    ('students', 'total_waiting_time', 'i4', ()),
+    ('students', 'num_applications', 'i4', ()),
+    ('students', 'num_rooms_obtained', 'i4', ()),
+    # student index of the resident, -1 for a free room
+    ('rooms', 'resident', 'i4', ()),
+    ('rooms', 'listed', '?', ()),
+)
+
+
+def column_shapes(columns, counts):
+    """
+    function to compute the shape and dtype of every column of a chunk
+    :param columns: layout of the chunk (STATIC_COLUMNS or FRAME_COLUMNS)
+    :param counts: dict of group -> number of elements
+    :return: list of (name, dtype, shape)
+    """
+    return [(name, np.dtype(dtype), (counts[group],) + tuple(shape)) for group, name, dtype, shape in columns]
+
+
+def changed_elements(previous, current):
+    """
+    function to find the elements of a column that changed, nan is equal to nan
+    :param previous: column of the previous tick
+    :param current: column of the current tick
+    :return: uint32 array of the indices of the changed elements
+    """
+    same = previous == current
+    if current.dtype.kind == 'f':
+        same |= np.isnan(previous) & np.isnan(current)
+    if same.ndim > 1:
+        same = same.all(axis=tuple(range(1, same.ndim)))
+    return np.flatnonzero(~same).astype(np.uint32)
+
+
+class TraceWriter:
+    """
+    writes a trace through one buffered file handle, a chunk per recorded tick:
+    every keyframe_every-th recorded tick is a keyframe, the ticks in between only record the changed elements
+    """
+
+    def __init__(self, path, counts, static, meta=None, keyframe_every=None, buffering=1 << 20):
+        """
+        constructor for trace writers, writes the header and the static columns
+        :param path: path of the trace file
+        :param counts: dict with the number of students, houses and rooms
+        :param static: dict of the static columns (see STATIC_COLUMNS)
+        :param meta: JSON-encodable metadata of the run (config, seed, ...)
+        :param keyframe_every: number of recorded ticks per keyframe, defaults to const.TRACE_KEYFRAME_EVERY
+        :param buffering: size of the write buffer in bytes
+        """
+        self.keyframe_every = keyframe_every if keyframe_every is not None else const.TRACE_KEYFRAME_EVERY
+        self.path = path
+        self.buffering = buffering
+        self.frames = 0
+        self.previous = None
+        self.counts = dict(counts)
+        self.static_shapes = column_shapes(STATIC_COLUMNS, self.counts)
+        self.frame_shapes = column_shapes(FRAME_COLUMNS, self.counts)
+        self.file = open(path, 'wb', buffering=buffering)
+        header = json.dumps({'version': VERSION, 'counts': self.counts,
+                             'static': STATIC_COLUMNS, 'frame': FRAME_COLUMNS, 'meta': meta}).encode()
+        self.file.write(MAGIC + struct.pack('<Q', len(header)) + header)
+        self.write_chunk(STATIC, -1, self.static_shapes, static)
+
+    @staticmethod
+    def as_columns(shapes, columns):
+        """
+        function to convert and check the columns of a chunk
+        :param shapes: list of (name, dtype, shape) of the columns
+        :param columns: dict of name -> array-like
+        :return: dict of name -> contiguous array
+        """
+        arrays = {}
+        for name, dtype, shape in shapes:
+            column = np.ascontiguousarray(columns[name], dtype=dtype)
+            if column.shape != shape:
+                raise ValueError("column '" + name + "' has the shape " + str(column.shape) + ", expected " +
+                                 str(shape))
+            arrays[name] = column
+        return arrays
+
+    def write_body(self, kind, tick, body):
+        self.file.write(CHUNK_HEADER.pack(kind, tick, sum(len(data) for data in body)))
+        for data in body:
+            self.file.write(data)
+
+    def write_chunk(self, kind, tick, shapes, columns):
+        """
+        function to write a chunk with all columns
+        :param kind: chunk kind (STATIC or KEYFRAME)
+        :param tick: tick of the chunk, -1 for the static chunk
+        :param shapes: list of (name, dtype, shape) of the columns
+        :param columns: dict of name -> array-like
+        """
+        columns = self.as_columns(shapes, columns)
+        self.write_body(kind, tick, [columns[name].tobytes() for name, _, _ in shapes])
+        return columns
+
+    def write_tick(self, tick, columns):
+        """
+        function to write the columns of one tick, as a keyframe or as the changes to the previous recorded tick
+        :param tick: recorded tick
+        :param columns: dict of the frame columns (see FRAME_COLUMNS)
+        """
+        if self.previous is None or self.frames % self.keyframe_every == 0:
+            self.previous = self.write_chunk(KEYFRAME, tick, self.frame_shapes, columns)
+        else:
+            columns = self.as_columns(self.frame_shapes, columns)
+            body = []
+            for name, _, _ in self.frame_shapes:
+                previous, current = self.previous[name], columns[name]
+                changed = changed_elements(previous, current)
+                values = current[changed]
+                if values.dtype.kind in 'iu':
+                    # small differences (waiting times grow by one) compress better than the values
+                    values = values - previous[changed]
+                gaps = np.diff(changed, prepend=0).astype(np.uint32)
+                body += [COUNT.pack(len(changed)), gaps.tobytes(), values.tobytes()]
+            self.write_body(DELTA, tick, [zlib.compress(b"".join(body), 1)])
+            self.previous = columns
+        self.frames += 1
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+    def __getstate__(self):
+        """
+        an open trace is checkpointed (see utils/checkpoint.py) with the length of the written chunks,
+        when the checkpoint is restored, the trace is reopened and the chunks written after it are cut off
+        """
+        state = dict(self.__dict__)
+        state['file'] = None
+        state['position'] = None
+        if self.file is not None and not self.file.closed:
+            self.file.flush()
+            state['position'] = self.file.tell()
+        return state
+
+    def __setstate__(self, state):
+        position = state.pop('position')
+        self.__dict__.update(state)
+        if position is not None:
+            self.file = open(self.path, 'r+b', buffering=self.buffering)
+            self.file.truncate(position)
+            self.file.seek(position)
+
+
+class TraceReader:
+    """
+    reads a trace, the chunks are indexed by tick when the trace is opened, so single ticks can be loaded:
+    a tick is reconstructed from the nearest keyframe before it and the deltas in between,
+    the last reconstructed tick is kept, so reading the ticks in order only applies every delta once
+    a trace of a run that stopped early ends with the last complete chunk
+    """
+
+    def __init__(self, path):
+        """
+        constructor for trace readers
+        :param path: path of the trace file
+        """
+        self.path = path
+        self.file = open(path, 'rb')
+        if self.file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(path + " is not a simulation trace")
+        length, = struct.unpack('<Q', self.file.read(8))
+        header = json.loads(self.file.read(length))
+        if header['version'] != VERSION:
+            raise ValueError(path + " has the trace version " + str(header['version']) + ", expected " +
+                             str(VERSION))
+        self.counts = header['counts']
+        self.meta = header['meta']
+        self.static_shapes = column_shapes(header['static'], self.counts)
+        self.frame_shapes = column_shapes(header['frame'], self.counts)
+
+        # recorded chunks in file order: ticks, kinds, offsets of the bodies and sizes
+        self.chunk_ticks = []
+        self.kinds = []
+        self.offsets = []
+        self.sizes = []
+        # tick -> position in the chunk lists, positions of the keyframes
+        self.positions = {}
+        self.keyframes = []
+        static_offset = None
+        self.file.seek(0, 2)
+        end = self.file.tell()
+        offset = len(MAGIC) + 8 + length
+        while offset + CHUNK_HEADER.size <= end:
+            self.file.seek(offset)
+            kind, tick, size = CHUNK_HEADER.unpack(self.file.read(CHUNK_HEADER.size))
+            body = offset + CHUNK_HEADER.size
+            if body + size > end:
+                break
+            if kind == STATIC:
+                static_offset = body
+            elif kind in (KEYFRAME, DELTA) and (kind == KEYFRAME or self.keyframes):
+                if kind == KEYFRAME:
+                    self.keyframes.append(len(self.chunk_ticks))
+                self.positions[tick] = len(self.chunk_ticks)
+                self.chunk_ticks.append(tick)
+                self.kinds.append(kind)
+                self.offsets.append(body)
+                self.sizes.append(size)
+            offset = body + size
+        if static_offset is None:
+            raise ValueError(path + " has no static columns")
+        self.static = self.read_chunk(static_offset, self.static_shapes)
+        # position and columns of the last reconstructed tick
+        self.cached_position = None
+        self.cached = None
+
+    @property
+    def ticks(self):
+        """
+        recorded ticks, in the order they were written
+        """
+        return list(self.chunk_ticks)
+
+    def read_chunk(self, offset, shapes):
+        """
+        function to read the columns of one chunk
+        :param offset: file offset of the body
+        :param shapes: list of (name, dtype, shape) of the columns
+        :return: dict of name -> array
+        """
+        size = sum(dtype.itemsize * int(np.prod(shape)) for name, dtype, shape in shapes)
+        self.file.seek(offset)
+        data = self.file.read(size)
+        columns = {}
+        start = 0
+        for name, dtype, shape in shapes:
+            stop = start + dtype.itemsize * int(np.prod(shape))
+            columns[name] = np.frombuffer(data, dtype=dtype, count=int(np.prod(shape)), offset=start).reshape(shape)
+            start = stop
+        return columns
+
+    def apply_delta(self, position, columns):
+        """
+        function to apply the delta of a chunk to the columns of the previous recorded tick (in place)
+        :param position: position of the delta chunk
+        :param columns: dict of the writable frame columns
+        """
+        self.file.seek(self.offsets[position])
+        data = zlib.decompress(self.file.read(self.sizes[position]))
+        start = 0
+        for name, dtype, shape in self.frame_shapes:
+            count, = COUNT.unpack_from(data, start)
+            start += COUNT.size
+            gaps = np.frombuffer(data, dtype=np.uint32, count=count, offset=start)
+            start += gaps.nbytes
+            values = np.frombuffer(data, dtype=dtype, count=count * int(np.prod(shape[1:])), offset=start)
+            start += values.nbytes
+            indices = np.cumsum(gaps, dtype=np.int64)
+            if dtype.kind in 'iu':
+                columns[name][indices] += values
+            else:
+                columns[name][indices] = values.reshape((count,) + shape[1:])
+
+    def read_tick(self, tick):
+        """
+        function to load the recorded state of one tick
+        :param tick: recorded tick
+        :return: dict of the frame columns (see FRAME_COLUMNS)
+        """
+        if tick not in self.positions:
+            raise KeyError("tick " + str(tick) + " is not recorded in " + self.path)
+        position = self.positions[tick]
+        keyframe = self.keyframes[bisect_right(self.keyframes, position) - 1]
+
+        if self.cached_position is not None and keyframe <= self.cached_position <= position:
+            start = self.cached_position
+        else:
+            start = keyframe
+            self.cached = {name: column.copy() for name, column in
+                           self.read_chunk(self.offsets[keyframe], self.frame_shapes).items()}
+        for delta in range(start + 1, position + 1):
+            self.apply_delta(delta, self.cached)
+        self.cached_position = position
+        return {name: column.copy() for name, column in self.cached.items()}
+
+    def matching_scores(self, columns):
+        """
+        function to get the matching score of every house in a tick, computed from the residents
+        (see const.calculate_house_matching_scores)
+        :param columns: dict of the frame columns of the tick
+        :return: float array, nan for houses with less than two residents
+        """
+        return const.calculate_house_matching_scores(self.static['personality'], self.static['house'],
+                                                     columns['resident'], self.counts['houses'])
+
+    def __iter__(self):
+        """
+        iterates over (tick, columns) of all recorded ticks
+        """
+        for tick in self.chunk_ticks:
+            yield tick, self.read_tick(tick)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class MappedTrace:
+    """
+    memory-maps the recorded ticks of a trace as arrays indexed by (tick, element),
+    e.g. columns['has_room'][t, s] or columns['matching_score'][t, h]:
+    the trace is expanded once, tick by tick, into a .npy file per column in a directory next to it
+    (<path>.columns), which is rebuilt if the trace is newer, so only the accessed rows are loaded
+    the matching scores of the houses are computed when the trace is expanded
+    """
+
+    def __init__(self, path, directory=None):
+        """
+        constructor for mapped traces, expands the trace if it was not expanded yet
+        :param path: path of the trace file
+        :param directory: directory of the expanded columns, defaults to <path>.columns
+        """
+        self.path = path
+        self.directory = directory if directory is not None else path + ".columns"
+        if not self.is_current():
+            self.expand()
+        with TraceReader(path) as trace:
+            self.counts = trace.counts
+            self.meta = trace.meta
+            self.static = trace.static
+        self.ticks = np.load(os.path.join(self.directory, "ticks.npy"))
+        self.columns = {}
+        for file in sorted(os.listdir(self.directory)):
+            if file.endswith(".npy") and file != "ticks.npy":
+                self.columns[file[:-len(".npy")]] = np.load(os.path.join(self.directory, file), mmap_mode='r')
+
+    def is_current(self):
+        ticks = os.path.join(self.directory, "ticks.npy")
+        return os.path.exists(ticks) and os.path.getmtime(ticks) >= os.path.getmtime(self.path)
+
+    def expand(self):
+        """
+        function to write the columns of all recorded ticks, a row per tick, through a temporary directory,
+        so that an interrupted expansion leaves no incomplete columns behind
+        """
+        temporary = self.directory + ".tmp-" + str(os.getpid())
+        os.makedirs(temporary, exist_ok=True)
+        with TraceReader(self.path) as trace:
+            ticks = trace.ticks
+            shapes = list(trace.frame_shapes) + [('matching_score', np.dtype('f8'), (trace.counts['houses'],))]
+            files = {}
+            for name, dtype, shape in shapes:
+                files[name] = open(os.path.join(temporary, name + ".npy"), 'wb', buffering=1 << 20)
+                np.lib.format.write_array_header_1_0(files[name], {
+                    'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False,
+                    'shape': (len(ticks),) + shape})
+            for tick, columns in trace:
+                columns['matching_score'] = trace.matching_scores(columns)
+                for name, dtype, _ in shapes:
+                    files[name].write(np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+            for file in files.values():
+                file.close()
+            np.save(os.path.join(temporary, "ticks.npy"), np.array(ticks, dtype=np.int64))
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
+        os.replace(temporary, self.directory)
+
+    def tick_index(self, tick):
+        """
+        function to get the row of a recorded tick in the columns
+        :param tick: recorded tick
+        :return: row index
+        """
+        index = int(np.searchsorted(self.ticks, tick))
+        if index == len(self.ticks) or self.ticks[index] != tick:
+            raise KeyError("tick " + str(tick) + " is not recorded in " + self.path)
+        return index